@@ -5,6 +5,7 @@ import json
 import time
 import shutil
 import db_manager
+import endpoints
 import struct
 import hashlib
 import hmac
@@ -192,16 +193,33 @@ class chat_client:
 
 
     def read_response(self, socket):
-        """Read a possibly segmented response from a socket until end marker or short chunk."""
-        response = ''
-        address = None
+        """Read one response datagram; UDP keeps message boundaries, so one read is one reply."""
+        part, address = socket.recvfrom(65535)
+        return part.decode(errors="replace"), address
 
-        while True:
-            part, address = socket.recvfrom(8192)
-            response += part.decode()
-            if response.endswith('\r\n') or len(part) < 8192:
+    def fetch_snapshot(self, max_pages=1000):
+        """Collect every SNAPSHOT page by following the server's `next` cursor.
+
+        Returns an `OK <json>` string shaped like a single-page reply, or the
+        first non-OK response.
+        """
+        merged = {"owned": [], "replicas": []}
+        cursor = None
+        for _ in range(max_pages):
+            response = self.send_command(f"SNAPSHOT {cursor}" if cursor else "SNAPSHOT")
+            if not response.startswith("OK "):
+                return response
+            try:
+                page = json.loads(response[3:])
+            except json.JSONDecodeError:
+                return response
+            merged["owned"].extend(page.get("owned", []))
+            merged["replicas"].extend(page.get("replicas", []))
+            cursor = page.get("next")
+            if not cursor:
                 break
-        return response, address
+        merged["next"] = cursor
+        return "OK " + json.dumps(merged, sort_keys=True, separators=(",", ":"))
 
     def send_command(self, command, operation_id=None) -> str:
         """Send a command to the configured server and return its response string.
@@ -741,17 +759,27 @@ class chat_client:
         return self.register_user(username, password)
 
     def discover_servers(self):
-        """Discover servers on the local network using UDP broadcast."""
+        """Discover servers with a UDP broadcast plus FLOCK_SEEDS; return `(name, endpoint)` tuples."""
         self.client_socket.settimeout(3)
         servers = []
-        broadcast_address = ("<broadcast>", 12345)
+        broadcast_address = ("<broadcast>", endpoints.DEFAULT_PORT)
         self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        seeds = [seed.strip() for seed in os.environ.get("FLOCK_SEEDS", "").split(",") if seed.strip()]
         try:
             self.client_socket.sendto("DISCOVER".encode(), broadcast_address)
+            for seed in seeds:
+                try:
+                    self.client_socket.sendto("DISCOVER".encode(), endpoints.command_address(seed))
+                except ValueError:
+                    logger.warning("Ignoring invalid seed endpoint %s", seed)
             while True:
                 data, address = self.client_socket.recvfrom(1024)
-                server_name = data.decode()
-                servers.append((server_name, address[0]))
+                # `<name> <endpoint>`; older servers answer with the bare name.
+                server_name, _, endpoint = data.decode().partition(" ")
+                if not endpoint:
+                    endpoint = endpoints.format_endpoint(*address)
+                if endpoint not in (server[1] for server in servers):
+                    servers.append((server_name, endpoint))
         except socket.timeout:
             pass
 
@@ -760,9 +788,9 @@ class chat_client:
         return servers
 
     def connect_to_server(self, server):
-        """Set the active server address from a `(name, ip)` tuple."""
+        """Set the active server address from a `(name, endpoint)` tuple; a bare ip means the default port."""
         try:
-            self.server_address = (server[1], 12345)
+            self.server_address = endpoints.command_address(server[1])
             self.server_name = server[0]
             logger.info("Connected to server '%s' at %s", self.server_name, self.server_address)
         except Exception as e:
@@ -1051,7 +1079,7 @@ class chat_client:
         if target_ip:
             try:
                 with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                    sock.connect((target_ip, 12345))
+                    sock.connect((target_ip, endpoints.DEFAULT_PORT))
                     candidate = sock.getsockname()[0]
                     if self._valid_ipv4(candidate) and (
                         not self._is_loopback_ip(candidate) or self._is_loopback_ip(target_ip)
@@ -1091,9 +1119,9 @@ class chat_client:
 
 
     def discover_servers_multicast(self, timeout: int = 3) -> list:
-        """Discover servers using multicast; return list of (name, ip) tuples."""
+        """Discover servers using multicast; return list of (name, endpoint) tuples."""
         MCAST_GRP = "224.0.0.1"
-        MCAST_PORT = 10003
+        MCAST_PORT = endpoints.configured_mcast_port()
         MESSAGE = "DISCOVER_SERVER"
         BUFFER_SIZE = 1024
 
@@ -1119,9 +1147,9 @@ class chat_client:
         while True:
             try:
                 data, addr = sock.recvfrom(BUFFER_SIZE)
-                server_ip = data.decode().strip()
-                servers.append(server_ip)
-                logger.info("Multicast discovery received server %s from %s", server_ip, addr)
+                server_endpoint = endpoints.normalize_endpoint(data.decode())
+                servers.append(server_endpoint)
+                logger.info("Multicast discovery received server %s from %s", server_endpoint, addr)
             except socket.timeout:
                 break
             except Exception as e:
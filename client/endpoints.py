@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from shared_endpoints import (
+    DEFAULT_MCAST_PORT,
+    DEFAULT_PORT,
+    HEALTH_PORT_OFFSET,
+    command_address,
+    configured_bind_address,
+    configured_mcast_port,
+    configured_port,
+    endpoint_of_health,
+    format_endpoint,
+    health_address,
+    host_of,
+    normalize_endpoint,
+    parse_endpoint,
+)
+
+
+__all__ = [
+    "DEFAULT_MCAST_PORT",
+    "DEFAULT_PORT",
+    "HEALTH_PORT_OFFSET",
+    "command_address",
+    "configured_bind_address",
+    "configured_mcast_port",
+    "configured_port",
+    "endpoint_of_health",
+    "format_endpoint",
+    "health_address",
+    "host_of",
+    "normalize_endpoint",
+    "parse_endpoint",
+]
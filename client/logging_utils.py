@@ -6,7 +6,23 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from shared_logging_utils import configure_logger, log_event, sanitize, summarize_command
+from shared_logging_utils import (
+    configure_logger,
+    flush_logger,
+    log_enabled,
+    log_event,
+    logging_stats,
+    sanitize,
+    summarize_command,
+)
 
 
-__all__ = ["configure_logger", "log_event", "sanitize", "summarize_command"]
+__all__ = [
+    "configure_logger",
+    "flush_logger",
+    "log_enabled",
+    "log_event",
+    "logging_stats",
+    "sanitize",
+    "summarize_command",
+]
@@ -1,3 +1,4 @@
+import functools
 import importlib.util
 import json
 import os
@@ -24,13 +25,16 @@ except ImportError:
     client = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(client)
 
+import endpoints
 from logging_utils import configure_logger, log_event
+from profiling import PROFILE_MODES, ProfileError, Profiler
 
 
 AUTH_DIR = CLIENT_DIR / "auth"
 SESSION_SECRET_PATH = AUTH_DIR / "flask_session.key"
-ADMIN_COMMANDS = {"STATUS", "SNAPSHOT", "CHECKSUM"}
+ADMIN_COMMANDS = {"STATUS", "SNAPSHOT", "CHECKSUM", "METRICS"}
 MAX_EVENTS_PER_SESSION = 40
+HOT_HANDLER_ROWS = 10
 
 
 def load_secret_key():
@@ -68,6 +72,43 @@ logger = configure_logger("flock.ui", "client.log")
 chat_clients = {}
 recent_ui_events = {}
 clients_lock = RLock()
+# Socket.IO event -> [calls, total seconds, max seconds] since the UI started.
+handler_timings = {}
+profiler = Profiler("client")
+
+
+def on_event(event):
+    """`socketio.on` that times the handler and runs it under an active cprofile session."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return profiler.call(handler, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with clients_lock:
+                    timing = handler_timings.setdefault(event, [0, 0.0, 0.0])
+                    timing[0] += 1
+                    timing[1] += elapsed
+                    timing[2] = max(timing[2], elapsed)
+        return socketio.on(event)(timed)
+    return decorator
+
+
+def hot_handlers(limit=HOT_HANDLER_ROWS):
+    with clients_lock:
+        ranked = sorted(handler_timings.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+    return [
+        {
+            "event": event,
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total / calls * 1000, 3),
+            "max_ms": round(longest * 1000, 3),
+        }
+        for event, (calls, total, longest) in ranked
+    ]
 
 
 @app.before_request
@@ -209,6 +250,7 @@ def template_context(chat, authenticated=None):
 def build_client_diagnostics(chat):
     server_ip = chat.server_address[0] if chat.server_address else None
     server_port = chat.server_address[1] if chat.server_address else None
+    server_endpoint = endpoints.format_endpoint(*chat.server_address) if chat.server_address else None
     pending_summary = []
     pending_total = 0
     chat_count = 0
@@ -244,6 +286,7 @@ def build_client_diagnostics(chat):
             "name": chat.server_name,
             "ip": server_ip,
             "port": server_port,
+            "endpoint": server_endpoint,
             "down": chat.server_down,
         },
         "client": {
@@ -261,6 +304,8 @@ def build_client_diagnostics(chat):
         },
         "network": network,
         "events": recent_ui_events.get(client_id, [])[:10],
+        "profiling": profiler.status(),
+        "hot_handlers": hot_handlers(),
     }
 
 
@@ -405,7 +450,7 @@ def handle_socket_connect():
         join_room(client_id)
 
 
-@socketio.on("discover_servers")
+@on_event("discover_servers")
 def handle_discover(data):
     ensure_csrf_token()
     if not validate_csrf(data):
@@ -416,7 +461,7 @@ def handle_discover(data):
     emit("servers_found", [{"name": s[0], "ip": s[1]} for s in found])
 
 
-@socketio.on("connect_server")
+@on_event("connect_server")
 def handle_connect(data):
     ensure_csrf_token()
     if not validate_csrf(data):
@@ -430,7 +475,7 @@ def handle_connect(data):
     emit("server_connected", {"name": data["name"]})
 
 
-@socketio.on("load_chats")
+@on_event("load_chats")
 def handle_load_chats(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -450,7 +495,7 @@ def handle_load_chats(data):
     emit("chats_loaded", result)
 
 
-@socketio.on("load_chat_history")
+@on_event("load_chat_history")
 def handle_load_history(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -468,7 +513,7 @@ def handle_load_history(data):
     emit("chat_history", result)
 
 
-@socketio.on("send_message")
+@on_event("send_message")
 def handle_send(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -496,7 +541,7 @@ def handle_send(data):
     emit("delivery_diagnostics", build_client_diagnostics(chat))
 
 
-@socketio.on("mark_seen")
+@on_event("mark_seen")
 def handle_mark_seen(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -506,7 +551,7 @@ def handle_mark_seen(data):
         chat.db.set_messages_as_seen(chat.username, contact)
 
 
-@socketio.on("load_diagnostics")
+@on_event("load_diagnostics")
 def handle_load_diagnostics(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -514,7 +559,7 @@ def handle_load_diagnostics(data):
     emit("diagnostics_loaded", build_client_diagnostics(chat))
 
 
-@socketio.on("check_server")
+@on_event("check_server")
 def handle_check_server(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -535,7 +580,7 @@ def handle_check_server(data):
     emit("diagnostics_loaded", build_client_diagnostics(chat))
 
 
-@socketio.on("admin_command")
+@on_event("admin_command")
 def handle_admin_command(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -544,7 +589,7 @@ def handle_admin_command(data):
     if command not in ADMIN_COMMANDS:
         emit("request_error", {"error": "Unsupported admin command."})
         return
-    response = chat.send_command(command)
+    response = chat.fetch_snapshot() if command == "SNAPSHOT" else chat.send_command(command)
     ok, payload = parse_admin_response(response)
     record_ui_event(
         get_client_id(),
@@ -556,7 +601,52 @@ def handle_admin_command(data):
     emit("diagnostics_loaded", build_client_diagnostics(chat))
 
 
-@socketio.on("retry_pending")
+@on_event("profile_command")
+def handle_profile_command(data):
+    chat = require_authenticated_socket(data)
+    if not chat:
+        return
+    target = str(data.get("target", "server")).strip().lower()
+    action = str(data.get("action", "status")).strip().lower()
+    mode = str(data.get("mode", "sample")).strip().lower()
+    if target not in ("server", "client") or action not in ("start", "stop", "status") or mode not in PROFILE_MODES:
+        emit("request_error", {"error": "Unsupported profiling request."})
+        return
+    try:
+        seconds = float(data.get("seconds", 30))
+    except (TypeError, ValueError):
+        emit("request_error", {"error": "Invalid profiling duration."})
+        return
+
+    if target == "server":
+        command = f"PROFILE START {seconds:g} {mode}" if action == "start" else f"PROFILE {action.upper()}"
+        ok, payload = parse_admin_response(chat.send_command(command))
+    else:
+        try:
+            if action == "start":
+                payload = profiler.start(seconds, mode)
+            elif action == "stop":
+                payload = profiler.stop()
+            else:
+                payload = profiler.status()
+            ok = True
+        except ProfileError as e:
+            ok, payload = False, {"error": str(e)}
+        if ok:
+            payload["hot_handlers"] = hot_handlers()
+    record_ui_event(
+        get_client_id(),
+        "profile_command",
+        f"Perfilado {target} {action}: {'OK' if ok else 'ERROR'}",
+        target=target,
+        action=action,
+        mode=mode,
+    )
+    emit("profile_result", {"target": target, "action": action, "ok": ok, "payload": payload})
+    emit("diagnostics_loaded", build_client_diagnostics(chat))
+
+
+@on_event("retry_pending")
 def handle_retry_pending(data):
     chat = require_authenticated_socket(data)
     if not chat:
@@ -8,15 +8,19 @@ import socket
 import subprocess
 import sys
 import time
+from pathlib import Path
 
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import shared_endpoints as endpoints  # noqa: E402
+
 
 IMAGE = "flock:acceptance"
 NETWORK = "flock-acceptance-net"
-SERVER_PORT = 12345
-PING_PORT = 12346
+SERVER_PORT = endpoints.configured_port()
 CONTAINERS = ["flock-acc-node1", "flock-acc-node2", "flock-acc-node3", "flock-acc-node4"]
 DOCKER_CMD = shlex.split(os.environ.get("FLOCK_DOCKER_CMD", "docker"))
 
@@ -57,19 +61,19 @@ def container_ip(name):
     )
 
 
-def udp_command(ip, command, timeout=3.0):
+def udp_command(endpoint, command, timeout=3.0):
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
         sock.settimeout(timeout)
-        sock.sendto(command.encode(), (ip, SERVER_PORT))
+        sock.sendto(command.encode(), endpoints.command_address(endpoint))
         data, _ = sock.recvfrom(65535)
         return data.decode()
 
 
-def ping(ip, timeout=1.0):
+def ping(endpoint, timeout=1.0):
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
         sock.settimeout(timeout)
         try:
-            sock.sendto(b"PING", (ip, PING_PORT))
+            sock.sendto(b"PING", endpoints.health_address(endpoint))
             data, _ = sock.recvfrom(1024)
             return data.decode() == "PONG"
         except Exception:
@@ -80,24 +84,37 @@ def wait_for_server(name, timeout=20):
     deadline = time.time() + timeout
     while time.time() < deadline:
         ip = container_ip(name)
-        if ip and ping(ip):
-            return ip
+        endpoint = endpoints.format_endpoint(ip, SERVER_PORT) if ip else ""
+        if endpoint and ping(endpoint):
+            return endpoint
         time.sleep(0.5)
     raise TimeoutError(f"{name} did not become ready")
 
 
-def wait_for_admin(ip, command, timeout=20):
+def wait_for_admin(endpoint, command, timeout=20):
     deadline = time.time() + timeout
     last_error = None
     while time.time() < deadline:
         try:
-            response = udp_command(ip, command)
+            response = udp_command(endpoint, command)
             if response.startswith("OK "):
                 return json.loads(response[3:])
         except Exception as exc:
             last_error = exc
         time.sleep(0.5)
-    raise TimeoutError(f"{command} did not succeed on {ip}: {last_error}")
+    raise TimeoutError(f"{command} did not succeed on {endpoint}: {last_error}")
+
+
+def wait_for_snapshot(endpoint, timeout=20):
+    """Follow SNAPSHOT `next` cursors until every page has been collected."""
+    snapshot = {"owned": [], "replicas": []}
+    page = wait_for_admin(endpoint, "SNAPSHOT", timeout)
+    while True:
+        snapshot["owned"].extend(page["owned"])
+        snapshot["replicas"].extend(page["replicas"])
+        if not page.get("next"):
+            return snapshot
+        page = wait_for_admin(endpoint, f"SNAPSHOT {page['next']}", timeout)
 
 
 def start_server(container_name, node_name):
@@ -110,6 +127,8 @@ def start_server(container_name, node_name):
             "--network",
             NETWORK,
             "-e",
+            f"FLOCK_PORT={SERVER_PORT}",
+            "-e",
             "FLOCK_FAIL_TOLERANCE=3",
             IMAGE,
             "python",
@@ -143,18 +162,18 @@ def sign_registration(private_key, username, ip, port, version, public_key_b64):
     return base64.b64encode(signature).decode()
 
 
-def register_user(server_ip, username, message_ip, message_port, version):
+def register_user(server_endpoint, username, message_ip, message_port, version):
     private_key, public_key_b64 = make_identity()
     signature = sign_registration(private_key, username, message_ip, message_port, version, public_key_b64)
     command = f"REGISTER {username} {message_ip} {message_port} {version} {public_key_b64} {signature}"
-    response = udp_command(server_ip, command)
+    response = udp_command(server_endpoint, command)
     if not response.startswith("OK "):
         raise RuntimeError(f"REGISTER {username} failed: {response}")
     return {"username": username, "ip": message_ip, "port": message_port, "public_key": public_key_b64, "version": version}
 
 
-def resolve_user(server_ip, username):
-    return udp_command(server_ip, f"RESOLVE {username}")
+def resolve_user(server_endpoint, username):
+    return udp_command(server_endpoint, f"RESOLVE {username}")
 
 
 def main():
@@ -175,22 +194,22 @@ def main():
         run(docker_args("network", "create", NETWORK), capture=True)
 
         print("Starting initial 3 servers...")
-        node1_ip = start_server("flock-acc-node1", "node1")
-        node2_ip = start_server("flock-acc-node2", "node2")
-        node3_ip = start_server("flock-acc-node3", "node3")
+        node1_endpoint = start_server("flock-acc-node1", "node1")
+        node2_endpoint = start_server("flock-acc-node2", "node2")
+        node3_endpoint = start_server("flock-acc-node3", "node3")
         time.sleep(8)
 
         users = [
-            register_user(node1_ip, "alice_acc", "10.10.0.1", 5001, time.time_ns()),
-            register_user(node2_ip, "bob_acc", "10.10.0.2", 5002, time.time_ns()),
-            register_user(node3_ip, "carol_acc", "10.10.0.3", 5003, time.time_ns()),
+            register_user(node1_endpoint, "alice_acc", "10.10.0.1", 5001, time.time_ns()),
+            register_user(node2_endpoint, "bob_acc", "10.10.0.2", 5002, time.time_ns()),
+            register_user(node3_endpoint, "carol_acc", "10.10.0.3", 5003, time.time_ns()),
         ]
         time.sleep(8)
 
         initial = {
-            "node1": {"snapshot": wait_for_admin(node1_ip, "SNAPSHOT"), "checksum": wait_for_admin(node1_ip, "CHECKSUM")},
-            "node2": {"snapshot": wait_for_admin(node2_ip, "SNAPSHOT"), "checksum": wait_for_admin(node2_ip, "CHECKSUM")},
-            "node3": {"snapshot": wait_for_admin(node3_ip, "SNAPSHOT"), "checksum": wait_for_admin(node3_ip, "CHECKSUM")},
+            "node1": {"snapshot": wait_for_snapshot(node1_endpoint), "checksum": wait_for_admin(node1_endpoint, "CHECKSUM")},
+            "node2": {"snapshot": wait_for_snapshot(node2_endpoint), "checksum": wait_for_admin(node2_endpoint, "CHECKSUM")},
+            "node3": {"snapshot": wait_for_snapshot(node3_endpoint), "checksum": wait_for_admin(node3_endpoint, "CHECKSUM")},
         }
 
         print("Stopping 2 servers...")
@@ -198,16 +217,16 @@ def main():
         time.sleep(8)
 
         print("Starting replacement server...")
-        node4_ip = start_server("flock-acc-node4", "node4")
+        node4_endpoint = start_server("flock-acc-node4", "node4")
         time.sleep(10)
 
         print("Stopping remaining original server...")
         run(docker_args("stop", "flock-acc-node1"), capture=True)
         time.sleep(8)
 
-        final_snapshot = wait_for_admin(node4_ip, "SNAPSHOT")
-        final_checksum = wait_for_admin(node4_ip, "CHECKSUM")
-        resolved = {user["username"]: resolve_user(node4_ip, user["username"]) for user in users}
+        final_snapshot = wait_for_snapshot(node4_endpoint)
+        final_checksum = wait_for_admin(node4_endpoint, "CHECKSUM")
+        resolved = {user["username"]: resolve_user(node4_endpoint, user["username"]) for user in users}
         missing = {name: response for name, response in resolved.items() if not response.startswith("OK ")}
 
         report = {
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Microbenchmark del coste por operacion de `server_db` (conexion por llamada vs. pool)."""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+
+def load_db_module():
+    sys.path.insert(0, str(ROOT_DIR / "server"))
+    module_path = ROOT_DIR / "server" / "db_manager.py"
+    spec = importlib.util.spec_from_file_location("flock_server_db_manager", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+db_module = load_db_module()
+
+
+class PerCallConnectionDb(db_module.server_db):
+    """Comportamiento anterior: nueva conexion y PRAGMA WAL en cada operacion, sin cache en memoria."""
+
+    def __init__(self):
+        super().__init__(record_cache_size=0)
+
+    def _connect(self):
+        if not self.db_route:
+            raise RuntimeError("Server database is not initialized")
+        conn = sqlite3.connect(self.db_route, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+
+def timed(operation, iterations: int) -> float:
+    started = time.perf_counter()
+    for index in range(iterations):
+        operation(index)
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def run_case(database, directory: Path, name: str, iterations: int) -> dict[str, float]:
+    database.db_directory = str(directory)
+    database.set_db(name)
+    usernames = [f"user_{index:06d}" for index in range(iterations)]
+    results = {
+        "upsert_user": timed(
+            lambda i: database.upsert_user(usernames[i], "10.0.0.1", 5000, public_key="pub", version=1),
+            iterations,
+        ),
+        "resolve_user": timed(lambda i: database.resolve_user(usernames[i]), iterations),
+        "upsert_replic_user": timed(
+            lambda i: database.upsert_replic_user(usernames[i], "10.0.0.1", 5000, public_key="pub", version=1, owner="node-a"),
+            iterations,
+        ),
+        "get_user_record": timed(lambda i: database.get_user_record(usernames[i]), iterations),
+    }
+    if hasattr(database, "close"):
+        database.close()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de server_db por operacion.")
+    parser.add_argument("--iteraciones", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados como JSON.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="flock-bench-") as tmp:
+        directory = Path(tmp)
+        before = run_case(PerCallConnectionDb(), directory, "antes", args.iteraciones)
+        after = run_case(db_module.server_db(), directory, "despues", args.iteraciones)
+
+    if args.json:
+        print(json.dumps({"before_us": before, "after_us": after}, indent=2, sort_keys=True))
+        return 0
+
+    print(f"[flock] {args.iteraciones} operaciones por caso (microsegundos por operacion)")
+    print(f"{'operacion':<20} {'antes':>10} {'despues':>10} {'mejora':>8}")
+    for operation in before:
+        speedup = before[operation] / after[operation] if after[operation] else float("inf")
+        print(f"{operation:<20} {before[operation]:>10.1f} {after[operation]:>10.1f} {speedup:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Microbenchmark del protocolo de texto frente a las tramas binarias de `shared_wire_codec`."""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+import shared_wire_codec as wire  # noqa: E402
+
+
+def sample_register() -> dict:
+    """Campos con el tamano real de una clave RSA-2048 en PEM y una firma PSS."""
+    body = base64.encodebytes(os.urandom(294)).decode()
+    pem = f"-----BEGIN PUBLIC KEY-----\n{body}-----END PUBLIC KEY-----\n".encode()
+    return {
+        "answer_to_ip": "10.0.0.5",
+        "answer_to_port": 40000,
+        "username": "alice_bench",
+        "ip": "10.0.0.5",
+        "port": 7001,
+        "version": time.time_ns(),
+        "public_key": pem,
+        "signature": os.urandom(256),
+    }
+
+
+def encode_text(fields: dict) -> bytes:
+    return (
+        f"REGISTER {fields['answer_to_ip']} {fields['answer_to_port']} {fields['username']} "
+        f"{fields['ip']} {fields['port']} {fields['version']} "
+        f"{base64.b64encode(fields['public_key']).decode()} {base64.b64encode(fields['signature']).decode()}"
+    ).encode()
+
+
+def decode_text(data: bytes) -> dict:
+    """Lo que hace el servidor con un REGISTER de texto antes de verificar la firma."""
+    _, answer_to_ip, answer_to_port, username, ip, port, version, public_key, signature = data.decode().split(" ")
+    return {
+        "answer_to_ip": answer_to_ip,
+        "answer_to_port": int(answer_to_port),
+        "username": username,
+        "ip": ip,
+        "port": int(port),
+        "version": int(version),
+        "public_key": base64.b64decode(public_key),
+        "signature": base64.b64decode(signature),
+    }
+
+
+def timed(operation, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        operation()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def run(iterations: int) -> dict[str, dict[str, float]]:
+    fields = sample_register()
+    text_frame = encode_text(fields)
+    binary_frame = wire.encode("REGISTER", fields, request_id=1, username_hash=123456789)
+    assert decode_text(text_frame) == wire.decode(binary_frame).fields
+    return {
+        "texto": {
+            "bytes": len(text_frame),
+            "encode_us": timed(lambda: encode_text(fields), iterations),
+            "decode_us": timed(lambda: decode_text(text_frame), iterations),
+        },
+        "binario": {
+            "bytes": len(binary_frame),
+            "encode_us": timed(lambda: wire.encode("REGISTER", fields, request_id=1, username_hash=123456789), iterations),
+            "decode_us": timed(lambda: wire.decode(binary_frame), iterations),
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del codec de comandos REGISTER (texto vs binario).")
+    parser.add_argument("--iteraciones", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados como JSON.")
+    args = parser.parse_args()
+
+    results = run(args.iteraciones)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+
+    print(f"[flock] {args.iteraciones} tramas REGISTER por caso")
+    print(f"{'formato':<10} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for name, row in results.items():
+        print(f"{name:<10} {row['bytes']:>8} {row['encode_us']:>10.2f} {row['decode_us']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,6 +17,11 @@ from pathlib import Path
 
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+import shared_endpoints as endpoints  # noqa: E402
+from shared_wire_codec import decode_json_reply  # noqa: E402
+
 IMAGE = os.environ.get("FLOCK_LOCAL_IMAGE", "flock:local")
 NETWORK = os.environ.get("FLOCK_LOCAL_NETWORK", "flock-local-net")
 OLD_NETWORKS = ["flock-manual-net"]
@@ -25,8 +30,7 @@ FAIL_TOLERANCE = os.environ.get("FLOCK_FAIL_TOLERANCE", "3")
 LOG_LEVEL = os.environ.get("FLOCK_LOG_LEVEL", "INFO")
 STATUS_LOG_INTERVAL = os.environ.get("FLOCK_STATUS_LOG_INTERVAL", "10")
 REPLICA_SYNC_INTERVAL = os.environ.get("FLOCK_REPLICA_FULL_SYNC_INTERVAL", "8")
-SERVER_PORT = 12345
-PING_PORT = 12346
+SERVER_PORT = endpoints.configured_port()
 
 SERVER_NODES = {
     "nodo1": "flock-nodo1",
@@ -141,19 +145,37 @@ def container_ip(container: str) -> str:
     )
 
 
-def udp_command(ip: str, command: str, timeout: float = 3.0) -> str:
+def container_endpoint(container: str) -> str:
+    """Endpoint `ip:puerto` del nodo en `container`, o "" si no tiene IP."""
+    ip = container_ip(container)
+    return endpoints.format_endpoint(ip, SERVER_PORT) if ip else ""
+
+
+def node_endpoint(node_or_container: str | None) -> tuple[str, str]:
+    """Devolver `(nombre, endpoint)`; acepta un nodo, un contenedor o un endpoint `ip:puerto`."""
+    if node_or_container and ":" in node_or_container:
+        return node_or_container, endpoints.normalize_endpoint(node_or_container, SERVER_PORT)
+    container = resolve_node_container(node_or_container)
+    return container, container_endpoint(container)
+
+
+def udp_request(endpoint: str, command: str, timeout: float = 3.0) -> bytes:
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
         sock.settimeout(timeout)
-        sock.sendto(command.encode(), (ip, SERVER_PORT))
+        sock.sendto(command.encode(), endpoints.command_address(endpoint))
         data, _ = sock.recvfrom(65535)
-        return data.decode()
+        return data
+
 
+def udp_command(endpoint: str, command: str, timeout: float = 3.0) -> str:
+    return udp_request(endpoint, command, timeout).decode(errors="replace")
 
-def ping(ip: str, timeout: float = 1.0) -> bool:
+
+def ping(endpoint: str, timeout: float = 1.0) -> bool:
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
         sock.settimeout(timeout)
         try:
-            sock.sendto(b"PING", (ip, PING_PORT))
+            sock.sendto(b"PING", endpoints.health_address(endpoint))
             data, _ = sock.recvfrom(1024)
             return data.decode() == "PONG"
         except Exception:
@@ -163,12 +185,14 @@ def ping(ip: str, timeout: float = 1.0) -> bool:
 def wait_for_server(container: str, timeout: float = 25.0) -> str:
     deadline = time.time() + timeout
     while time.time() < deadline:
-        ip = container_ip(container) if container_exists(container) else ""
-        if ip and ping(ip):
-            print(f"[flock] {container} listo en {ip}")
-            return ip
+        endpoint = container_endpoint(container) if container_exists(container) else ""
+        if endpoint and ping(endpoint):
+            print(f"[flock] {container} listo en {endpoint}")
+            return endpoint
         time.sleep(0.5)
-    raise TimeoutError(f"{container} no respondio PING en UDP {PING_PORT}")
+    raise TimeoutError(
+        f"{container} no respondio PING en UDP {SERVER_PORT + endpoints.HEALTH_PORT_OFFSET}"
+    )
 
 
 def start_server(node: str) -> None:
@@ -194,6 +218,8 @@ def start_server(node: str) -> None:
             "--network",
             NETWORK,
             "-e",
+            f"FLOCK_PORT={SERVER_PORT}",
+            "-e",
             f"FLOCK_FAIL_TOLERANCE={FAIL_TOLERANCE}",
             "-e",
             "FLOCK_LOG_DIR=/logs",
@@ -286,20 +312,37 @@ def resolve_node_container(node_or_container: str | None) -> str:
 
 
 def print_admin(command: str, node_or_container: str | None = None) -> str:
-    container = resolve_node_container(node_or_container)
-    ip = container_ip(container)
-    if not ip:
+    container, endpoint = node_endpoint(node_or_container)
+    if not endpoint:
         raise CommandError(f"No se pudo resolver IP para {container}")
-    response = udp_command(ip, command)
+    if command.strip().upper() == "SNAPSHOT":
+        response = "OK " + json.dumps(fetch_snapshot(endpoint), sort_keys=True, separators=(",", ":"))
+    else:
+        ok, payload = decode_json_reply(udp_request(endpoint, command))
+        response = payload if isinstance(payload, str) else ("OK " if ok else "ERROR ") + json.dumps(payload, sort_keys=True)
     print(response)
     return response
 
 
-def admin_json(ip: str, command: str) -> dict:
-    response = udp_command(ip, command)
-    if not response.startswith("OK "):
-        raise CommandError(f"{command} fallo en {ip}: {response}")
-    return json.loads(response[3:])
+def admin_json(endpoint: str, command: str) -> dict:
+    ok, payload = decode_json_reply(udp_request(endpoint, command))
+    if not ok or isinstance(payload, str):
+        raise CommandError(f"{command} fallo en {endpoint}: {payload}")
+    return payload
+
+
+def fetch_snapshot(endpoint: str, max_pages: int = 10000) -> dict:
+    """Descargar un SNAPSHOT de cualquier tamano siguiendo el cursor `next`, pagina a pagina y comprimido."""
+    snapshot = {"owned": [], "replicas": []}
+    cursor = None
+    for _ in range(max_pages):
+        page = admin_json(endpoint, f"SNAPSHOT {cursor} zlib" if cursor else "SNAPSHOT zlib")
+        snapshot["owned"].extend(page["owned"])
+        snapshot["replicas"].extend(page["replicas"])
+        cursor = page.get("next")
+        if not cursor:
+            return snapshot
+    raise CommandError(f"SNAPSHOT de {endpoint} supera {max_pages} paginas")
 
 
 def load_crypto():
@@ -335,20 +378,19 @@ def sign_registration(private_key, username: str, ip: str, port: int, version: i
     return base64.b64encode(signature).decode()
 
 
-def register_record(server_ip: str, username: str, message_ip: str, message_port: int, version: int) -> str:
+def register_record(server_endpoint: str, username: str, message_ip: str, message_port: int, version: int) -> str:
     private_key, public_key_b64 = make_identity()
     signature = sign_registration(private_key, username, message_ip, message_port, version, public_key_b64)
     command = f"REGISTER {username} {message_ip} {message_port} {version} {public_key_b64} {signature}"
-    return udp_command(server_ip, command)
+    return udp_command(server_endpoint, command)
 
 
 def seed_state(node_or_container: str | None = None, wait_seconds: float = 8.0) -> None:
-    container = resolve_node_container(node_or_container)
-    ip = container_ip(container)
-    print(f"[flock] Escribiendo registros de control mediante {container} ({ip})")
+    container, endpoint = node_endpoint(node_or_container)
+    print(f"[flock] Escribiendo registros de control mediante {container} ({endpoint})")
     for offset, (username, message_ip, port) in enumerate(CONTROL_RECORDS):
         version = time.time_ns() + offset
-        response = register_record(ip, username, message_ip, port, version)
+        response = register_record(endpoint, username, message_ip, port, version)
         print(f"{username}: {response}")
         if not response.startswith("OK "):
             raise CommandError(f"No se pudo registrar {username}: {response}")
@@ -358,20 +400,19 @@ def seed_state(node_or_container: str | None = None, wait_seconds: float = 8.0)
 
 
 def resolve_control_records(node_or_container: str | None = None) -> dict[str, str]:
-    container = resolve_node_container(node_or_container)
-    ip = container_ip(container)
-    return {username: udp_command(ip, f"RESOLVE {username}") for username, _, _ in CONTROL_RECORDS}
+    _, endpoint = node_endpoint(node_or_container)
+    return {username: udp_command(endpoint, f"RESOLVE {username}") for username, _, _ in CONTROL_RECORDS}
 
 
 def collect_state(node_or_container: str | None) -> dict:
-    container = resolve_node_container(node_or_container)
-    ip = container_ip(container)
+    container, endpoint = node_endpoint(node_or_container)
     return {
         "nodo": container,
-        "ip": ip,
-        "estado": admin_json(ip, "STATUS"),
-        "snapshot": admin_json(ip, "SNAPSHOT"),
-        "checksum": admin_json(ip, "CHECKSUM"),
+        "ip": endpoints.host_of(endpoint),
+        "endpoint": endpoint,
+        "estado": admin_json(endpoint, "STATUS"),
+        "snapshot": fetch_snapshot(endpoint),
+        "checksum": admin_json(endpoint, "CHECKSUM"),
         "registros_resueltos": resolve_control_records(container),
     }
 
@@ -485,7 +526,7 @@ def build_parser() -> argparse.ArgumentParser:
     verify_parser.add_argument("--reporte")
     verify_parser.add_argument("--timeout", type=float, default=30.0)
 
-    admin_parser = sub.add_parser("admin", help="Enviar STATUS, SNAPSHOT, CHECKSUM u otro comando UDP.")
+    admin_parser = sub.add_parser("admin", help="Enviar STATUS, SNAPSHOT, CHECKSUM, METRICS, PROFILE u otro comando UDP.")
     admin_parser.add_argument("admin_command", nargs="+")
     admin_parser.add_argument("--nodo")
 
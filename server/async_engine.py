@@ -0,0 +1,181 @@
+import asyncio
+import threading
+
+
+class TransportSocket:
+    """Socket-like facade so synchronous handlers can send through an asyncio transport.
+
+    Dispatcher workers run on their own threads, so sends from anywhere but the
+    loop thread are marshalled with `call_soon_threadsafe`.
+    """
+    def __init__(self, loop, transport):
+        self.loop = loop
+        self.transport = transport
+        self.loop_thread = threading.get_ident()
+
+    def sendto(self, data, address):
+        if threading.get_ident() == self.loop_thread:
+            self.transport.sendto(data, address)
+        else:
+            self.loop.call_soon_threadsafe(self.transport.sendto, data, address)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.transport.close)
+
+
+class CommandProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        try:
+            self.server.receive_command(data, addr)
+        except Exception as e:
+            self.server.on_command_error(data, addr, e)
+
+
+class PingResponderProtocol(asyncio.DatagramProtocol):
+    """Health port: answers PING and, given a server, hands SWIM traffic to it."""
+    def __init__(self, server=None):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.server is not None:
+            self.server.handle_probe(data, addr)
+        elif data == b"PING" or data.startswith(b"PING "):
+            self.transport.sendto(b"PONG" + data[4:], addr)
+
+
+class MulticastProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server, logger):
+        self.server = server
+        self.logger = logger
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            self.transport.sendto(*self.server.multicast_reply(data.decode().strip(), addr))
+        except Exception as e:
+            self.logger.error(f"Error en el listener: {e}")
+
+
+class AsyncEngine:
+    """Serve a `ChatServer` from one asyncio event loop.
+
+    The command, ping and multicast ports become DatagramProtocols and the
+    periodic maintenance loops become coroutines. Maintenance steps that still
+    block on request/response sockets (replica sync, finger lookups) run in the
+    default executor so the loop keeps serving datagrams.
+    """
+    def __init__(
+        self,
+        server,
+        logger,
+        finger_interval=1.0,
+        status_interval=0.0,
+        anti_entropy_interval=60.0,
+        vnode_interval=5.0,
+        swim_interval=0.1,
+        stabilize_interval=1.0,
+        metrics_interval=0.0,
+    ):
+        self.server = server
+        self.logger = logger
+        self.finger_interval = finger_interval
+        self.anti_entropy_interval = anti_entropy_interval
+        self.vnode_interval = vnode_interval
+        self.swim_interval = swim_interval
+        self.stabilize_interval = stabilize_interval
+        self.metrics_interval = metrics_interval
+        self.status_interval = status_interval
+        self.transports = []
+        self.tasks = []
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        server = self.server
+
+        command_transport, _ = await loop.create_datagram_endpoint(
+            lambda: CommandProtocol(server),
+            sock=server.command_socket,
+        )
+        ping_transport, _ = await loop.create_datagram_endpoint(
+            lambda: PingResponderProtocol(server),
+            sock=server.ping_socket,
+        )
+        self.transports.extend([command_transport, ping_transport])
+
+        try:
+            multicast_transport, _ = await loop.create_datagram_endpoint(
+                lambda: MulticastProtocol(server, self.logger),
+                sock=server.open_multicast_socket(),
+            )
+            self.transports.append(multicast_transport)
+        except OSError as e:
+            self.logger.error(f"Error en el listener: {e}")
+
+        command_facade = TransportSocket(loop, command_transport)
+        server.command_socket = command_facade
+        server.outbound_socket = command_facade
+        server.ping_socket = TransportSocket(loop, ping_transport)
+        server.dispatcher.start()
+
+        self.tasks = [
+            asyncio.create_task(self.periodic(self.swim_interval, server.membership_tick)),
+            asyncio.create_task(self.periodic(self.stabilize_interval, server.stabilize_tick, blocking=True, skip_in_crisis=True)),
+            asyncio.create_task(self.periodic(5, server.advertise_successors)),
+            asyncio.create_task(self.periodic(1, server.replics_manager_tick, blocking=True, skip_in_crisis=True)),
+            asyncio.create_task(self.periodic(self.finger_interval, server.fix_fingers_tick, blocking=True, skip_in_crisis=True)),
+            asyncio.create_task(self.periodic(
+                self.anti_entropy_interval,
+                server.anti_entropy_tick,
+                blocking=True,
+                skip_in_crisis=True,
+                delay_first=True,
+            )),
+            asyncio.create_task(self.periodic(self.vnode_interval, server.vnode_tick, blocking=True, skip_in_crisis=True)),
+        ]
+        if self.status_interval > 0:
+            self.tasks.append(asyncio.create_task(self.periodic(self.status_interval, server.print_info, blocking=True, delay_first=True)))
+        if self.metrics_interval > 0:
+            self.tasks.append(asyncio.create_task(self.periodic(self.metrics_interval, server.write_metrics_file, blocking=True)))
+
+        self.logger.info("[OK] Servicios de fondo iniciados para '%s'", server.name)
+        try:
+            while server.running:
+                await asyncio.sleep(0.5)
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.server.dispatcher.stop()
+        for transport in self.transports:
+            transport.close()
+
+    async def periodic(self, interval, step, blocking=False, skip_in_crisis=False, delay_first=False):
+        """Run `step` every `interval` seconds until the server stops."""
+        if delay_first:
+            await asyncio.sleep(interval)
+        while self.server.running:
+            if not (skip_in_crisis and self.server.crisis):
+                try:
+                    if blocking:
+                        await asyncio.to_thread(step)
+                    else:
+                        step()
+                except Exception as e:
+                    self.logger.error(f"Server error: {e}")
+            await asyncio.sleep(interval)
+
+
+def run(server, logger, **options):
+    asyncio.run(AsyncEngine(server, logger, **options).serve())
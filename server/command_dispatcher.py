@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+
+
+class CommandDispatcher:
+    """Verb-keyed command table backed by bounded per-lane queues and a worker pool.
+
+    Each verb is registered with a handler and a lane. Inline verbs run on the
+    receiving thread (cheap replies such as PING/RANGE); every other lane owns
+    a bounded queue drained by a shared pool of workers, with an optional
+    per-lane concurrency cap so topology changes stay serialized.
+    `observer(verb, seconds, waited)`, if given, is told how long each
+    handler ran and how long it sat in its queue (None for inline verbs);
+    `runner(handler, message, address)`, if given, invokes the handlers.
+    """
+    def __init__(self, workers=8, queue_size=256, on_error=None, observer=None, runner=None):
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.on_error = on_error
+        self.observer = observer
+        self.runner = runner
+
+        self.handlers = {}
+        self.lanes = {}
+        self.lane_order = []
+        self.next_lane = 0
+
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = False
+
+    def register(self, verb, handler, lane=None, inline=False, concurrency=None, queue_size=None):
+        """Bind `verb` to `handler(message, address)`.
+
+        Verbs sharing a `lane` share its queue and concurrency limit.
+        """
+        lane = lane or verb
+        self.handlers[verb] = (handler, None if inline else lane)
+        if not inline and lane not in self.lanes:
+            self.lanes[lane] = {
+                "queue": deque(),
+                "enqueued": deque(),
+                "limit": queue_size or self.queue_size,
+                "concurrency": concurrency,
+                "active": 0,
+                "rejected": 0,
+                "handled": 0,
+            }
+            self.lane_order.append(lane)
+
+    def verb_of(self, message):
+        verb = getattr(message, "verb", None)
+        if verb is not None:
+            return verb
+        return message.split(" ", 1)[0]
+
+    def dispatch(self, message, address, force=False):
+        """Run or enqueue `message`; return "inline", "queued", "busy" or "unknown".
+
+        `force` enqueues past the lane bound, for work the process queues for
+        itself and must not lose.
+        """
+        verb = self.verb_of(message)
+        entry = self.handlers.get(verb)
+        if entry is None:
+            return "unknown"
+        handler, lane = entry
+        if lane is None:
+            self._run(handler, message, address)
+            return "inline"
+
+        with self.condition:
+            state = self.lanes[lane]
+            if not force and len(state["queue"]) >= state["limit"]:
+                state["rejected"] += 1
+                return "busy"
+            state["queue"].append((handler, message, address))
+            state["enqueued"].append(time.perf_counter())
+            self.condition.notify()
+        return "queued"
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"flock-dispatch-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def queue_depths(self):
+        with self.condition:
+            return {
+                lane: {
+                    "queued": len(state["queue"]),
+                    "active": state["active"],
+                    "handled": state["handled"],
+                    "rejected": state["rejected"],
+                }
+                for lane, state in self.lanes.items()
+            }
+
+    def _next_job(self):
+        """Pick the next runnable job round-robin across lanes (caller holds the condition)."""
+        for offset in range(len(self.lane_order)):
+            lane = self.lane_order[(self.next_lane + offset) % len(self.lane_order)]
+            state = self.lanes[lane]
+            if not state["queue"]:
+                continue
+            if state["concurrency"] is not None and state["active"] >= state["concurrency"]:
+                continue
+            self.next_lane = (self.next_lane + offset + 1) % len(self.lane_order)
+            state["active"] += 1
+            enqueued = state["enqueued"].popleft() if state["enqueued"] else None
+            return lane, state["queue"].popleft(), enqueued
+        return None
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None and self.running:
+                    self.condition.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+            lane, (handler, message, address), enqueued = job
+            try:
+                self._run(handler, message, address, None if enqueued is None else time.perf_counter() - enqueued)
+            finally:
+                with self.condition:
+                    state = self.lanes[lane]
+                    state["active"] -= 1
+                    state["handled"] += 1
+                    self.condition.notify_all()
+
+    def _run(self, handler, message, address, waited=None):
+        started = time.perf_counter()
+        try:
+            if self.runner:
+                self.runner(handler, message, address)
+            else:
+                handler(message, address)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(message, address, e)
+        if self.observer:
+            self.observer(self.verb_of(message), time.perf_counter() - started, waited)
@@ -1,27 +1,115 @@
 import sqlite3
 import os
+import threading
+
+import bounded_cache
+import endpoints
 
 APPLIED = "applied"
 STALE = "stale"
 IDENTITY_CONFLICT = "identity_conflict"
 IDEMPOTENT = "idempotent"
 
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def ring_hash(value, base=911382629, mod=10**18 + 3):
+    """Rolling hash that places usernames on the ring; stored as `user_hash`."""
+    hash_value = 0
+    for c in value:
+        hash_value = (hash_value * base + ord(c)) % mod
+    return hash_value
+
 
 class server_db:
     """Server-side simple SQLite storage for user registration and replication info."""
-    def __init__(self):
+    def __init__(
+        self,
+        synchronous=None,
+        cache_size=None,
+        mmap_size=None,
+        statement_cache_size=None,
+        hash_function=None,
+        record_cache_size=None,
+    ):
         self.db_directory = os.path.join(os.path.dirname(__file__), "db")
         self.db_route = ""
+        self.hash_function = hash_function or ring_hash
+
+        synchronous = (synchronous or os.environ.get("FLOCK_DB_SYNCHRONOUS", "NORMAL")).upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unsupported synchronous mode: {synchronous}")
+        self.pragmas = {
+            "synchronous": synchronous,
+            "cache_size": int(os.environ.get("FLOCK_DB_CACHE_SIZE", "-2000") if cache_size is None else cache_size),
+            "mmap_size": int(os.environ.get("FLOCK_DB_MMAP_SIZE", "0") if mmap_size is None else mmap_size),
+        }
+        self.statement_cache_size = int(
+            os.environ.get("FLOCK_DB_STATEMENT_CACHE", "128") if statement_cache_size is None else statement_cache_size
+        )
+
+        # One long-lived connection per thread; bumping the generation
+        # invalidates every thread's cached connection after `close()`.
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+
+        # In-memory copy of owned records: username -> (ip, port, public_key,
+        # version). While `_records_complete` holds, every owned user is in it
+        # and a miss is an authoritative "not found" that never touches disk.
+        # Writes and miss fills happen under `_records_lock` so a slow reader
+        # cannot overwrite a newer write with the row it read earlier.
+        self.record_cache_size = int(
+            os.environ.get("FLOCK_DB_RECORD_CACHE_SIZE", "50000") if record_cache_size is None else record_cache_size
+        )
+        self._records = bounded_cache.LRUCache(max(1, self.record_cache_size))
+        self._records_lock = threading.RLock()
+        self._records_complete = False
+        self.record_cache_hits = 0
+        self.record_cache_misses = 0
+
+        # Merkle scope (None for owned records, else the replica owner) ->
+        # ring hashes of users written since `take_merkle_changes` last ran
+        # for it. A scope missing here has to be rebuilt from scratch.
+        self._merkle_changes = {}
+        self._merkle_changes_lock = threading.Lock()
 
     def _connect(self):
         if not self.db_route:
             raise RuntimeError("Server database is not initialized")
-        conn = sqlite3.connect(self.db_route, check_same_thread=False)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+
+        conn = sqlite3.connect(
+            self.db_route,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
         conn.execute("PRAGMA journal_mode=WAL")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        with self._connections_lock:
+            self._connections.append(conn)
+            self._local.conn = conn
+            self._local.generation = self._generation
         return conn
 
+    def close(self):
+        """Close every pooled connection; the next call on each thread reconnects."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
 
     def set_db(self, username):     
+        self.close()
         os.makedirs(self.db_directory, exist_ok=True)
         self.db_route = os.path.join(self.db_directory, f"{username}.db")
 
@@ -35,7 +123,8 @@ class server_db:
                     ip TEXT NOT NULL,
                     port INTEGER NOT NULL,
                     public_key TEXT NOT NULL DEFAULT '',
-                    version INTEGER NOT NULL DEFAULT 0
+                    version INTEGER NOT NULL DEFAULT 0,
+                    user_hash INTEGER
                 )
             ''')
 
@@ -47,7 +136,15 @@ class server_db:
                     port INTEGER NOT NULL,
                     public_key TEXT NOT NULL DEFAULT '',
                     version INTEGER NOT NULL DEFAULT 0,
-                    owner TEXT NOT NULL
+                    owner TEXT NOT NULL,
+                    user_hash INTEGER
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
                 )
             ''')
 
@@ -63,8 +160,97 @@ class server_db:
 
             self._ensure_column(cursor, "users", "public_key", "TEXT NOT NULL DEFAULT ''")
             self._ensure_column(cursor, "users", "version", "INTEGER NOT NULL DEFAULT 0")
+            self._ensure_column(cursor, "users", "change_seq", "INTEGER NOT NULL DEFAULT 0")
             self._ensure_column(cursor, "replic_users", "public_key", "TEXT NOT NULL DEFAULT ''")
             self._ensure_column(cursor, "replic_users", "version", "INTEGER NOT NULL DEFAULT 0")
+            self._ensure_column(cursor, "users", "user_hash", "INTEGER")
+            self._ensure_column(cursor, "replic_users", "user_hash", "INTEGER")
+            self._backfill_user_hash(cursor, "users")
+            self._backfill_user_hash(cursor, "replic_users")
+            self._qualify_replica_owners(cursor)
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_change_seq
+                ON users(change_seq)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_user_hash
+                ON users(user_hash)
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_replic_users_owner_hash
+                ON replic_users(owner, user_hash)
+            ''')
+
+        with self._merkle_changes_lock:
+            self._merkle_changes = {}
+        self._load_record_cache()
+
+    def _load_record_cache(self):
+        """Load the most recently changed owned records, up to the cache cap."""
+        with self._records_lock:
+            self._records = bounded_cache.LRUCache(max(1, self.record_cache_size))
+            self._records_complete = False
+            self.record_cache_hits = 0
+            self.record_cache_misses = 0
+            if self.record_cache_size <= 0:
+                return
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT username, ip, port, public_key, version FROM users
+                    ORDER BY change_seq DESC
+                    LIMIT ?
+                ''', (self.record_cache_size + 1,))
+                rows = cursor.fetchall()
+            for username, ip, port, public_key, version in reversed(rows[: self.record_cache_size]):
+                self._records.put(username, (ip, port, public_key, version))
+            self._records_complete = len(rows) <= self.record_cache_size
+
+    def _cached_user(self, username, cursor=None):
+        """Read-through lookup of an owned record as `(ip, port, public_key, version)` or None.
+
+        Writers pass their `cursor` so a miss is read inside their open
+        transaction instead of through a nested `with conn`, which would
+        commit it halfway.
+        """
+        if self.record_cache_size <= 0:
+            self.record_cache_misses += 1
+            return self._select_user(username, cursor)
+        record = self._records.get(username)
+        if record is not None or (self._records_complete and self._records.evictions == 0):
+            self.record_cache_hits += 1
+            return record
+        with self._records_lock:
+            self.record_cache_misses += 1
+            record = self._select_user(username, cursor)
+            if record is not None:
+                self._records.put(username, record)
+            return record
+
+    def _select_user(self, username, cursor=None):
+        if cursor is None:
+            with self._connect() as conn:
+                return self._select_user(username, conn.cursor())
+        cursor.execute('''
+            SELECT ip, port, public_key, version
+            FROM users
+            WHERE username = ?
+        ''', (username,))
+        return cursor.fetchone()
+
+    def record_cache_stats(self):
+        stats = self._records.stats()
+        return {
+            "entries": stats["size"],
+            "capacity": self.record_cache_size,
+            "complete": self._records_complete and stats["evictions"] == 0,
+            "hits": self.record_cache_hits,
+            "misses": self.record_cache_misses,
+            "evictions": stats["evictions"],
+        }
 
     def _ensure_column(self, cursor, table_name, column_name, column_definition):
         cursor.execute(f"PRAGMA table_info({table_name})")
@@ -74,15 +260,82 @@ class server_db:
                 f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}"
             )
 
+    def _backfill_user_hash(self, cursor, table_name):
+        cursor.execute(f"SELECT username FROM {table_name} WHERE user_hash IS NULL")
+        rows = [(self.hash_function(username), username) for (username,) in cursor.fetchall()]
+        if rows:
+            cursor.executemany(f"UPDATE {table_name} SET user_hash = ? WHERE username = ?", rows)
+
+    def _qualify_replica_owners(self, cursor):
+        """Rewrite replica owners stored as bare ips to `ip:port` endpoints.
+
+        Servers used to be identified by ip alone and all listened on the default port.
+        """
+        cursor.execute(
+            "UPDATE replic_users SET owner = owner || ? WHERE owner != '' AND owner NOT LIKE '%:%'",
+            (f":{endpoints.DEFAULT_PORT}",),
+        )
+
     def get_user_record(self, username):
+        record = self._cached_user(username)
+        return (username, *record) if record else None
+
+    def _bump_state(self, cursor, name):
+        cursor.execute('''
+            INSERT INTO sync_state (name, value) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1
+        ''', (name,))
+        cursor.execute("SELECT value FROM sync_state WHERE name = ?", (name,))
+        return cursor.fetchone()[0]
+
+    def _next_change_seq(self, cursor):
+        return self._bump_state(cursor, "change_seq")
+
+    def _note_merkle_changes(self, changes):
+        """Record committed `(owner, username)` writes for the scopes a Merkle tree is kept for."""
+        with self._merkle_changes_lock:
+            for owner, username in changes:
+                changed = self._merkle_changes.get(owner)
+                if changed is not None:
+                    changed.add(self.hash_function(username))
+
+    def take_merkle_changes(self, owner=None):
+        """Return and reset the ring hashes written to `owner`'s replicas (owned records for None).
+
+        Returns None on the first call for a scope and after `drop_replics`,
+        when the caller has to rebuild the whole scope.
+        """
+        with self._merkle_changes_lock:
+            changed = self._merkle_changes.get(owner)
+            self._merkle_changes[owner] = set()
+            return changed
+
+    def _read_state(self, name):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM sync_state WHERE name = ?", (name,))
+            row = cursor.fetchone()
+            return row[0] if row else 0
+
+    def current_change_seq(self):
+        """Return the sequence number of the latest change to an owned record."""
+        return self._read_state("change_seq")
+
+    def current_replica_seq(self):
+        """Return a counter bumped on every change to the replica table."""
+        return self._read_state("replica_change_seq")
+
+    def get_changes_since(self, change_seq):
+        """Return owned records changed after `change_seq`, oldest change first."""
         with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT username, ip, port, public_key, version
                 FROM users
-                WHERE username = ?
-            ''', (username,))
-            return cursor.fetchone()
+                WHERE change_seq > ?
+                ORDER BY change_seq
+            ''', (change_seq,))
+            return cursor.fetchall()
 
     def _resolve_version_conflict(self, existing_public_key, existing_version, public_key, version):
         if version < existing_version:
@@ -97,48 +350,84 @@ class server_db:
         return self.upsert_user(username, ip, port, public_key=public_key, version=version)[0] in (APPLIED, IDEMPOTENT)
 
     def upsert_user(self, username, ip, port, public_key="", version=0):
-        with self._connect() as conn:
+        with self._records_lock, self._connect() as conn:
             cursor = conn.cursor()
-
+            resolution, stored, record = self._upsert_user_row(cursor, username, ip, port, public_key, version)
+            if record is not None:
+                conn.commit()
+                self._cache_record(username, record)
+                self._note_merkle_changes([(None, username)])
+            return resolution, stored
+
+    def upsert_users(self, records):
+        """Apply many `(username, ip, port, public_key, version)` owned records in one transaction.
+
+        Returns `[(username, resolution, stored), ...]` in input order.
+        """
+        results = []
+        written = {}
+        with self._records_lock, self._connect() as conn:
+            cursor = conn.cursor()
+            for username, ip, port, public_key, version in records:
+                existing = written[username] if username in written else self._cached_user(username, cursor)
+                resolution, stored, record = self._upsert_user_row(cursor, username, ip, port, public_key, version, existing)
+                if record is not None:
+                    written[username] = record
+                results.append((username, resolution, stored))
+            conn.commit()
+            for username, record in written.items():
+                self._cache_record(username, record)
+            self._note_merkle_changes((None, username) for username in written)
+        return results
+
+    def _cache_record(self, username, record):
+        if self.record_cache_size > 0:
+            self._records.put(username, record)
+
+    def _upsert_user_row(self, cursor, username, ip, port, public_key, version, existing_user=None):
+        """Write one owned record; return `(resolution, stored, written_record_or_None)`."""
+        if existing_user is None:
+            existing_user = self._cached_user(username, cursor)
+
+        if existing_user:
+            existing_ip, existing_port, existing_public_key, existing_version = existing_user
+            resolution = self._resolve_version_conflict(
+                existing_public_key,
+                existing_version,
+                public_key,
+                version,
+            )
+            if resolution in (STALE, IDENTITY_CONFLICT):
+                return resolution, False, None
+            if resolution == IDEMPOTENT:
+                return resolution, True, None
+            public_key = public_key or existing_public_key
             cursor.execute('''
-                SELECT ip, port, public_key, version
-                FROM users
+                UPDATE users
+                SET ip = ?, port = ?, public_key = ?, version = ?, change_seq = ?
                 WHERE username = ?
-            ''', (username,))
-
-            existing_user = cursor.fetchone()
-
-            if existing_user:
-                existing_ip, existing_port, existing_public_key, existing_version = existing_user
-                resolution = self._resolve_version_conflict(
-                    existing_public_key,
-                    existing_version,
-                    public_key,
-                    version,
-                )
-                if resolution in (STALE, IDENTITY_CONFLICT):
-                    return resolution, False
-                if resolution == IDEMPOTENT:
-                    return resolution, True
-                cursor.execute('''
-                    UPDATE users
-                    SET ip = ?, port = ?, public_key = ?, version = ?
-                    WHERE username = ?
-                ''', (
-                    ip,
-                    port,
-                    public_key or existing_public_key,
-                    version,
-                    username,
-                ))
-            else:
-                cursor.execute('''
-                    INSERT INTO users (username, ip, port, public_key, version)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (username, ip, port, public_key, version))
-
-            conn.commit()
-            return APPLIED, True
+            ''', (
+                ip,
+                port,
+                public_key,
+                version,
+                self._next_change_seq(cursor),
+                username,
+            ))
+        else:
+            cursor.execute('''
+                INSERT INTO users (username, ip, port, public_key, version, change_seq, user_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                username,
+                ip,
+                port,
+                public_key,
+                version,
+                self._next_change_seq(cursor),
+                self.hash_function(username),
+            ))
+        return APPLIED, True, (ip, port, public_key, version)
 
     def register_replic_user(self, username, ip, port, public_key="", version=0, owner=""):
         return self.upsert_replic_user(
@@ -151,59 +440,77 @@ class server_db:
         )[0] in (APPLIED, IDEMPOTENT)
 
     def upsert_replic_user(self, username, ip, port, public_key="", version=0, owner=""):
+        changes = []
         with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT ip, port, public_key, version, owner
-                FROM replic_users
-                WHERE username = ?
-            ''', (username,))
-
-            existing_user = cursor.fetchone()
-
-            if existing_user:
-                _, _, existing_public_key, existing_version, existing_owner = existing_user
-                resolution = self._resolve_version_conflict(
-                    existing_public_key,
-                    existing_version,
-                    public_key,
-                    version,
-                )
-                if resolution in (STALE, IDENTITY_CONFLICT):
-                    return resolution, False
-                if resolution == IDEMPOTENT:
-                    return resolution, True
-                cursor.execute('''
-                    UPDATE replic_users
-                    SET ip = ?, port = ?, public_key = ?, version = ?, owner = ?
-                    WHERE username = ?
-                ''', (
-                    ip,
-                    port,
-                    public_key or existing_public_key,
-                    version,
-                    owner or existing_owner,
-                    username,
-                ))
-            else:
-                cursor.execute('''
-                    INSERT INTO replic_users (username, ip, port, public_key, version, owner)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (username, ip, port, public_key, version, owner))
-
+            resolution, stored = self._upsert_replic_row(cursor, username, ip, port, public_key, version, owner, changes)
             conn.commit()
-            return APPLIED, True
+        self._note_merkle_changes(changes)
+        return resolution, stored
 
-    def resolve_user(self, username):
+    def upsert_replic_users(self, records, owner=""):
+        """Apply many `(username, ip, port, public_key, version)` replicas in one transaction.
+
+        Returns `[(username, resolution, stored), ...]` in input order.
+        """
+        results = []
+        changes = []
         with self._connect() as conn:
             cursor = conn.cursor()
+            for username, ip, port, public_key, version in records:
+                resolution, stored = self._upsert_replic_row(cursor, username, ip, port, public_key, version, owner, changes)
+                results.append((username, resolution, stored))
+            conn.commit()
+        self._note_merkle_changes(changes)
+        return results
+
+    def _upsert_replic_row(self, cursor, username, ip, port, public_key, version, owner, changes):
+        """Write one replica; append `(owner, username)` to `changes` for each owner's scope it touched."""
+        cursor.execute('''
+            SELECT ip, port, public_key, version, owner
+            FROM replic_users
+            WHERE username = ?
+        ''', (username,))
+
+        existing_user = cursor.fetchone()
+
+        if existing_user:
+            _, _, existing_public_key, existing_version, existing_owner = existing_user
+            resolution = self._resolve_version_conflict(
+                existing_public_key,
+                existing_version,
+                public_key,
+                version,
+            )
+            if resolution in (STALE, IDENTITY_CONFLICT):
+                return resolution, False
+            if resolution == IDEMPOTENT:
+                return resolution, True
             cursor.execute('''
-                SELECT ip, port, public_key, version
-                FROM users
+                UPDATE replic_users
+                SET ip = ?, port = ?, public_key = ?, version = ?, owner = ?
                 WHERE username = ?
-            ''', (username,))
-            address = cursor.fetchone()
-            return address
+            ''', (
+                ip,
+                port,
+                public_key or existing_public_key,
+                version,
+                owner or existing_owner,
+                username,
+            ))
+            changes.extend({(existing_owner, username), (owner or existing_owner, username)})
+        else:
+            cursor.execute('''
+                INSERT INTO replic_users (username, ip, port, public_key, version, owner, user_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (username, ip, port, public_key, version, owner, self.hash_function(username)))
+            changes.append((owner, username))
+
+        self._bump_state(cursor, "replica_change_seq")
+        return APPLIED, True
+
+    def resolve_user(self, username):
+        return self._cached_user(username)
         
 
     def get_bd_copy(self):
@@ -237,31 +544,125 @@ class server_db:
             return cursor.fetchall()
 
 
-    def get_alien_users(self, lower_bound, upper_bound, hash_function):
+    def get_alien_users(self, lower_bound, upper_bound):
+        """Return owned users whose stored ring hash lies outside `[lower_bound, upper_bound]`."""
         with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT username, ip, port, public_key, version FROM users
-            ''')
+                WHERE user_hash < ? OR user_hash > ?
+                ORDER BY user_hash, username
+            ''', (lower_bound, upper_bound))
+            return cursor.fetchall()
 
-            data = cursor.fetchall()
-            alien_users = []
-            for user in data:
-                user_hash = hash_function(user[0])
-                if user_hash < lower_bound or user_hash > upper_bound:
-                    alien_users.append(user)
+    def list_users_in_range(
+        self,
+        lower_bound,
+        upper_bound,
+        limit=None,
+        after_hash=None,
+        after_username=None,
+        changed_after=None,
+    ):
+        """Return owned users with `lower_bound <= user_hash <= upper_bound`, in ring order.
+
+        `after_hash` resumes a previous page (exclusive) and `limit` bounds the
+        page size. With `after_username`, users sharing `after_hash` but
+        sorting after that name are kept, so hash collisions never straddle
+        a page boundary. `changed_after` keeps only rows written after that
+        change sequence.
+        """
+        query = '''
+            SELECT username, ip, port, public_key, version FROM users
+            WHERE user_hash BETWEEN ? AND ?
+        '''
+        params = [lower_bound, upper_bound]
+        if after_hash is not None and after_username is not None:
+            query += " AND (user_hash > ? OR (user_hash = ? AND username > ?))"
+            params.extend([after_hash, after_hash, after_username])
+        elif after_hash is not None:
+            query += " AND user_hash > ?"
+            params.append(after_hash)
+        if changed_after:
+            query += " AND change_seq > ?"
+            params.append(changed_after)
+        query += " ORDER BY user_hash, username"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
 
-            return alien_users
-        
-    def delete_user(self, username):
+    def count_users_in_range(self, lower_bound, upper_bound):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM users WHERE user_hash BETWEEN ? AND ?
+            ''', (lower_bound, upper_bound))
+            return cursor.fetchone()[0]
+
+    def hash_quantile(self, lower_bound, upper_bound, fraction):
+        """Return the stored user hash at `fraction` of the owned keys in the range, or None if empty."""
+        count = self.count_users_in_range(lower_bound, upper_bound)
+        if count == 0:
+            return None
+        offset = min(count - 1, max(0, int(count * fraction)))
         with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_hash FROM users
+                WHERE user_hash BETWEEN ? AND ?
+                ORDER BY user_hash
+                LIMIT 1 OFFSET ?
+            ''', (lower_bound, upper_bound, offset))
+            return cursor.fetchone()[0]
+
+    def list_replics_in_range(self, owner, lower_bound, upper_bound):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT username, ip, port, public_key, version FROM replic_users
+                WHERE owner = ? AND user_hash BETWEEN ? AND ?
+                ORDER BY user_hash, username
+            ''', (owner, lower_bound, upper_bound))
+            return cursor.fetchall()
+
+    def delete_user(self, username):
+        with self._records_lock, self._connect() as conn:
+            cursor = conn.cursor()
             
             cursor.execute('''
                 DELETE FROM users WHERE username = ?
             ''', (username,))
-            
+            deleted = cursor.rowcount
+            if deleted:
+                self._next_change_seq(cursor)
+
+            conn.commit()
+            self._records.pop(username)
+            if deleted:
+                self._note_merkle_changes([(None, username)])
+
+    def delete_users_in_range(self, lower_bound, upper_bound):
+        """Delete every owned user in `[lower_bound, upper_bound]` in one transaction."""
+        with self._records_lock, self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT username FROM users WHERE user_hash BETWEEN ? AND ?
+            ''', (lower_bound, upper_bound))
+            usernames = [row[0] for row in cursor.fetchall()]
+            cursor.execute('''
+                DELETE FROM users WHERE user_hash BETWEEN ? AND ?
+            ''', (lower_bound, upper_bound))
+            if usernames:
+                self._next_change_seq(cursor)
             conn.commit()
+            for username in usernames:
+                self._records.pop(username)
+            self._note_merkle_changes((None, username) for username in usernames)
+            return len(usernames)
 
     def drop_replics(self, owner):
         with self._connect() as conn:
@@ -270,8 +671,29 @@ class server_db:
             cursor.execute('''
                 DELETE FROM replic_users WHERE owner = ?
             ''', (owner,))
+            if cursor.rowcount:
+                self._bump_state(cursor, "replica_change_seq")
 
             conn.commit()
+        with self._merkle_changes_lock:
+            self._merkle_changes.pop(owner, None)
+
+    def delete_replic_users(self, owner, usernames):
+        """Delete the given replicas of `owner` in one transaction."""
+        usernames = list(usernames)
+        if not usernames:
+            return 0
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                DELETE FROM replic_users WHERE owner = ? AND username = ?
+            ''', [(owner, username) for username in usernames])
+            deleted = cursor.rowcount
+            if deleted:
+                self._bump_state(cursor, "replica_change_seq")
+            conn.commit()
+        self._note_merkle_changes((owner, username) for username in usernames)
+        return deleted
 
     def get_replics(self, owner):
         with self._connect() as conn:
@@ -0,0 +1,117 @@
+import copy
+import hashlib
+import json
+
+
+EMPTY_DIGEST = hashlib.sha256(b"").hexdigest()
+
+
+def record_digest(record):
+    """Digest of one `(username, ip, port, public_key, version)` tuple.
+
+    Owner metadata is deliberately left out so an owner's `owned` tree and a
+    replica's copy of it produce identical leaves.
+    """
+    username, ip, port, public_key, version = record
+    canonical = json.dumps([username, ip, int(port), public_key, int(version)], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class MerkleTree:
+    """Binary Merkle tree over fixed hash-range buckets of user records.
+
+    Nodes use heap numbering: the root is 1, node `n` has children `2n` and
+    `2n + 1`, and the `buckets` leaves occupy `[buckets, 2 * buckets)`.
+    Bucket `b` covers usernames whose ring hash falls in
+    `[b * hash_mod // buckets, (b + 1) * hash_mod // buckets)`.
+    """
+    def __init__(self, records, hash_function, hash_mod, buckets=1024):
+        self.hash_mod = hash_mod
+        self.buckets = 1
+        while self.buckets < max(1, int(buckets)):
+            self.buckets *= 2
+
+        self.bucket_contents = [[] for _ in range(self.buckets)]
+        for record in records:
+            self.bucket_contents[self.bucket_of(hash_function(record[0]))].append(tuple(record[:5]))
+
+        self.nodes = [EMPTY_DIGEST] * (2 * self.buckets)
+        for bucket, contents in enumerate(self.bucket_contents):
+            contents.sort()
+            self.nodes[self.buckets + bucket] = self._leaf_digest(contents)
+        for node in range(self.buckets - 1, 0, -1):
+            self.nodes[node] = self._inner_digest(node)
+
+    def _leaf_digest(self, contents):
+        if not contents:
+            return EMPTY_DIGEST
+        return hashlib.sha256("".join(record_digest(record) for record in contents).encode()).hexdigest()
+
+    def _inner_digest(self, node):
+        left, right = self.nodes[2 * node], self.nodes[2 * node + 1]
+        if left == EMPTY_DIGEST and right == EMPTY_DIGEST:
+            return EMPTY_DIGEST
+        return hashlib.sha256(f"{left}{right}".encode()).hexdigest()
+
+    def with_buckets(self, bucket_records):
+        """Return a copy whose `{bucket: records}` are replaced, rehashing only their paths to the root.
+
+        The tree itself is left untouched, so readers holding it never see a
+        half-updated set of digests.
+        """
+        tree = copy.copy(self)
+        tree.bucket_contents = list(self.bucket_contents)
+        tree.nodes = list(self.nodes)
+        for bucket, records in bucket_records.items():
+            contents = sorted(tuple(record[:5]) for record in records)
+            tree.bucket_contents[bucket] = contents
+            tree.nodes[tree.buckets + bucket] = tree._leaf_digest(contents)
+        # Every leaf sits at the same depth, so parents can be rehashed a level at a time.
+        level = {(tree.buckets + bucket) // 2 for bucket in bucket_records}
+        while level and 0 not in level:
+            for node in level:
+                tree.nodes[node] = tree._inner_digest(node)
+            level = {node // 2 for node in level}
+        return tree
+
+    @property
+    def root(self):
+        return self.nodes[1]
+
+    def bucket_of(self, key_hash):
+        return min(self.buckets - 1, key_hash * self.buckets // self.hash_mod)
+
+    def bucket_bounds(self, bucket):
+        """Inclusive `(lower, upper)` ring-hash range of the keys `bucket_of` puts in `bucket`."""
+        lower = -(-bucket * self.hash_mod // self.buckets)
+        if bucket == self.buckets - 1:
+            return lower, self.hash_mod - 1
+        return lower, -(-(bucket + 1) * self.hash_mod // self.buckets) - 1
+
+    def is_leaf(self, node):
+        return node >= self.buckets
+
+    def children(self, node):
+        if self.is_leaf(node):
+            return []
+        return [2 * node, 2 * node + 1]
+
+    def digest(self, node):
+        if not 1 <= node < 2 * self.buckets:
+            raise ValueError(f"Merkle node out of range: {node}")
+        return self.nodes[node]
+
+    def bucket_records(self, bucket):
+        return list(self.bucket_contents[bucket])
+
+    def describe(self, nodes):
+        """Return `{node: {"digest", "children" | "bucket"}}` for an admin MERKLE reply."""
+        described = {}
+        for node in nodes:
+            entry = {"digest": self.digest(node)}
+            if self.is_leaf(node):
+                entry["bucket"] = node - self.buckets
+            else:
+                entry["children"] = self.children(node)
+            described[str(node)] = entry
+        return described
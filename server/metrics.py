@@ -0,0 +1,281 @@
+import os
+import threading
+import time
+
+
+# Upper bounds in seconds; the implicit +Inf bucket catches the rest.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and fixed-bucket histograms.
+
+    Metrics are declared once with `counter`, `gauge` or `histogram` and
+    updated by name with label keywords. Gauges and counters may instead
+    take a `callback` returning either a number or `[(labels, value), ...]`,
+    read only when the registry is exported, so state the server already
+    keeps (queue depths, cache sizes) costs nothing on the hot path.
+    `snapshot()` is the JSON view served by METRICS and `prometheus()` the
+    text exposition format written to FLOCK_METRICS_FILE.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def counter(self, name, help="", callback=None):
+        return self._declare(name, "counter", help, callback=callback)
+
+    def gauge(self, name, help="", callback=None):
+        return self._declare(name, "gauge", help, callback=callback)
+
+    def histogram(self, name, help="", buckets=LATENCY_BUCKETS):
+        return self._declare(name, "histogram", help, buckets=tuple(sorted(buckets)))
+
+    def inc(self, name, amount=1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            series = self.metrics[name]["series"]
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.metrics[name]["series"][label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = label_key(labels)
+        with self.lock:
+            metric = self.metrics[name]
+            histogram = metric["series"].get(key)
+            if histogram is None:
+                histogram = metric["series"][key] = Histogram(metric["buckets"])
+            index = 0
+            for bound in metric["buckets"]:
+                if value <= bound:
+                    break
+                index += 1
+            histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def snapshot(self):
+        """Return `{name: {type, help, series: [...]}}` with cumulative histogram buckets."""
+        result = {"uptime_seconds": round(self.clock() - self.started, 3), "metrics": {}}
+        for name, metric, series in self._collect():
+            rows = []
+            for key, value in series:
+                row = {"labels": dict(key)}
+                if metric["type"] == "histogram":
+                    row.update({
+                        "count": value.count,
+                        "sum": round(value.sum, 6),
+                        "buckets": {
+                            format_value(bound): cumulative
+                            for bound, cumulative in self._cumulative(metric["buckets"], value)
+                        },
+                    })
+                else:
+                    row["value"] = value
+                rows.append(row)
+            result["metrics"][name] = {"type": metric["type"], "help": metric["help"], "series": rows}
+        return result
+
+    def summary(self, name, label):
+        """Per value of `label` in histogram `name`: count, sum, mean and bucket-bound p50/p95/p99."""
+        with self.lock:
+            metric = self.metrics[name]
+            series = [(dict(key).get(label), self._copy(value)) for key, value in metric["series"].items()]
+        result = {}
+        for value, histogram in series:
+            if histogram.count == 0:
+                continue
+            result[value] = {
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "mean": histogram.sum / histogram.count,
+                **{
+                    f"p{int(q * 100)}": self._quantile(metric["buckets"], histogram, q)
+                    for q in (0.5, 0.95, 0.99)
+                },
+            }
+        return result
+
+    def prometheus(self):
+        lines = []
+        for name, metric, series in self._collect():
+            if metric["help"]:
+                lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in series:
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{format_labels(key)} {format_value(value)}")
+                    continue
+                for bound, cumulative in self._cumulative(metric["buckets"], value):
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', format_value(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(key)} {format_value(round(value.sum, 6))}")
+                lines.append(f"{name}_count{format_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Atomically replace `path` with the current text exposition."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            handle.write(self.prometheus())
+        os.replace(temporary, path)
+
+    def _declare(self, name, kind, help, callback=None, buckets=None):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = {
+                    "type": kind,
+                    "help": help,
+                    "callback": callback,
+                    "buckets": buckets,
+                    "series": {},
+                }
+            elif metric["type"] != kind:
+                raise ValueError(f"metric {name} already declared as {metric['type']}")
+        return name
+
+    def _collect(self):
+        with self.lock:
+            declared = [
+                (name, metric, list(metric["series"].items()))
+                for name, metric in sorted(self.metrics.items())
+            ]
+        collected = []
+        for name, metric, series in declared:
+            if metric["callback"] is not None:
+                try:
+                    series = self._callback_series(metric["callback"]())
+                except Exception:
+                    series = []
+            elif metric["type"] == "histogram":
+                with self.lock:
+                    series = [(key, self._copy(value)) for key, value in series]
+            collected.append((name, metric, sorted(series)))
+        return collected
+
+    def _callback_series(self, value):
+        if isinstance(value, (int, float)):
+            return [((), value)]
+        return [(label_key(labels), amount) for labels, amount in value]
+
+    def _copy(self, histogram):
+        copy = Histogram(())
+        copy.counts = list(histogram.counts)
+        copy.sum = histogram.sum
+        copy.count = histogram.count
+        return copy
+
+    def _quantile(self, buckets, histogram, q):
+        """Upper bound of the bucket holding quantile `q` (inf if it overflowed the last bound)."""
+        rank = q * histogram.count
+        for bound, cumulative in self._cumulative(buckets, histogram):
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def _cumulative(self, buckets, histogram):
+        total = 0
+        for bound, count in zip(list(buckets) + [float("inf")], histogram.counts):
+            total += count
+            yield bound, total
+
+
+class Timer:
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class TimedLock:
+    """Re-entrant lock that reports wait and hold time of outermost acquisitions.
+
+    `on_release(waited, held)` runs after the lock is released, so the
+    callback never extends the critical section.
+    """
+    def __init__(self, on_release, lock=None):
+        self.lock = lock or threading.RLock()
+        self.on_release = on_release
+        self.local = threading.local()
+
+    def acquire(self, blocking=True, timeout=-1):
+        requested = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        if acquired:
+            depth = getattr(self.local, "depth", 0)
+            if depth == 0:
+                self.local.requested = requested
+                self.local.acquired = time.perf_counter()
+            self.local.depth = depth + 1
+        return acquired
+
+    def release(self):
+        self.local.depth -= 1
+        outermost = self.local.depth == 0
+        if outermost:
+            requested, acquired = self.local.requested, self.local.acquired
+            released = time.perf_counter()
+        self.lock.release()
+        if outermost:
+            self.on_release(acquired - requested, released - acquired)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
@@ -0,0 +1,204 @@
+import itertools
+import random
+import threading
+import time
+
+
+class PeerRtt:
+    __slots__ = ("srtt", "rttvar", "last", "min", "samples", "lost")
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.last = None
+        self.min = None
+        self.samples = 0
+        self.lost = 0
+
+
+class ProbeEngine:
+    """Nonce-tagged PING/PONG probes multiplexed over one socket.
+
+    `send(data, address)` transmits `PING <nonce>` from the health socket;
+    the peer echoes `PONG <nonce>` back to it, and whoever reads that socket
+    passes the datagram to `handle`. Any number of probes can be in flight:
+    `probe` registers a callback, `probe_many` sends to every peer at once
+    and blocks until all answered or `timeout` passed, so checking N peers
+    costs one timeout instead of N. `expire` fires the callbacks of probes
+    that timed out and must be called every few hundred milliseconds.
+
+    Each answer updates a smoothed RTT per peer (RFC 6298 estimator);
+    `rtt(ip)` and `timeout_for(ip)` expose it to the rest of the server.
+    Peers are bare ips on `port` unless `address_of(peer)` and
+    `peer_of(address)` map them to and from socket addresses.
+    """
+    def __init__(
+        self,
+        send,
+        port=12346,
+        clock=time.monotonic,
+        min_timeout=0.05,
+        max_timeout=2.0,
+        address_of=None,
+        peer_of=None,
+    ):
+        self.send = send
+        self.port = port
+        self.address_of = address_of or (lambda peer: (peer, port))
+        self.peer_of = peer_of or (lambda address: address[0])
+        self.clock = clock
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+        # Random start so a PONG meant for a previous run of this node never matches.
+        self.nonces = itertools.count(random.getrandbits(32))
+        self.pending = {}
+        self.peers = {}
+        self.condition = threading.Condition()
+        self.stats = {"sent": 0, "answered": 0, "timeouts": 0, "unmatched": 0}
+
+    def probe(self, ip, timeout=0.1, callback=None):
+        """Send one probe to `ip`; `callback(ip, alive, rtt)` runs when it answers or expires."""
+        with self.condition:
+            nonce = self._register(ip, timeout, callback)
+        self._send(ip, nonce)
+        return nonce
+
+    def probe_many(self, ips, timeout=0.1):
+        """Probe every ip in `ips` concurrently and return `{ip: alive}`."""
+        ips = list(dict.fromkeys(ip for ip in ips if ip))
+        results = {}
+        if not ips:
+            return results
+        with self.condition:
+            nonces = {self._register(ip, timeout, None): ip for ip in ips}
+        for nonce, ip in nonces.items():
+            self._send(ip, nonce)
+        deadline = self.clock() + timeout
+        with self.condition:
+            while True:
+                for nonce, ip in nonces.items():
+                    entry = self.pending.get(nonce)
+                    if entry is not None and entry["alive"] is not None:
+                        results[ip] = entry["alive"]
+                if len(results) == len(nonces):
+                    break
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            for nonce, ip in nonces.items():
+                self.pending.pop(nonce, None)
+                if ip not in results:
+                    results[ip] = False
+                    self._lost(ip)
+        return results
+
+    def ping(self, ip, timeout=0.1):
+        return self.probe_many([ip], timeout).get(ip, False)
+
+    def handle(self, data, address):
+        """Consume a `PONG <nonce>` datagram; return True if it answered a probe."""
+        try:
+            nonce = int(data.split(b" ", 1)[1])
+        except (IndexError, ValueError):
+            return False
+        now = self.clock()
+        peer = self.peer_of(address)
+        with self.condition:
+            entry = self.pending.get(nonce)
+            if entry is None or entry["ip"] != peer or entry["alive"] is not None:
+                self.stats["unmatched"] += 1
+                return False
+            rtt = now - entry["sent"]
+            self._sample(entry["ip"], rtt)
+            callback = entry["callback"]
+            if callback is None:
+                entry["alive"] = True
+                self.condition.notify_all()
+            else:
+                del self.pending[nonce]
+        if callback is not None:
+            callback(peer, True, rtt)
+        return True
+
+    def expire(self):
+        """Fail callback probes whose timeout passed."""
+        now = self.clock()
+        expired = []
+        with self.condition:
+            for nonce, entry in list(self.pending.items()):
+                if entry["callback"] is not None and now >= entry["deadline"]:
+                    del self.pending[nonce]
+                    self._lost(entry["ip"])
+                    expired.append(entry)
+        for entry in expired:
+            entry["callback"](entry["ip"], False, None)
+
+    def rtt(self, ip):
+        """Return `{srtt, rttvar, last, min, samples, lost}` for `ip` (seconds), or None."""
+        with self.condition:
+            peer = self.peers.get(ip)
+            if peer is None:
+                return None
+            return {name: getattr(peer, name) for name in PeerRtt.__slots__}
+
+    def timeout_for(self, ip, default=0.1):
+        """Retransmission timeout for `ip`: srtt + 4 * rttvar, clamped; `default` before any sample."""
+        with self.condition:
+            peer = self.peers.get(ip)
+            if peer is None or peer.srtt is None:
+                return default
+            return min(self.max_timeout, max(self.min_timeout, peer.srtt + 4 * peer.rttvar))
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "in_flight": len(self.pending),
+                "stats": dict(self.stats),
+                "peers": {
+                    ip: {
+                        "srtt_ms": None if peer.srtt is None else round(peer.srtt * 1000, 3),
+                        "min_ms": None if peer.min is None else round(peer.min * 1000, 3),
+                        "samples": peer.samples,
+                        "lost": peer.lost,
+                    }
+                    for ip, peer in sorted(self.peers.items())
+                },
+            }
+
+    def _register(self, ip, timeout, callback):
+        nonce = next(self.nonces)
+        now = self.clock()
+        self.pending[nonce] = {
+            "ip": ip,
+            "sent": now,
+            "deadline": now + timeout,
+            "callback": callback,
+            "alive": None,
+        }
+        self.stats["sent"] += 1
+        return nonce
+
+    def _send(self, ip, nonce):
+        try:
+            self.send(f"PING {nonce}".encode(), self.address_of(ip))
+        except OSError:
+            pass
+
+    def _sample(self, ip, rtt):
+        peer = self.peers.setdefault(ip, PeerRtt())
+        if peer.srtt is None:
+            peer.srtt = rtt
+            peer.rttvar = rtt / 2
+        else:
+            peer.rttvar = 0.75 * peer.rttvar + 0.25 * abs(peer.srtt - rtt)
+            peer.srtt = 0.875 * peer.srtt + 0.125 * rtt
+        peer.last = rtt
+        peer.min = rtt if peer.min is None else min(peer.min, rtt)
+        peer.samples += 1
+        self.stats["answered"] += 1
+
+    def _lost(self, ip):
+        self.peers.setdefault(ip, PeerRtt()).lost += 1
+        self.stats["timeouts"] += 1
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from shared_profiling import (
+    PROFILE_MODES,
+    ProfileError,
+    Profiler,
+)
+
+
+__all__ = [
+    "PROFILE_MODES",
+    "ProfileError",
+    "Profiler",
+]
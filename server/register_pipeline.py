@@ -0,0 +1,196 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class StageStats:
+    """Queue depth and latency counters for one pipeline stage."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.handled = 0
+        self.wait_seconds = 0.0
+        self.service_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def enqueued(self):
+        with self.lock:
+            self.queued += 1
+        return time.perf_counter()
+
+    def started(self, enqueued_at):
+        now = time.perf_counter()
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_seconds += now - enqueued_at
+        return now
+
+    def finished(self, enqueued_at, started_at):
+        now = time.perf_counter()
+        with self.lock:
+            self.active -= 1
+            self.handled += 1
+            self.service_seconds += now - started_at
+            self.max_seconds = max(self.max_seconds, now - enqueued_at)
+
+    def depth(self):
+        with self.lock:
+            return self.queued + self.active
+
+    def snapshot(self):
+        with self.lock:
+            handled = self.handled or 1
+            return {
+                "queued": self.queued,
+                "active": self.active,
+                "handled": self.handled,
+                "avg_wait_ms": round(self.wait_seconds / handled * 1000, 3),
+                "avg_service_ms": round(self.service_seconds / handled * 1000, 3),
+                "max_ms": round(self.max_seconds * 1000, 3),
+            }
+
+
+def create_cpu_executor(kind, workers):
+    """Return `(executor, kind)`, falling back to threads when processes are unavailable.
+
+    Workers come from a forkserver (spawn where there is none), never a
+    plain fork: the server already runs threads such as the logging
+    listener, and a forked child would inherit the locks they hold.
+    """
+    if kind == "process":
+        try:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            return ProcessPoolExecutor(max_workers=workers, mp_context=context), "process"
+        except (ImportError, NotImplementedError, OSError):
+            pass
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flock-verify"), "thread"
+
+
+class RegisterPipeline:
+    """REGISTER split into verify -> store -> replicate stages.
+
+    `verify(public_key, payload, signature)` runs on a CPU pool (processes
+    where available, so the GIL does not serialise RSA). `store(request,
+    verified)` runs on a single writer thread and returns the records to
+    replicate, or None; `replicate(request, records)` runs on its own thread
+    so replica fan-out never delays the next write. Until `start()` is called
+    every stage runs inline on the caller's thread.
+    """
+    def __init__(self, verify, store, replicate, cpu_workers=2, executor_kind="process", warm_up=None, on_error=None):
+        self.verify = verify
+        self.store = store
+        self.replicate = replicate
+        self.cpu_workers = max(1, int(cpu_workers))
+        self.executor_kind = executor_kind
+        self.warm_up = warm_up
+        self.on_error = on_error
+
+        self.stats = {name: StageStats() for name in ("verify", "store", "replicate")}
+        self.store_queue = queue.Queue()
+        self.replicate_queue = queue.Queue()
+        self.executor = None
+        self.threads = []
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.executor, self.executor_kind = create_cpu_executor(self.executor_kind, self.cpu_workers)
+        if self.warm_up is not None:
+            self.executor.submit(self.warm_up).result()
+        self.running = True
+        for name, target in (("store", self._store_worker), ("replicate", self._replicate_worker)):
+            thread = threading.Thread(target=target, name=f"flock-register-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.store_queue.put(None)
+        self.replicate_queue.put(None)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def depth(self):
+        """Requests admitted but not yet stored."""
+        return self.stats["verify"].depth() + self.stats["store"].depth()
+
+    def submit(self, request, verified=None):
+        """Admit `request`; a known `verified` result skips the CPU stage."""
+        if not self.running:
+            if verified is None:
+                verified = self._run("verify", request, self.verify, request["public_key"], request["payload"], request["signature"])
+            records = self._run("store", request, self.store, request, verified)
+            if records:
+                self._run("replicate", request, self.replicate, request, records)
+            return
+
+        if verified is not None:
+            self._enqueue(self.store_queue, "store", (request, verified))
+            return
+        stats = self.stats["verify"]
+        enqueued_at = stats.enqueued()
+        future = self.executor.submit(self.verify, request["public_key"], request["payload"], request["signature"])
+        # Process pools cannot report when a worker picks a task up, so the
+        # verify stage's wait time is folded into its service time.
+        started_at = stats.started(enqueued_at)
+        future.add_done_callback(lambda done: self._verified(request, done, enqueued_at, started_at))
+
+    def snapshot(self):
+        payload = {name: stats.snapshot() for name, stats in self.stats.items()}
+        payload["executor"] = self.executor_kind if self.running else "inline"
+        return payload
+
+    def _verified(self, request, future, enqueued_at, started_at):
+        self.stats["verify"].finished(enqueued_at, started_at)
+        try:
+            verified = future.result()
+        except Exception as e:
+            self._error(request, e)
+            verified = False
+        self._enqueue(self.store_queue, "store", (request, verified))
+
+    def _enqueue(self, stage_queue, name, item):
+        stage_queue.put((self.stats[name].enqueued(), item))
+
+    def _store_worker(self):
+        while True:
+            job = self.store_queue.get()
+            if job is None:
+                return
+            enqueued_at, (request, verified) = job
+            records = self._timed("store", enqueued_at, request, self.store, request, verified)
+            if records:
+                self._enqueue(self.replicate_queue, "replicate", (request, records))
+
+    def _replicate_worker(self):
+        while True:
+            job = self.replicate_queue.get()
+            if job is None:
+                return
+            enqueued_at, (request, records) = job
+            self._timed("replicate", enqueued_at, request, self.replicate, request, records)
+
+    def _run(self, name, request, handler, *args):
+        return self._timed(name, self.stats[name].enqueued(), request, handler, *args)
+
+    def _timed(self, name, enqueued_at, request, handler, *args):
+        stats = self.stats[name]
+        started_at = stats.started(enqueued_at)
+        try:
+            return handler(*args)
+        except Exception as e:
+            self._error(request, e)
+            return None
+        finally:
+            stats.finished(enqueued_at, started_at)
+
+    def _error(self, request, error):
+        if self.on_error:
+            self.on_error(request, error)
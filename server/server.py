@@ -3,26 +3,28 @@ import threading
 import sys
 import json
 import db_manager
+import command_dispatcher
+import async_engine
+import merkle
+import metrics
+import swim
+import probe_engine
+import profiling
+import bounded_cache
+import register_pipeline
+import signature_verifier
+import wire_codec
+import endpoints
 import time
-import random
 import os
-import base64
 import hashlib
+import base64
+import secrets
 import ipaddress
+import bisect
 # from termcolor import colored as col
 import struct
-from logging_utils import configure_logger, log_event, summarize_command
-try:
-    from cryptography.hazmat.primitives import hashes, serialization
-    from cryptography.hazmat.primitives.asymmetric import padding
-    from cryptography.exceptions import InvalidSignature
-except ModuleNotFoundError:
-    hashes = None
-    serialization = None
-    padding = None
-
-    class InvalidSignature(Exception):
-        pass
+from logging_utils import configure_logger, log_enabled, log_event, logging_stats, summarize_command
 
 
 logger = configure_logger("flock.server", "server.log")
@@ -32,6 +34,54 @@ HASH_MOD = 10**18+3
 FAIL_TOLERANCE = int(os.environ.get("FLOCK_FAIL_TOLERANCE", "3"))
 REPLICA_FULL_SYNC_INTERVAL = float(os.environ.get("FLOCK_REPLICA_FULL_SYNC_INTERVAL", "30"))
 STATUS_LOG_INTERVAL = float(os.environ.get("FLOCK_STATUS_LOG_INTERVAL", "30"))
+FINGER_FIX_INTERVAL = float(os.environ.get("FLOCK_FINGER_FIX_INTERVAL", "1"))
+SWIM_PROBE_INTERVAL = float(os.environ.get("FLOCK_SWIM_PROBE_INTERVAL", "1"))
+SWIM_PROBE_TIMEOUT = float(os.environ.get("FLOCK_SWIM_PROBE_TIMEOUT", "0.3"))
+SWIM_INDIRECT_PROBES = int(os.environ.get("FLOCK_SWIM_INDIRECT_PROBES", "3"))
+SWIM_SUSPECT_TIMEOUT = float(os.environ.get("FLOCK_SWIM_SUSPECT_TIMEOUT", "3"))
+SWIM_TICK_INTERVAL = 0.1
+STABILIZE_INTERVAL = float(os.environ.get("FLOCK_STABILIZE_INTERVAL", "1"))
+RING_REPAIR_GRACE = float(os.environ.get("FLOCK_RING_REPAIR_GRACE", "10"))
+REPLICA_RING_SPAN = int(os.environ.get("FLOCK_REPLICA_RING_SPAN", str(FAIL_TOLERANCE)))
+FINGER_COUNT = HASH_MOD.bit_length()
+MAX_ROUTE_HOPS = int(os.environ.get("FLOCK_MAX_ROUTE_HOPS", "64"))
+COMMAND_WORKERS = int(os.environ.get("FLOCK_COMMAND_WORKERS", "8"))
+COMMAND_QUEUE_SIZE = int(os.environ.get("FLOCK_COMMAND_QUEUE_SIZE", "256"))
+REPLICA_ACK_TIMEOUT = float(os.environ.get("FLOCK_REPLICA_ACK_TIMEOUT", "5"))
+REPLICA_BATCH_BYTES = int(os.environ.get("FLOCK_REPLICA_BATCH_BYTES", "60000"))
+HANDOFF_TIMEOUT = float(os.environ.get("FLOCK_HANDOFF_TIMEOUT", "30"))
+HANDOFF_ROUNDS = 4
+HANDOFF_PAGE_ROWS = 512
+SNAPSHOT_PAGE_BYTES = int(os.environ.get("FLOCK_SNAPSHOT_PAGE_BYTES", "60000"))
+SNAPSHOT_ENVELOPE_BYTES = 256
+MERKLE_BUCKETS = int(os.environ.get("FLOCK_MERKLE_BUCKETS", "1024"))
+MERKLE_NODES_PER_REQUEST = 256
+ANTI_ENTROPY_INTERVAL = float(os.environ.get("FLOCK_ANTI_ENTROPY_INTERVAL", "60"))
+JOIN_SPLIT_QUANTILE = float(os.environ.get("FLOCK_JOIN_SPLIT_QUANTILE", "0.5"))
+JOIN_MIN_RECORDS = int(os.environ.get("FLOCK_JOIN_MIN_RECORDS", "2"))
+VNODE_TOKENS = int(os.environ.get("FLOCK_VNODE_TOKENS", "8"))
+VNODE_CHECK_INTERVAL = float(os.environ.get("FLOCK_VNODE_CHECK_INTERVAL", "5"))
+SIGNATURE_CACHE_SIZE = int(os.environ.get("FLOCK_SIGNATURE_CACHE_SIZE", "4096"))
+SIGNATURE_CACHE_TTL = float(os.environ.get("FLOCK_SIGNATURE_CACHE_TTL", "30"))
+RESOLVE_CACHE_SIZE = int(os.environ.get("FLOCK_RESOLVE_CACHE_SIZE", "4096"))
+RESOLVE_CACHE_TTL = float(os.environ.get("FLOCK_RESOLVE_CACHE_TTL", "5"))
+RESOLVE_NEGATIVE_TTL = float(os.environ.get("FLOCK_RESOLVE_NEGATIVE_TTL", "2"))
+RESOLVE_PENDING_TTL = float(os.environ.get("FLOCK_RESOLVE_PENDING_TTL", "2"))
+REGISTER_VERIFY_POOL = os.environ.get("FLOCK_REGISTER_VERIFY_POOL", "process").strip().lower()
+REGISTER_VERIFY_WORKERS = int(os.environ.get("FLOCK_REGISTER_VERIFY_WORKERS", str(min(4, os.cpu_count() or 1))))
+REGISTER_PIPELINE_DEPTH = int(os.environ.get("FLOCK_REGISTER_PIPELINE_DEPTH", str(COMMAND_QUEUE_SIZE)))
+METRICS_FILE = os.environ.get("FLOCK_METRICS_FILE", "").strip()
+METRICS_INTERVAL = float(os.environ.get("FLOCK_METRICS_INTERVAL", "15"))
+HOT_HANDLER_ROWS = 10
+SERVER_ENGINE = os.environ.get("FLOCK_SERVER_ENGINE", "threads").strip().lower()
+SERVER_PORT = endpoints.configured_port()
+HEALTH_PORT = SERVER_PORT + endpoints.HEALTH_PORT_OFFSET
+BIND_ADDRESS = endpoints.configured_bind_address()
+SEED_SERVERS = [seed.strip() for seed in os.environ.get("FLOCK_SEEDS", "").split(",") if seed.strip()]
+MCAST_GRP = "224.0.0.1"
+MCAST_PORT = endpoints.configured_mcast_port()
+MCAST_DISCOVER_MSG = "DISCOVER_SERVER"
+FORWARDED_RESOLUTIONS = ("forwarded_predecessor", "forwarded_successor", "forwarded_finger", "forwarded_vnode")
 
 
 class ChatServer:
@@ -49,8 +99,18 @@ class ChatServer:
         self.ping_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.ping_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-        self.db_manager = db_manager.server_db()
-        self.db_lock = threading.RLock()
+        # Fire-and-forget sends (forwards, replicas, NOTIFY) leave from the
+        # command socket, so their source address is this node's endpoint;
+        # the asyncio engine swaps it for its command transport.
+        self.outbound_socket = self.command_socket
+
+        # Counters, gauges and latency histograms served by METRICS; the
+        # database lock reports how long each critical section held it.
+        self.metrics = metrics.MetricsRegistry()
+        # On-demand PROFILE sessions; cprofile mode sees the command handlers.
+        self.profiler = profiling.Profiler(self.name)
+        self.db_manager = db_manager.server_db(hash_function=self.rolling_hash)
+        self.db_lock = metrics.TimedLock(self.observe_db_lock)
 
         self.lower_bound = 0
         self.upper_bound = HASH_MOD - 1
@@ -59,8 +119,98 @@ class ChatServer:
         self.successor = None
         self.successors = []
 
+        # Highest ring epoch seen. Every topology change this node makes bumps
+        # it, and NOTIFY/STABILIZE/PRED_CHANGE carry it, so a repair overtaken
+        # by a newer one is dropped instead of applied twice.
+        self.ring_epoch = 0
+        # Epoch and last advertised (lower, upper) of the current predecessor,
+        # and when it was confirmed dead without anyone notifying us since.
+        self.predecessor_epoch = 0
+        self.predecessor_range = None
+        self.orphaned_at = None
+
         self.replics = []
         self.replicants = []
+        # REPLIC handlers add owners from several dispatcher workers while
+        # DROP_REPLICS and `replicants_manager` remove them.
+        self.replicants_lock = threading.Lock()
+
+        # Servers are identified by `ip:port` endpoints (see shared_endpoints)
+        # in every pointer below, so several nodes can share one host.
+
+        # finger index -> (endpoint, lower_bound, upper_bound) of the node owning
+        # `upper_bound + 2**index`; refreshed in the background by `fix_fingers`.
+        self.fingers = {}
+        self.next_finger = 0
+        # replica endpoint -> last change_seq it acknowledged, and the batch
+        # currently awaiting REPLIC_ACKs (seq, frames acked, first send time).
+        self.replica_watermarks = {}
+        self.replica_inflight = {}
+
+        # Virtual-node tokens. A range absorbed from a failed neighbour is cut
+        # into tokens and dealt to other servers: (lower, upper) -> delegate endpoint
+        # for tokens we handed out, (lower, upper) -> {"owner", "misses"} for
+        # tokens another server handed to us.
+        self.vnode_delegations = {}
+        self.adopted_tokens = {}
+
+        # sha256(fingerprint|payload|signature) -> verification result. Parsed
+        # keys live in `signature_verifier.PUBLIC_KEY_CACHE` of the process
+        # that verifies: each worker of a process pool keeps its own.
+        self.signature_cache = bounded_cache.LRUCache(SIGNATURE_CACHE_SIZE, ttl=SIGNATURE_CACHE_TTL)
+        # username -> (ip, port, public_key, version) learned from owners'
+        # RESOLVED fills, and usernames an owner recently answered 404 for.
+        self.resolve_cache = bounded_cache.LRUCache(RESOLVE_CACHE_SIZE, ttl=RESOLVE_CACHE_TTL)
+        self.resolve_miss_cache = bounded_cache.LRUCache(RESOLVE_CACHE_SIZE, ttl=RESOLVE_NEGATIVE_TTL)
+        # request id -> RESOLVE we forwarded; a RESOLVED fill is only trusted
+        # when it names one of these and comes from the hop it was sent to.
+        self.pending_resolves = bounded_cache.LRUCache(RESOLVE_CACHE_SIZE, ttl=RESOLVE_PENDING_TTL)
+        self.register_pipeline = register_pipeline.RegisterPipeline(
+            verify=signature_verifier.verify,
+            store=self.store_registration,
+            replicate=self.replicate_registration,
+            cpu_workers=REGISTER_VERIFY_WORKERS,
+            executor_kind=REGISTER_VERIFY_POOL,
+            warm_up=signature_verifier.warm_up,
+            on_error=self.on_register_error,
+        )
+
+        # scope -> MerkleTree, kept current from `take_merkle_changes`
+        self.merkle_cache = {}
+
+        self.failure_detector = swim.SwimDetector(
+            self.endpoint,
+            self.send_probe,
+            probe_interval=SWIM_PROBE_INTERVAL,
+            probe_timeout=SWIM_PROBE_TIMEOUT,
+            indirect_probes=SWIM_INDIRECT_PROBES,
+            suspect_timeout=SWIM_SUSPECT_TIMEOUT,
+            address_of=endpoints.health_address,
+            member_of=endpoints.endpoint_of_health,
+            on_change=self.on_member_change,
+        )
+        # Nonce-tagged PINGs over the health socket, with RTT stats per peer.
+        self.probe_engine = probe_engine.ProbeEngine(
+            self.send_probe,
+            address_of=endpoints.health_address,
+            peer_of=endpoints.endpoint_of_health,
+        )
+        # ((owned seq, replica seq), [(cursor key, entry, encoded size)])
+        self.snapshot_cache = None
+        # Range offered to a joining node and not yet committed, and the
+        # last committed handoff so a retransmitted commit gets the same reply.
+        self.pending_handoff = None
+        self.completed_handoff = None
+
+        self.dispatcher = command_dispatcher.CommandDispatcher(
+            workers=COMMAND_WORKERS,
+            queue_size=COMMAND_QUEUE_SIZE,
+            on_error=self.on_command_error,
+            observer=self.observe_command,
+            runner=self.profiler.call,
+        )
+        self.register_command_handlers()
+        self.register_metrics()
 
         self.running = True
         self.crisis = False
@@ -73,6 +223,9 @@ class ChatServer:
                 "fail_tolerance": FAIL_TOLERANCE,
                 "replica_full_sync_interval": REPLICA_FULL_SYNC_INTERVAL,
                 "status_log_interval": STATUS_LOG_INTERVAL,
+                "command_workers": COMMAND_WORKERS,
+                "command_queue_size": COMMAND_QUEUE_SIZE,
+                "virtual_nodes": VNODE_TOKENS,
             },
         )
 
@@ -130,28 +283,56 @@ class ChatServer:
         """Initialize DB, discover/join other servers and start background services."""
         with self.db_lock:
             self.db_manager.set_db(self.name)
+        # Start the verification workers now so the first REGISTER does not pay for it.
+        self.register_pipeline.start()
 
         self.print_banner("Arrancando nodo servidor")
         servers = self.discover_servers()
 
+        # Bind before joining: once the handoff commits, the ring forwards our
+        # range here and those requests wait in the socket buffer until the
+        # listeners start instead of being dropped.
+        self.command_socket.bind((BIND_ADDRESS, SERVER_PORT))
+        self.ping_socket.bind((BIND_ADDRESS, HEALTH_PORT))
+
         if not servers:
             logger.info("[OK] No se detectaron otros servidores; este nodo inicia el anillo")
         else:
             for server in servers:
                 logger.info("[OK] Nodo descubierto: %s (%s)", server[0], server[1])
+            self.failure_detector.add_members(server[1] for server in servers)
             self.join_to_servers(servers)
 
-        self.command_socket.bind(("", 12345))
-        self.ping_socket.bind(("", 12346))
-
         self.print_info()
 
-        threading.Thread(target=self.tape_integrity_check, daemon=True).start()
+        if SERVER_ENGINE == "asyncio":
+            logger.info("[OK] Motor asyncio activo para '%s'", self.name)
+            async_engine.run(
+                self,
+                logger,
+                finger_interval=FINGER_FIX_INTERVAL,
+                status_interval=STATUS_LOG_INTERVAL,
+                anti_entropy_interval=ANTI_ENTROPY_INTERVAL,
+                vnode_interval=VNODE_CHECK_INTERVAL,
+                swim_interval=SWIM_TICK_INTERVAL,
+                stabilize_interval=STABILIZE_INTERVAL,
+                metrics_interval=METRICS_INTERVAL if METRICS_FILE else 0,
+            )
+            return
+
+        threading.Thread(target=self.membership_manager, daemon=True).start()
+        threading.Thread(target=self.stabilizer, daemon=True).start()
         threading.Thread(target=self.successors_provider, daemon=True).start()
         threading.Thread(target=self.listen_for_ping, daemon=True).start()
         threading.Thread(target=self.replics_manager, daemon=True).start()
         threading.Thread(target=self.info_updater, daemon=True).start()
         threading.Thread(target=self.multicast_listener, daemon=True).start()
+        threading.Thread(target=self.fix_fingers, daemon=True).start()
+        threading.Thread(target=self.anti_entropy, daemon=True).start()
+        threading.Thread(target=self.vnode_manager, daemon=True).start()
+        threading.Thread(target=self.metrics_writer, daemon=True).start()
+
+        self.dispatcher.start()
 
         logger.info("[OK] Servicios de fondo iniciados para '%s'", self.name)
         self.listen_for_messages()
@@ -160,35 +341,94 @@ class ChatServer:
         logger.info("=" * 72)
         logger.info("Flock Server | %s", title)
         logger.info("=" * 72)
-        logger.info("Nodo: %s | IP local: %s | Puerto comandos: 12345 | Puerto health: 12346", self.name, self.get_ip())
-        logger.info("Replicas configuradas: %s | Sync replicas: cada %.1fs", FAIL_TOLERANCE, REPLICA_FULL_SYNC_INTERVAL)
+        logger.info(
+            "Nodo: %s | IP local: %s | Puerto comandos: %s | Puerto health: %s",
+            self.name,
+            self.get_ip(),
+            SERVER_PORT,
+            HEALTH_PORT,
+        )
+        logger.info("Replicas configuradas: %s | Sync completo tras %.1fs sin ACK", FAIL_TOLERANCE, REPLICA_FULL_SYNC_INTERVAL)
         logger.info("-" * 72)
 
 
     def discover_servers(self):
-        """Discover other servers using UDP broadcast and return a list of (name, ip)."""
+        """Discover other servers and return a list of (name, endpoint).
+
+        DISCOVER is broadcast to the default command port and sent to every
+        FLOCK_SEEDS endpoint, which is how nodes on other ports of the same
+        host (where broadcast cannot reach) find each other.
+        """
+        own_endpoint = self.endpoint()
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
             sock.settimeout(1)
-            servers = []
-            broadcast_address = ("<broadcast>", 12345)
+            servers = {}
+            broadcast_address = ("<broadcast>", endpoints.DEFAULT_PORT)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
             try:
                 sock.sendto("DISCOVER".encode(), broadcast_address)
+            except OSError as e:
+                logger.warning("Broadcast discovery failed: %s", e)
+            for seed in SEED_SERVERS:
+                try:
+                    sock.sendto("DISCOVER".encode(), endpoints.command_address(seed))
+                except (OSError, ValueError) as e:
+                    logger.warning("Could not reach seed %s: %s", seed, e)
+            try:
                 while True:
                     data, address = sock.recvfrom(1024)
-                    server_name = data.decode()
-                    servers.append((server_name, address[0]))
+                    server_name, endpoint = self.parse_discover_reply(data.decode(), address)
+                    if endpoint != own_endpoint:
+                        servers[endpoint] = (server_name, endpoint)
             except socket.timeout:
                 pass
 
-            logger.info("[OK] Descubrimiento broadcast encontro %s nodo(s)", len(servers))
-            return servers
+            logger.info("[OK] Descubrimiento encontro %s nodo(s)", len(servers))
+            return list(servers.values())
+
+    def parse_discover_reply(self, reply, address):
+        """Return `(name, endpoint)` from a `<name> <endpoint>` DISCOVER reply.
+
+        Older servers answer with the bare name; their endpoint is the reply's source.
+        """
+        server_name, _, endpoint = reply.partition(" ")
+        try:
+            return server_name, endpoints.normalize_endpoint(endpoint)
+        except ValueError:
+            return reply, endpoints.format_endpoint(*address)
 
     def join_to_servers(self, servers):
-        """Join the cluster by requesting to join the server that manages the largest range."""
-        longest_range_server = self.get_longest_range_server(servers)
-        logger.info("Joining cluster through server %s", longest_range_server)
-        self.request_join(longest_range_server)
+        """Join the cluster by requesting to join the server that holds the most records."""
+        busiest_server = self.get_busiest_server(servers)
+        logger.info("Joining cluster through server %s", busiest_server)
+        self.request_join(busiest_server)
+
+    def get_busiest_server(self, servers):
+        """Query servers with LOAD and return the one owning the most records.
+
+        Ties (for example an empty cluster) fall back to the widest range.
+        """
+        busiest_load = None
+        busiest_server = None
+        for server in servers:
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.settimeout(3)
+                    sock.sendto(b"LOAD", endpoints.command_address(server[1]))
+                    data, _ = sock.recvfrom(1024)
+                    response = data.decode()
+                    if response.startswith("OK"):
+                        _, lower_bound, upper_bound, records = response.split(" ")
+                        load = (int(records), int(upper_bound) - int(lower_bound))
+                        if busiest_load is None or load > busiest_load:
+                            busiest_server = server
+                            busiest_load = load
+            except Exception as e:
+                logger.warning(f"Error getting load from server '{server[0]}': {e}")
+
+        if busiest_server is None:
+            return self.get_longest_range_server(servers)
+        return busiest_server
 
     def get_longest_range_server(self, servers):
         """Query servers for their range and return the server with largest range."""
@@ -198,7 +438,7 @@ class ChatServer:
             try:
                 with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
                     sock.settimeout(3)
-                    sock.sendto(f"RANGE".encode(), (server[1], 12345))
+                    sock.sendto(f"RANGE".encode(), endpoints.command_address(server[1]))
                     data, _ = sock.recvfrom(1024)
                     response = data.decode()
                     if response.startswith("OK"):
@@ -217,18 +457,19 @@ class ChatServer:
         """Send a JOIN request to `server` and initialize local bounds & neighbors on success."""
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
             sock.settimeout(1)
-            sock.sendto(f"JOIN".encode(), (server[1], 12345))
+            sock.sendto(f"JOIN {self.endpoint()}".encode(), endpoints.command_address(server[1]))
             data, _ = sock.recvfrom(1024)
             response = data.decode()
             if response.startswith("OK"):
                 _, lower_bound, upper_bound, predecessor, successor = response.split()
                 self.lower_bound = int(lower_bound)
                 self.upper_bound = int(upper_bound)
-                self.predecessor = predecessor
+                self.predecessor = endpoints.normalize_endpoint(predecessor)
                 if successor != "_":
-                    self.successor = successor
+                    self.successor = endpoints.normalize_endpoint(successor)
                 else:
                     self.successor = None
+                records = self.pull_handoff(server[1], self.lower_bound, self.upper_bound)
                 log_event(
                     logger,
                     "INFO",
@@ -236,25 +477,25 @@ class ChatServer:
                     node=self.name,
                     peer=server[1],
                     range={"lower": self.lower_bound, "upper": self.upper_bound},
-                    result={"predecessor": self.predecessor, "successor": self.successor},
+                    result={"predecessor": self.predecessor, "successor": self.successor, "records": records},
                 )
             else:
                 logger.error(f"Joining request failed: {response}") 
                 raise ValueError
 
     def get_successors(self):
-        """Return a list of successor IPs queried from the current successor node."""
+        """Return a list of successor endpoints queried from the current successor node."""
         successors = []
         if self.successor:
             with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
                 try:
                     sock.settimeout(0.5)
-                    sock.sendto(f"SUCC {FAIL_TOLERANCE+1}".encode(), (self.successor, 12345))
+                    sock.sendto(f"SUCC {FAIL_TOLERANCE+1}".encode(), endpoints.command_address(self.successor))
                     data, _ = sock.recvfrom(1024)
                     response = data.decode()
                     if response.startswith("OK"):
                         _, successors = response.split(" ", 1)
-                        successors = successors.split(" ")
+                        successors = [endpoints.normalize_endpoint(successor) for successor in successors.split(" ")]
                     else:
                         successors = self.successors
                 except Exception as e:
@@ -266,211 +507,651 @@ class ChatServer:
 
     #region Commands
 
+    def register_command_handlers(self):
+        """Build the verb-keyed handler table used by `listen_for_messages`.
+
+        Cheap replies run inline on the receive thread; everything that touches
+        crypto, SQLite or the network is queued. Topology changes share one
+        serial lane so JOIN/FIX/NOTIFY/PRED_CHANGE/SUCC never interleave.
+        """
+        dispatcher = self.dispatcher
+        for verb, handler in (
+            ("DISCOVER", self.handle_discover),
+            ("PING", self.handle_ping),
+            ("RANGE", self.handle_range),
+            ("STABILIZE", self.handle_stabilize),
+            ("FIND_OWNER", self.handle_find_owner),
+            ("VNODE_CHECK", self.handle_vnode_check),
+            ("RESOLVED", self.handle_resolved),
+            ("WIRE", self.handle_wire),
+            ("STATUS", self.handle_status),
+            ("METRICS", self.handle_metrics),
+            ("KILL", self.handle_kill),
+        ):
+            dispatcher.register(verb, handler, inline=True)
+
+        for verb, handler in (
+            ("JOIN", self.handle_join),
+            ("PRED_CHANGE", self.handle_pred_change),
+            ("NOTIFY", self.handle_notify),
+            ("SUCC", self.handle_succ),
+            ("FIX", self.handle_fix),
+            ("HANDOFF_COMMIT", self.handle_handoff_commit),
+        ):
+            dispatcher.register(verb, handler, lane="topology", concurrency=1)
+
+        dispatcher.register("REGISTER", self.handle_register)
+        dispatcher.register("RESOLVE", self.handle_resolve)
+        dispatcher.register("REPLIC", self.handle_replic)
+        dispatcher.register("REPLIC_BATCH", self.handle_replic_batch)
+        dispatcher.register("REPLIC_ACK", self.handle_replic_ack, inline=True)
+        dispatcher.register("TAKEOVER", self.handle_takeover)
+        dispatcher.register("VNODE_ADOPT", self.handle_vnode_adopt)
+        dispatcher.register("HANDOFF", self.handle_handoff, lane="handoff", concurrency=1)
+        dispatcher.register("DROP_REPLICS", self.handle_drop_replics)
+        dispatcher.register("SNAPSHOT", self.handle_snapshot, lane="admin", concurrency=1)
+        dispatcher.register("LOAD", self.handle_load, lane="admin", concurrency=1)
+        dispatcher.register("PROFILE", self.handle_profile, lane="admin", concurrency=1)
+        dispatcher.register("CHECKSUM", self.handle_checksum, lane="admin", concurrency=1)
+        dispatcher.register("SYNC_FROM", self.handle_sync_from, lane="admin", concurrency=1)
+        dispatcher.register("MERKLE", self.handle_merkle, lane="admin", concurrency=1)
+        dispatcher.register("MERKLE_BUCKET", self.handle_merkle_bucket, lane="admin", concurrency=1)
+        dispatcher.register("RECONCILE", self.handle_reconcile, lane="admin", concurrency=1)
+
     def listen_for_messages(self):
-        """Main loop handling incoming UDP command messages on `self.command_socket`."""
+        """Main loop receiving UDP commands on `self.command_socket` and dispatching them."""
         while self.running:
             try:
                 data, address = self.command_socket.recvfrom(65535)
-                message = data.decode()
-
-                if message != "PING":
-                    command_summary = summarize_command(message)
-                    log_event(
-                        logger,
-                        "DEBUG",
-                        "command_received",
-                        node=self.name,
-                        peer=address[0],
-                        username=command_summary.get("username"),
-                        version=command_summary.get("version"),
-                        result=command_summary,
-                    )
-
-                if message.startswith("DISCOVER"):
-                    self.command_socket.sendto(f"{self.name}".encode(), address)
-
-                elif message.startswith("PING"):
-                    self.command_socket.sendto("PONG".encode(), address)
-
-                elif message.startswith("RANGE"):
-                    self.command_socket.sendto(f"OK {self.lower_bound} {self.upper_bound}".encode(), address)
-
-                elif message.startswith("STATUS"):
-                    self.send_json_response(address, self.status_payload())
-
-                elif message.startswith("SNAPSHOT"):
-                    self.send_json_response(address, self.snapshot_payload())
-
-                elif message.startswith("CHECKSUM"):
-                    self.send_json_response(address, self.checksum_payload())
-
-                elif message.startswith("SYNC_FROM"):
-                    try:
-                        _, owner = message.split(" ", 1)
-                    except ValueError:
-                        self.send_json_response(address, {"error": "missing owner"}, ok=False)
-                        continue
-                    self.send_json_response(address, self.sync_from_owner(owner.strip()))
-
-                elif message.startswith("JOIN"):
-                    log_event(logger, "INFO", "node_joined", node=self.name, peer=address[0], result="join_requested")
-                    self.process_join_request(address)
-                    self.print_info()
-
-                elif message.startswith("PRED_CHANGE"):
-                    _, predecessor = message.split(" ")
-                    self.change_predecessor(predecessor)
-                    self.print_info()
-
-                elif message.startswith("REGISTER"):
-                    payload = self.parse_register_message(message, address)
-                    if payload is None:
-                        log_event(
-                            logger,
-                            "WARNING",
-                            "register_rejected",
-                            node=self.name,
-                            peer=f"{address[0]}:{address[1]}",
-                            peer_ip=address[0],
-                            peer_port=address[1],
-                            phase="parse",
-                            reason="malformed_payload",
-                        )
-                        continue
-                    log_event(
-                        logger,
-                        "INFO",
-                        "register_received",
-                        node=self.name,
-                        peer=f"{address[0]}:{address[1]}",
-                        peer_ip=address[0],
-                        peer_port=address[1],
-                        phase="receive",
-                        username=payload["username"],
-                        version=payload["version"],
-                        advertised_ip=payload["ip"],
-                        result={"advertised_port": payload["port"]},
-                    )
-                    self.register_user(**payload)
-
-                elif message.startswith("RESOLVE"):
-                    try:
-                        _, answer_to_ip, answer_to_port, username = message.split(" ")  
-                    except Exception:
-                        _, username = message.split(" ")
-                        answer_to_ip = address[0]
-                        answer_to_port = address[1]
-                    log_event(
-                        logger,
-                        "INFO",
-                        "resolve_received",
-                        node=self.name,
-                        peer=f"{address[0]}:{address[1]}",
-                        peer_ip=address[0],
-                        peer_port=address[1],
-                        phase="receive",
-                        username=username,
-                        result={"answer_to": f"{answer_to_ip}:{answer_to_port}"},
-                    )
-                    self.resolve_user(answer_to_ip, int(answer_to_port), username)
-
-                elif message.startswith("SUCC"):
-                    _, successors = message.split(" ", 1)
-                    successors_list = successors.split(" ")
-                    self.successors = successors_list[: FAIL_TOLERANCE + 1]
-                    if self.predecessor:
-                        self.command_socket.sendto(f"SUCC {self.get_ip()} {successors}".encode(), (self.predecessor, 12345))
-
-                elif message.startswith("FIX"):
-                    self.crisis = True
-                    log_event(logger, "WARNING", "fix_started", node=self.name, peer=address[0], result="broadcast_received")
-                    self.fix_tape()
-                    self.replicants_manager()
-                    self.correct_bd()
-                    self.crisis = False
-
-                elif message.startswith("REPLIC"):
-                    try:
-                        _, username, ip, port, version, public_key = message.split(" ", 5)
-                    except ValueError:
-                        logger.warning("Rejected malformed REPLIC payload from %s", address)
-                        continue
-                    if address[0] not in self.replicants:
-                        self.replicants.append(address[0])
-                    with self.db_lock:
-                        resolution, stored = self.db_manager.upsert_replic_user(
-                            username,
-                            ip,
-                            int(port),
-                            public_key=public_key,
-                            version=int(version),
-                            owner=address[0],
-                        )
-                    if stored:
-                        log_event(
-                            logger,
-                            "INFO",
-                            "replica_written",
-                            node=self.name,
-                            peer=address[0],
-                            username=username,
-                            version=version,
-                            result=resolution,
-                        )
-                    else:
-                        logger.warning("Rejected replica for '%s' from %s (%s)", username, address[0], resolution)
-
-                elif message.startswith("TAKEOVER"):
-                    try:
-                        _, username, ip, port, version, public_key = message.split(" ", 5)
-                    except ValueError:
-                        logger.warning("Rejected malformed TAKEOVER payload from %s", address)
-                        continue
-                    self.place_user_record(
-                        username,
-                        ip,
-                        int(port),
-                        public_key,
-                        int(version),
-                    )
-                    logger.info("Accepted TAKEOVER for user '%s'", username)
-
-                elif message.startswith("DROP_REPLICS"):
-                    _, owner = message.split(" ")
-                    with self.db_lock:
-                        self.db_manager.drop_replics(owner)
-                    try:
-                        self.replicants.remove(owner)
-                    except Exception:
-                        pass
-
-                elif message.startswith("KILL"):
-                    self.running = False
-                    time.sleep(3)
-                    return
-
+                self.receive_command(data, address)
             except Exception as e:
                 logger.error(f"Server error: {e}")
+        self.dispatcher.stop()
+
+    def receive_command(self, data, address):
+        """Decode, log and dispatch one command datagram (shared by both engines).
+
+        Binary frames (see `shared_wire_codec`) are decoded to a `Frame`
+        that handlers accept in place of the text message.
+        """
+        if wire_codec.is_frame(data):
+            try:
+                message = wire_codec.decode(data)
+            except wire_codec.WireError as e:
+                log_event(
+                    logger,
+                    "WARNING",
+                    "command_rejected",
+                    node=self.name,
+                    peer=f"{address[0]}:{address[1]}",
+                    reason="malformed_frame",
+                    result={"error": str(e), "bytes": len(data)},
+                )
+                return "unknown"
+        else:
+            message = data.decode()
+
+        if message != "PING" and log_enabled(logger, "DEBUG"):
+            command_summary = summarize_command(data if isinstance(message, wire_codec.Frame) else message)
+            log_event(
+                logger,
+                "DEBUG",
+                "command_received",
+                node=self.name,
+                peer=address[0],
+                username=command_summary.get("username"),
+                version=command_summary.get("version"),
+                result=command_summary,
+            )
+
+        return self.dispatch_command(message, address)
+
+    def dispatch_command(self, message, address):
+        """Hand `message` to the dispatcher and answer BUSY when its queue is full."""
+        outcome = self.dispatcher.dispatch(message, address)
+        if outcome == "busy":
+            verb = self.dispatcher.verb_of(message)
+            self.command_socket.sendto(f"BUSY {verb}".encode(), address)
+            log_event(
+                logger,
+                "WARNING",
+                "command_rejected",
+                node=self.name,
+                peer=f"{address[0]}:{address[1]}",
+                reason="queue_full",
+                result={"command": verb},
+            )
+        return outcome
+
+    def on_command_error(self, message, address, error):
+        logger.error(f"Server error: {error}")
+
+    def handle_discover(self, message, address):
+        self.command_socket.sendto(f"{self.name} {self.endpoint()}".encode(), address)
+
+    def handle_ping(self, message, address):
+        self.command_socket.sendto("PONG".encode(), address)
+
+    def handle_range(self, message, address):
+        self.command_socket.sendto(f"OK {self.lower_bound} {self.upper_bound}".encode(), address)
+
+    def handle_stabilize(self, message, address):
+        """STABILIZE <epoch> <lower> <upper> [<endpoint>]: answer `OK <predecessor|_> <lower> <upper> <epoch>`."""
+        try:
+            _, epoch, lower_bound, upper_bound, *sender = message.split(" ")
+            epoch, lower_bound, upper_bound = int(epoch), int(lower_bound), int(upper_bound)
+            sender = self.claimed_endpoint(sender, address)
+        except ValueError:
+            self.command_socket.sendto(b"ERROR Malformed STABILIZE", address)
+            return
+        self.ring_epoch = max(self.ring_epoch, epoch)
+        if sender == self.predecessor:
+            self.predecessor_range = (lower_bound, upper_bound)
+        reply = f"OK {self.predecessor or '_'} {self.lower_bound} {self.upper_bound} {self.ring_epoch}"
+        self.command_socket.sendto(reply.encode(), address)
+
+    def handle_load(self, message, address):
+        with self.db_lock:
+            records = self.db_manager.count_users_in_range(self.lower_bound, self.upper_bound)
+        self.command_socket.sendto(f"OK {self.lower_bound} {self.upper_bound} {records}".encode(), address)
+
+    def handle_find_owner(self, message, address):
+        try:
+            _, key = message.split(" ")
+            key = int(key) % HASH_MOD
+        except ValueError:
+            self.command_socket.sendto(b"ERROR Invalid key", address)
+            return
+        self.command_socket.sendto(self.find_owner_response(key).encode(), address)
+
+    def handle_vnode_check(self, message, address):
+        try:
+            _, lower_bound, upper_bound, *sender = message.split(" ")
+            token = (int(lower_bound), int(upper_bound))
+            sender = self.claimed_endpoint(sender, address)
+        except ValueError:
+            self.command_socket.sendto(b"ERROR Invalid token", address)
+            return
+        verdict = "OK" if self.vnode_delegations.get(token) == sender else "RELEASE"
+        self.command_socket.sendto(verdict.encode(), address)
+
+    def handle_vnode_adopt(self, message, address):
+        try:
+            _, lower_bound, upper_bound, *sender = message.split(" ")
+            token = (int(lower_bound), int(upper_bound))
+            owner = self.claimed_endpoint(sender, address)
+        except ValueError:
+            self.command_socket.sendto(b"ERROR Invalid token", address)
+            return
+        self.adopted_tokens[token] = {"owner": owner, "misses": 0}
+        self.command_socket.sendto(b"OK", address)
+        log_event(
+            logger,
+            "INFO",
+            "vnode_adopted",
+            node=self.name,
+            peer=owner,
+            range={"lower": token[0], "upper": token[1]},
+        )
+
+    def handle_wire(self, message, address):
+        """Negotiate binary framing: `WIRE [<version>...]` -> `OK WIRE <version>`."""
+        try:
+            offered = [int(version) for version in message.split(" ")[1:]] or list(wire_codec.SUPPORTED_VERSIONS)
+        except ValueError:
+            offered = []
+        common = sorted(set(offered) & set(wire_codec.SUPPORTED_VERSIONS))
+        if common:
+            self.command_socket.sendto(f"OK WIRE {common[-1]}".encode(), address)
+        else:
+            self.command_socket.sendto(b"ERROR Unsupported wire version", address)
+
+    def handle_status(self, message, address):
+        self.send_json_response(address, self.status_payload(), compress="zlib" in message.split(" ")[1:])
+
+    def handle_metrics(self, message, address):
+        """METRICS [zlib]: counters, gauges and histograms as JSON."""
+        self.send_json_response(address, self.metrics.snapshot(), compress="zlib" in message.split(" ")[1:])
+
+    def handle_profile(self, message, address):
+        """PROFILE [START <seconds> [sample|cprofile] | STOP | STATUS]: on-demand profiling."""
+        parts = message.split(" ")
+        action = parts[1].upper() if len(parts) > 1 else "STATUS"
+        try:
+            if action == "START":
+                seconds = float(parts[2]) if len(parts) > 2 else profiling.DEFAULT_PROFILE_SECONDS
+                payload = self.profiler.start(seconds, parts[3].lower() if len(parts) > 3 else "sample")
+            elif action == "STOP":
+                payload = self.profiler.stop()
+            elif action == "STATUS":
+                payload = self.profiler.status()
+            else:
+                raise profiling.ProfileError("usage: PROFILE [START <seconds> [sample|cprofile] | STOP | STATUS]")
+        except (profiling.ProfileError, ValueError) as e:
+            self.send_json_response(address, {"error": str(e)}, ok=False)
+            return
+        log_event(logger, "INFO", "profile_command", node=self.name, peer=address[0], phase=action.lower(),
+                  result={key: payload[key] for key in ("mode", "seconds", "files") if key in payload})
+        payload["hot_handlers"] = self.hot_handlers()
+        self.send_json_response(address, payload)
+
+    def handle_snapshot(self, message, address):
+        """SNAPSHOT [<cursor>] [zlib]: one page of the snapshot, resumed after `cursor`."""
+        options = message.split(" ")[1:]
+        compress = "zlib" in options
+        cursors = [option for option in options if option and option != "zlib"]
+        try:
+            reply = self.snapshot_reply(cursors[0] if cursors else None, compress=compress)
+        except ValueError:
+            self.send_json_response(address, {"error": "invalid cursor"}, ok=False)
+            return
+        self.command_socket.sendto(reply, address)
+
+    def handle_checksum(self, message, address):
+        self.send_json_response(address, self.checksum_payload())
+
+    def handle_sync_from(self, message, address):
+        try:
+            _, owner = message.split(" ", 1)
+        except ValueError:
+            self.send_json_response(address, {"error": "missing owner"}, ok=False)
+            return
+        self.send_json_response(address, self.sync_from_owner(endpoints.normalize_endpoint(owner)))
+
+    def handle_merkle(self, message, address):
+        parts = message.split(" ")
+        try:
+            tree = self.merkle_tree(parts[1])
+            nodes = [int(node) for node in parts[2:]] or [1]
+            described = tree.describe(nodes)
+        except (IndexError, ValueError) as e:
+            self.send_json_response(address, {"error": str(e) or "usage: MERKLE <scope> [<node>...]"}, ok=False)
+            return
+        self.send_json_response(address, {"scope": parts[1], "buckets": tree.buckets, "nodes": described})
+
+    def handle_merkle_bucket(self, message, address):
+        try:
+            _, scope, bucket = message.split(" ")
+            tree = self.merkle_tree(scope)
+            records = tree.bucket_records(int(bucket))
+        except (IndexError, ValueError) as e:
+            self.send_json_response(address, {"error": str(e) or "usage: MERKLE_BUCKET <scope> <bucket>"}, ok=False)
+            return
+        self.send_json_response(address, {"scope": scope, "bucket": int(bucket), "records": records})
+
+    def handle_reconcile(self, message, address):
+        try:
+            _, owner = message.split(" ", 1)
+        except ValueError:
+            self.send_json_response(address, {"error": "missing owner"}, ok=False)
+            return
+        self.send_json_response(address, self.reconcile_replicas(endpoints.normalize_endpoint(owner)))
+
+    def handle_join(self, message, address):
+        """JOIN [<endpoint>]: offer part of our range to the server at `endpoint`."""
+        try:
+            joinee = self.claimed_endpoint(message.split(" ")[1:], address)
+        except ValueError:
+            self.command_socket.sendto(b"ERROR Malformed JOIN", address)
+            return
+        log_event(logger, "INFO", "node_joined", node=self.name, peer=joinee, result="join_requested")
+        self.process_join_request(joinee, address)
+        self.print_info()
+
+    def handle_pred_change(self, message, address):
+        """PRED_CHANGE <endpoint> [<epoch>]: a JOIN moved the range right before ours to `endpoint`."""
+        parts = message.split(" ")
+        epoch = int(parts[2]) if len(parts) > 2 else self.ring_epoch
+        self.change_predecessor(endpoints.normalize_endpoint(parts[1]), epoch)
+        self.print_info()
+
+    def handle_notify(self, message, address):
+        """NOTIFY <epoch> <lower> <upper>: the sender believes it is our predecessor.
+
+        Accepted from the current predecessor, when we have none, when the
+        sender sits between it and us, or when it failed. A NOTIFY older
+        than the epoch that installed the current predecessor is dropped.
+        Our lower bound then follows the predecessor's upper bound.
+        """
+        try:
+            _, epoch, lower_bound, upper_bound = message.split(" ")
+            epoch, lower_bound, upper_bound = int(epoch), int(lower_bound), int(upper_bound)
+        except ValueError:
+            return
+        notifier = self.peer_of(address)
+        current = self.predecessor
+        if upper_bound >= self.upper_bound:
+            reason = "outside_range"
+        elif notifier == current or current is None:
+            reason = None
+        elif epoch < self.predecessor_epoch:
+            reason = "stale_epoch"
+        elif self.predecessor_range and upper_bound > self.predecessor_range[1]:
+            reason = None
+        elif self.peer_failed(current):
+            reason = None
+        else:
+            reason = "predecessor_alive"
+        if reason:
+            log_event(
+                logger,
+                "INFO",
+                "notify_dropped",
+                node=self.name,
+                peer=notifier,
+                result={"reason": reason, "epoch": epoch, "predecessor_epoch": self.predecessor_epoch},
+            )
+            return
+
+        self.predecessor_range = (lower_bound, upper_bound)
+        self.orphaned_at = None
+        if notifier == current and upper_bound + 1 == self.lower_bound:
+            self.ring_epoch = max(self.ring_epoch, epoch)
+            self.predecessor_epoch = max(self.predecessor_epoch, epoch)
+            return
+        previous_lower = self.lower_bound
+        self.predecessor = notifier
+        self.lower_bound = upper_bound + 1
+        self.predecessor_epoch = self.advance_ring_epoch(epoch)
+        log_event(
+            logger,
+            "WARNING",
+            "predecessor_notified",
+            node=self.name,
+            peer=notifier,
+            range={"lower": self.lower_bound, "upper": self.upper_bound},
+            result={"previous": current, "previous_lower": previous_lower, "epoch": self.ring_epoch},
+        )
+        if self.lower_bound > previous_lower:
+            # The predecessor now owns records we still hold; hand them over.
+            self.correct_bd()
+
+    def handle_register(self, message, address):
+        payload = self.parse_register_message(message, address)
+        if payload is None:
+            log_event(
+                logger,
+                "WARNING",
+                "register_rejected",
+                node=self.name,
+                peer=f"{address[0]}:{address[1]}",
+                peer_ip=address[0],
+                peer_port=address[1],
+                phase="parse",
+                reason="malformed_payload",
+            )
+            return
+        log_event(
+            logger,
+            "INFO",
+            "register_received",
+            node=self.name,
+            peer=f"{address[0]}:{address[1]}",
+            peer_ip=address[0],
+            peer_port=address[1],
+            phase="receive",
+            correlation_id=payload.get("request_id"),
+            username=payload["username"],
+            version=payload["version"],
+            advertised_ip=payload["ip"],
+            result={"advertised_port": payload["port"]},
+        )
+        self.register_user(**payload)
+
+    def handle_resolve(self, message, address):
+        request = self.parse_resolve_message(message, address)
+        if request is None:
+            logger.warning("Rejected malformed RESOLVE payload from %s", address)
+            return
+        answer_to_ip, answer_to_port, username, hops, request_id, username_hash = request
+        log_event(
+            logger,
+            "INFO",
+            "resolve_received",
+            node=self.name,
+            peer=f"{address[0]}:{address[1]}",
+            peer_ip=address[0],
+            peer_port=address[1],
+            phase="receive",
+            correlation_id=request_id,
+            username=username,
+            result={"answer_to": f"{answer_to_ip}:{answer_to_port}", "hops": hops},
+        )
+        self.resolve_user(
+            answer_to_ip,
+            answer_to_port,
+            username,
+            hops=hops,
+            request_id=request_id,
+            previous_hop=self.peer_of(address) if hops else None,
+            username_hash=username_hash,
+        )
+
+    def handle_resolved(self, message, address):
+        """RESOLVED <request_id> <user> (<ip> <port> <version> <pubkey> | 404): answer to a RESOLVE we forwarded.
+
+        Fills for unknown request ids, for another username or from any peer
+        but the hop the request went to are dropped. Accepted fills are
+        passed on to the hop that forwarded the request to us, so every
+        server on the path ends up caching the owner's answer.
+        """
+        parts = message.split(" ")
+        try:
+            if len(parts) == 4 and parts[3] == "404":
+                _, request_id, username, _ = parts
+                record = None
+            elif len(parts) == 7:
+                _, request_id, username, ip, port, version, public_key = parts
+                record = (ip, int(port), public_key, int(version))
+            else:
+                raise ValueError(message)
+        except ValueError:
+            logger.warning("Rejected malformed RESOLVED payload from %s", address)
+            return
+        pending = self.pending_resolves.peek(request_id)
+        if pending is None or pending["peer"] != self.peer_of(address) or pending["username"] != username:
+            log_event(
+                logger,
+                "WARNING",
+                "resolve_fill_rejected",
+                node=self.name,
+                peer=self.peer_of(address),
+                username=username,
+                reason="unsolicited" if pending is None else "wrong_peer",
+            )
+            return
+        self.pending_resolves.pop(request_id)
+        self.cache_resolution(username, record)
+        if pending["previous_hop"] and pending["request_id"]:
+            self.fill_resolve_cache(username, record, pending["previous_hop"], pending["request_id"])
+
+    def handle_succ(self, message, address):
+        _, successors = message.split(" ", 1)
+        successors_list = [endpoints.normalize_endpoint(successor) for successor in successors.split(" ")]
+        self.successors = successors_list[: FAIL_TOLERANCE + 1]
+        if self.predecessor:
+            self.command_socket.sendto(
+                f"SUCC {self.endpoint()} {' '.join(successors_list)}".encode(),
+                endpoints.command_address(self.predecessor),
+            )
+
+    def handle_fix(self, message, address):
+        """FIX [<epoch> <peer>]: repair around a failed neighbour or replicated owner.
+
+        `on_member_change` queues it locally. A repair scheduled before a
+        newer topology change already took `peer` out of our links is
+        dropped. A bare FIX, as older servers broadcast it, only checks
+        our own neighbours.
+        """
+        parts = message.split(" ")
+        try:
+            epoch = int(parts[1]) if len(parts) > 1 else self.ring_epoch
+        except ValueError:
+            return
+        peer = endpoints.normalize_endpoint(parts[2]) if len(parts) > 2 else None
+        if peer and epoch < self.ring_epoch and peer not in (self.successor, self.predecessor, *self.replicants):
+            log_event(
+                logger,
+                "INFO",
+                "repair_dropped",
+                node=self.name,
+                peer=peer,
+                result={"epoch": epoch, "ring_epoch": self.ring_epoch},
+            )
+            return
+        self.crisis = True
+        try:
+            log_event(logger, "WARNING", "fix_started", node=self.name, peer=peer or self.peer_of(address), result={"epoch": epoch})
+            self.reclaim_dead_delegations()
+            self.fix_tape()
+            self.replicants_manager()
+            self.correct_bd()
+        finally:
+            self.crisis = False
+
+    def add_replicant(self, owner):
+        with self.replicants_lock:
+            if owner not in self.replicants:
+                self.replicants.append(owner)
+
+    def discard_replicant(self, owner):
+        with self.replicants_lock:
+            if owner in self.replicants:
+                self.replicants.remove(owner)
+
+    def handle_replic(self, message, address):
+        try:
+            _, username, ip, port, version, public_key = message.split(" ", 5)
+        except ValueError:
+            logger.warning("Rejected malformed REPLIC payload from %s", address)
+            return
+        owner = self.peer_of(address)
+        self.add_replicant(owner)
+        with self.db_lock:
+            resolution, stored = self.db_manager.upsert_replic_user(
+                username,
+                ip,
+                int(port),
+                public_key=public_key,
+                version=int(version),
+                owner=owner,
+            )
+        if stored:
+            self.invalidate_resolution(username, version)
+            log_event(
+                logger,
+                "INFO",
+                "replica_written",
+                node=self.name,
+                peer=owner,
+                username=username,
+                version=version,
+                result=resolution,
+            )
+        else:
+            logger.warning("Rejected replica for '%s' from %s (%s)", username, owner, resolution)
+
+    def handle_replic_batch(self, message, address):
+        try:
+            records, ack = self.parse_replica_batch(message)
+        except ValueError:
+            logger.warning("Rejected malformed REPLIC_BATCH payload from %s", address)
+            return
+        owner = self.peer_of(address)
+        self.add_replicant(owner)
+        with self.db_lock:
+            results = self.db_manager.upsert_replic_users(records, owner=owner)
+        for username, _, _, _, version in records:
+            self.invalidate_resolution(username, version)
+        rejected = [(username, resolution) for username, resolution, stored in results if not stored]
+        log_event(
+            logger,
+            "INFO",
+            "replica_written",
+            node=self.name,
+            peer=owner,
+            result={"records": len(results), "stored": len(results) - len(rejected), "rejected": len(rejected)},
+        )
+        for username, resolution in rejected:
+            logger.warning("Rejected replica for '%s' from %s (%s)", username, owner, resolution)
+        if ack is not None:
+            self.send_datagram(f"REPLIC_ACK {ack[0]} {ack[1]} {ack[2]}".encode(), address)
+
+    def handle_replic_ack(self, message, address):
+        try:
+            _, change_seq, index, total = message.split(" ")
+            change_seq, index, total = int(change_seq), int(index), int(total)
+        except ValueError:
+            logger.warning("Rejected malformed REPLIC_ACK payload from %s", address)
+            return
+        replic = self.peer_of(address)
+        if self.acknowledge_replica_frame(replic, change_seq, index, total):
+            log_event(
+                logger,
+                "DEBUG",
+                "replica_acknowledged",
+                node=self.name,
+                peer=replic,
+                result={"change_seq": change_seq},
+            )
+
+    def handle_takeover(self, message, address):
+        try:
+            _, username, ip, port, version, public_key = message.split(" ", 5)
+        except ValueError:
+            logger.warning("Rejected malformed TAKEOVER payload from %s", address)
+            return
+        self.place_user_record(
+            username,
+            ip,
+            int(port),
+            public_key,
+            int(version),
+        )
+        logger.info("Accepted TAKEOVER for user '%s'", username)
+
+    def handle_drop_replics(self, message, address):
+        _, owner = message.split(" ")
+        owner = endpoints.normalize_endpoint(owner)
+        with self.db_lock:
+            self.db_manager.drop_replics(owner)
+        self.discard_replicant(owner)
+
+    def handle_kill(self, message, address):
+        self.running = False
 
 
     def listen_for_ping(self):
-        """Respond to simple PING messages on the ping socket with PONG."""
+        """Serve the health port: PING/PONG and SWIM failure-detector traffic."""
         while self.running:
             try:
-                data, address = self.ping_socket.recvfrom(1024)
-                message = data.decode()
-                if message == "PING":
-                    self.ping_socket.sendto("PONG".encode(), address)
+                data, address = self.ping_socket.recvfrom(4096)
+                self.handle_probe(data, address)
             except:
                 pass
 
+    def handle_probe(self, data, address):
+        if data == b"PING" or data.startswith(b"PING "):
+            # Echo the nonce, if any, so the prober can match the answer.
+            self.ping_socket.sendto(b"PONG" + data[4:], address)
+        elif data.startswith(b"PONG "):
+            self.probe_engine.handle(data, address)
+        elif data.startswith(b"SWIM_"):
+            self.failure_detector.handle(data.decode(), address)
+
 
-    def change_predecessor(self, predecessor):
+    def change_predecessor(self, predecessor, epoch=0):
         """Update the predecessor pointer for this node."""
         self.predecessor = predecessor
+        self.predecessor_range = None
+        self.orphaned_at = None
+        self.ring_epoch = max(self.ring_epoch, epoch)
+        self.predecessor_epoch = self.ring_epoch
         logger.info("Predecessor updated to %s", predecessor)
 
     def parse_register_message(self, message, address):
+        if isinstance(message, wire_codec.Frame):
+            return self.parse_register_frame(message, address)
         parts = message.split(" ")
         if len(parts) == 7:
             _, username, ip, port, version, public_key, signature = parts
@@ -494,65 +1175,107 @@ class ChatServer:
         except (TypeError, ValueError):
             return None
 
-    def registration_payload(self, username, ip, port, version, public_key):
-        return f"{username}|{ip}|{port}|{version}|{public_key}"
+    def parse_register_frame(self, frame, address):
+        """Build the `register_user` payload from a binary REGISTER frame.
 
-    def verify_registration_signature(self, public_key, payload, signature):
-        if not all((serialization, padding, hashes)):
-            logger.error("cryptography dependency is not available; cannot verify registrations")
-            return False
-        try:
-            key = serialization.load_pem_public_key(base64.b64decode(public_key))
-            key.verify(
-                base64.b64decode(signature),
-                payload.encode(),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH,
-                ),
-                hashes.SHA256(),
+        Raw key and signature bytes are re-encoded as base64 so stored
+        records and text forwards look exactly like text registrations.
+        """
+        fields = frame.fields
+        return {
+            "answer_to_ip": fields["answer_to_ip"] or address[0],
+            "answer_to_port": fields["answer_to_port"] or address[1],
+            "username": fields["username"],
+            "ip": fields["ip"],
+            "port": fields["port"],
+            "version": fields["version"],
+            "public_key": base64.b64encode(fields["public_key"]).decode(),
+            "signature": base64.b64encode(fields["signature"]).decode(),
+            "username_hash": frame.username_hash,
+            "request_id": frame.request_id,
+        }
+
+    def parse_resolve_message(self, message, address):
+        if isinstance(message, wire_codec.Frame):
+            fields = message.fields
+            return (
+                fields["answer_to_ip"] or address[0],
+                fields["answer_to_port"] or address[1],
+                fields["username"],
+                fields["hops"],
+                message.request_id,
+                message.username_hash,
             )
-            return True
-        except (ValueError, TypeError, InvalidSignature):
-            return False
+        parts = message.split(" ")
+        hops = 0
+        request_id = None
+        if len(parts) == 2:
+            _, username = parts
+            answer_to_ip, answer_to_port = address[0], address[1]
+        elif len(parts) == 4:
+            _, answer_to_ip, answer_to_port, username = parts
+        elif len(parts) == 5:
+            _, answer_to_ip, answer_to_port, username, hops = parts
+        elif len(parts) == 6:
+            _, answer_to_ip, answer_to_port, username, hops, request_id = parts
+        else:
+            return None
+
+        try:
+            return answer_to_ip, int(answer_to_port), username, int(hops), request_id, None
+        except (TypeError, ValueError):
+            return None
+
+    def registration_payload(self, username, ip, port, version, public_key):
+        return f"{username}|{ip}|{port}|{version}|{public_key}"
 
     def place_user_record(self, username, ip, port, public_key, version):
         """Route an already authenticated user record to its owning node."""
+        self.invalidate_resolution(username, version)
         username_hash = self.rolling_hash(username)
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            if username_hash < self.lower_bound and self.predecessor:
-                sock.sendto(
-                    f"TAKEOVER {username} {ip} {port} {version} {public_key}".encode(),
-                    (self.predecessor, 12345),
-                )
-                return "forwarded_predecessor"
-            elif username_hash > self.upper_bound and self.successor:
-                sock.sendto(
-                    f"TAKEOVER {username} {ip} {port} {version} {public_key}".encode(),
-                    (self.successor, 12345),
+        next_hop, phase = self.route_target(username_hash)
+        if next_hop:
+            self.send_datagram(
+                f"TAKEOVER {username} {ip} {port} {version} {public_key}".encode(),
+                endpoints.command_address(next_hop),
+            )
+            self.count_forward("TAKEOVER", phase)
+            return phase.replace("forward_", "forwarded_")
+        else:
+            with self.db_lock:
+                resolution, stored = self.db_manager.upsert_user(
+                    username,
+                    ip,
+                    port,
+                    public_key=public_key,
+                    version=version,
                 )
-                return "forwarded_successor"
+            if stored:
+                logger.info("Placed user record '%s' locally (%s)", username, resolution)
             else:
-                with self.db_lock:
-                    resolution, stored = self.db_manager.upsert_user(
-                        username,
-                        ip,
-                        port,
-                        public_key=public_key,
-                        version=version,
-                    )
-                if stored:
-                    logger.info("Placed user record '%s' locally (%s)", username, resolution)
-                else:
-                    logger.warning("Rejected local user record '%s' during placement (%s)", username, resolution)
-                return resolution
-
-
-    def register_user(self, answer_to_ip, answer_to_port, username, ip, port, version, public_key, signature):
+                logger.warning("Rejected local user record '%s' during placement (%s)", username, resolution)
+            return resolution
+
+
+    def register_user(
+        self,
+        answer_to_ip,
+        answer_to_port,
+        username,
+        ip,
+        port,
+        version,
+        public_key,
+        signature,
+        username_hash=None,
+        request_id=None,
+    ):
         """Register a user in the ring or forward the registration to the appropriate neighbor.
 
         If the user's hash belongs to this node's range, persist it locally and notify replicas.
-        Otherwise forward the REGISTER command to predecessor or successor.
+        Otherwise forward the REGISTER command to predecessor or successor. A
+        `username_hash` precomputed by a binary frame is trusted for routing
+        and checked before anything is stored.
         """
         if (
             not self.is_valid_username(username)
@@ -561,9 +1284,8 @@ class ChatServer:
             or not signature
             or version <= 0
         ):
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                if answer_to_ip != ".":
-                    sock.sendto(b"ERROR Invalid registration payload", (answer_to_ip, answer_to_port))
+            if answer_to_ip != ".":
+                self.send_datagram(b"ERROR Invalid registration payload", (answer_to_ip, answer_to_port))
             log_event(
                 logger,
                 "WARNING",
@@ -581,223 +1303,893 @@ class ChatServer:
             )
             return
 
-        username_hash = self.rolling_hash(username)
+        precomputed_hash = username_hash is not None
+        if not precomputed_hash:
+            username_hash = self.rolling_hash(username)
         payload = self.registration_payload(username, ip, port, version, public_key)
 
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            if username_hash < self.lower_bound:
-                sock.sendto(
-                    f"REGISTER {answer_to_ip} {answer_to_port} {username} {ip} {port} {version} {public_key} {signature}".encode(),
-                    (self.predecessor, 12345),
-                )
-                log_event(
-                    logger,
-                    "INFO",
-                    "register_forwarded",
-                    node=self.name,
-                    peer=self.predecessor,
-                    peer_ip=self.predecessor,
-                    peer_port=12345,
-                    phase="forward_predecessor",
-                    username=username,
+        next_hop, phase = self.route_target(username_hash)
+        if precomputed_hash and next_hop is None and username_hash != self.rolling_hash(username):
+            if answer_to_ip != ".":
+                self.send_datagram(b"ERROR Invalid registration payload", (answer_to_ip, answer_to_port))
+            log_event(
+                logger,
+                "WARNING",
+                "register_rejected",
+                node=self.name,
+                peer=f"{answer_to_ip}:{answer_to_port}",
+                phase="validate",
+                correlation_id=request_id,
+                username=username,
+                version=version,
+                reason="username_hash_mismatch",
+                result={"hash": username_hash},
+            )
+            return
+
+        if next_hop:
+            self.invalidate_resolution(username, version)
+            hop_address = endpoints.command_address(next_hop)
+            self.send_datagram(
+                f"REGISTER {answer_to_ip} {answer_to_port} {username} {ip} {port} {version} {public_key} {signature}".encode(),
+                hop_address,
+            )
+            self.count_forward("REGISTER", phase)
+            log_event(
+                logger,
+                "INFO",
+                "register_forwarded",
+                node=self.name,
+                peer=next_hop,
+                peer_ip=hop_address[0],
+                peer_port=hop_address[1],
+                phase=phase,
+                username=username,
+                version=version,
+                advertised_ip=ip,
+                result={"hash": username_hash, "range": {"lower": self.lower_bound, "upper": self.upper_bound}},
+            )
+        else:
+            self.admit_registration({
+                "answer_to_ip": answer_to_ip,
+                "answer_to_port": answer_to_port,
+                "username": username,
+                "ip": ip,
+                "port": port,
+                "version": version,
+                "public_key": public_key,
+                "signature": signature,
+                "payload": payload,
+                "hash": username_hash,
+                "request_id": request_id,
+            })
+
+    def admit_registration(self, request):
+        """Hand a validated, locally owned registration to the staged pipeline.
+
+        Signatures seen within SIGNATURE_CACHE_TTL skip the CPU stage; a full
+        pipeline answers `BUSY REGISTER` like a full dispatcher lane.
+        """
+        if self.register_pipeline.depth() >= REGISTER_PIPELINE_DEPTH:
+            if request["answer_to_ip"] != ".":
+                self.send_datagram(b"BUSY REGISTER", (request["answer_to_ip"], request["answer_to_port"]))
+            log_event(
+                logger,
+                "WARNING",
+                "command_rejected",
+                node=self.name,
+                phase="register_pipeline",
+                username=request["username"],
+                reason="pipeline_full",
+                result=self.register_pipeline.snapshot(),
+            )
+            return
+        if not signature_verifier.available():
+            logger.error("cryptography dependency is not available; cannot verify registrations")
+            self.register_pipeline.submit(request, verified=False)
+            return
+        request["verification_key"] = signature_verifier.verification_key(
+            request["public_key"], request["payload"], request["signature"]
+        )
+        self.register_pipeline.submit(request, verified=self.signature_cache.get(request["verification_key"]))
+
+    def store_registration(self, request, verified):
+        """Pipeline store stage: short locked write and client reply; returns records to replicate."""
+        if "verification_key" in request:
+            self.signature_cache.put(request["verification_key"], bool(verified))
+        username, ip, port, version = request["username"], request["ip"], request["port"], request["version"]
+        if not verified:
+            response = "ERROR Invalid registration signature"
+        else:
+            with self.db_lock:
+                resolution, stored = self.db_manager.upsert_user(
+                    username,
+                    ip,
+                    port,
+                    public_key=request["public_key"],
                     version=version,
-                    advertised_ip=ip,
-                    result={"hash": username_hash, "range": {"lower": self.lower_bound, "upper": self.upper_bound}},
                 )
+            if not stored and resolution == db_manager.STALE:
+                response = "ERROR Stale registration version"
+            elif not stored and resolution == db_manager.IDENTITY_CONFLICT:
+                response = "ERROR Username belongs to a different identity key"
+            else:
+                response = f"OK User '{username}' in ({ip}:{port}) successfully registered"
 
-            elif username_hash > self.upper_bound:
-                sock.sendto(
-                    f"REGISTER {answer_to_ip} {answer_to_port} {username} {ip} {port} {version} {public_key} {signature}".encode(),
-                    (self.successor, 12345),
-                )
+        answer_to_ip, answer_to_port = request["answer_to_ip"], request["answer_to_port"]
+        if answer_to_ip != '.':
+            self.send_datagram(response.encode(), (answer_to_ip, answer_to_port))
+        if not response.startswith("OK"):
+            log_event(
+                logger,
+                "WARNING",
+                "register_rejected",
+                node=self.name,
+                peer=f"{answer_to_ip}:{answer_to_port}",
+                peer_ip=answer_to_ip,
+                peer_port=answer_to_port,
+                phase="store",
+                correlation_id=request.get("request_id"),
+                username=username,
+                version=version,
+                advertised_ip=ip,
+                reason=response,
+                result={"hash": request["hash"], "advertised_port": port},
+            )
+            return None
+        return [(username, ip, port, request["public_key"], version)]
+
+    def replicate_registration(self, request, records):
+        """Pipeline replicate stage."""
+        self.replicate_owned_records(records)
+        log_event(
+            logger,
+            "INFO",
+            "register_accepted",
+            node=self.name,
+            peer=f"{request['answer_to_ip']}:{request['answer_to_port']}",
+            peer_ip=request["answer_to_ip"],
+            peer_port=request["answer_to_port"],
+            phase="store",
+            correlation_id=request.get("request_id"),
+            username=request["username"],
+            version=request["version"],
+            advertised_ip=request["ip"],
+            range={"lower": self.lower_bound, "upper": self.upper_bound},
+            result={"status": "stored_and_replicated", "advertised_port": request["port"], "hash": request["hash"]},
+        )
+
+    def on_register_error(self, request, error):
+        username = request.get("username") if isinstance(request, dict) else None
+        logger.error(f"Register pipeline error for '{username}': {error}")
+
+
+    def resolve_user(
+        self,
+        answer_to_ip,
+        answer_to_port,
+        username,
+        hops=0,
+        request_id=None,
+        previous_hop=None,
+        username_hash=None,
+    ):
+        """Resolve `username` to an (ip,port) tuple, forwarding the request if needed.
+
+        `hops` counts how many servers already forwarded this request; it is
+        carried on the wire so each hop can log it and loops are cut off.
+        Every forward gets a fresh `request_id`. The owner answers the last
+        forwarder (`previous_hop`) with a RESOLVED fill under the id it was
+        given, each forwarder passes the fill back one hop, and any
+        non-owner answers straight from a live cache entry. A `username_hash`
+        precomputed by a binary frame is trusted for routing and checked
+        before the owner answers, as in `register_user`.
+        """
+        precomputed_hash = username_hash is not None
+        if not precomputed_hash:
+            username_hash = self.rolling_hash(username)
+        next_hop, phase = self.route_target(username_hash)
+
+        cached = self.cached_resolution(username) if next_hop else None
+        if precomputed_hash and next_hop is None and username_hash != self.rolling_hash(username):
+            self.send_datagram(b"ERROR Invalid resolve payload", (answer_to_ip, answer_to_port))
+            log_event(
+                logger,
+                "WARNING",
+                "resolve_failed",
+                node=self.name,
+                peer=f"{answer_to_ip}:{answer_to_port}",
+                phase="validate",
+                correlation_id=request_id,
+                username=username,
+                reason="username_hash_mismatch",
+                result={"hash": username_hash, "hops": hops},
+            )
+
+        elif cached is not None:
+            found, record = cached
+            if found:
+                ip, port, public_key, version = record
+                response = f"OK {ip} {port} {public_key} {version}"
+            else:
+                response = "ERROR 404 User not found"
+            self.send_datagram(response.encode(), (answer_to_ip, answer_to_port))
+            log_event(
+                logger,
+                "INFO",
+                "resolve_completed",
+                node=self.name,
+                peer=f"{answer_to_ip}:{answer_to_port}",
+                peer_ip=answer_to_ip,
+                peer_port=answer_to_port,
+                phase="cache",
+                username=username,
+                version=record[3] if found else None,
+                result={"status": "OK" if found else "404", "hash": username_hash, "hops": hops},
+            )
+
+        elif next_hop and hops >= MAX_ROUTE_HOPS:
+            self.send_datagram(b"ERROR 508 Routing loop detected", (answer_to_ip, answer_to_port))
+            log_event(
+                logger,
+                "WARNING",
+                "resolve_failed",
+                node=self.name,
+                peer=f"{answer_to_ip}:{answer_to_port}",
+                phase="route",
+                username=username,
+                reason="max_hops_exceeded",
+                result={"hash": username_hash, "hops": hops},
+            )
+
+        elif next_hop:
+            forward_id = secrets.token_hex(8)
+            self.pending_resolves.put(forward_id, {
+                "peer": endpoints.normalize_endpoint(next_hop),
+                "username": username,
+                "previous_hop": previous_hop,
+                "request_id": request_id,
+            })
+            forward = f"RESOLVE {answer_to_ip} {answer_to_port} {username} {hops + 1} {forward_id}"
+            hop_address = endpoints.command_address(next_hop)
+            self.send_datagram(forward.encode(), hop_address)
+            self.count_forward("RESOLVE", phase)
+            log_event(
+                logger,
+                "INFO",
+                "resolve_forwarded",
+                node=self.name,
+                peer=next_hop,
+                peer_ip=hop_address[0],
+                peer_port=hop_address[1],
+                phase=phase,
+                username=username,
+                result={"answer_to": f"{answer_to_ip}:{answer_to_port}", "hash": username_hash, "hops": hops + 1},
+            )
+
+        else:
+            # Served from server_db's in-memory record table; no db_lock needed.
+            address = self.db_manager.resolve_user(username)
+            if previous_hop and request_id:
+                self.fill_resolve_cache(username, address, previous_hop, request_id)
+            if address:
+                ip, port, public_key, version = address
+                response = f"OK {ip} {port} {public_key} {version}"
+                self.send_datagram(response.encode(), (answer_to_ip, answer_to_port))
                 log_event(
                     logger,
                     "INFO",
-                    "register_forwarded",
+                    "resolve_completed",
                     node=self.name,
-                    peer=self.successor,
-                    peer_ip=self.successor,
-                    peer_port=12345,
-                    phase="forward_successor",
+                    peer=f"{answer_to_ip}:{answer_to_port}",
+                    peer_ip=answer_to_ip,
+                    peer_port=answer_to_port,
+                    phase="resolve",
                     username=username,
                     version=version,
                     advertised_ip=ip,
-                    result={"hash": username_hash, "range": {"lower": self.lower_bound, "upper": self.upper_bound}},
+                    result={
+                        "status": "OK",
+                        "answer_to": f"{answer_to_ip}:{answer_to_port}",
+                        "resolved": f"{ip}:{port}",
+                        "hash": username_hash,
+                        "hops": hops,
+                    },
                 )
             else:
-                with self.db_lock:
-                    if not self.verify_registration_signature(public_key, payload, signature):
-                        response = "ERROR Invalid registration signature"
-                    else:
-                        resolution, stored = self.db_manager.upsert_user(
-                            username,
-                            ip,
-                            port,
-                            public_key=public_key,
-                            version=version,
-                        )
-                        if not stored and resolution == db_manager.STALE:
-                            response = "ERROR Stale registration version"
-                        elif not stored and resolution == db_manager.IDENTITY_CONFLICT:
-                            response = "ERROR Username belongs to a different identity key"
-                        else:
-                            response = f"OK User '{username}' in ({ip}:{port}) successfully registered"
-
-                if answer_to_ip != '.':
-                    sock.sendto(response.encode(), (answer_to_ip, answer_to_port))
-                if not response.startswith("OK"):
-                    log_event(
-                        logger,
-                        "WARNING",
-                        "register_rejected",
-                        node=self.name,
-                        peer=f"{answer_to_ip}:{answer_to_port}",
-                        peer_ip=answer_to_ip,
-                        peer_port=answer_to_port,
-                        phase="store",
-                        username=username,
-                        version=version,
-                        advertised_ip=ip,
-                        reason=response,
-                        result={"hash": username_hash, "advertised_port": port},
-                    )
-                    return
-                self.replicate_owned_records([(username, ip, port, public_key, version)])
+                response = f"ERROR 404 User not found"
+                self.send_datagram(response.encode(), (answer_to_ip, answer_to_port))
                 log_event(
                     logger,
-                    "INFO",
-                    "register_accepted",
+                    "WARNING",
+                    "resolve_failed",
                     node=self.name,
                     peer=f"{answer_to_ip}:{answer_to_port}",
                     peer_ip=answer_to_ip,
                     peer_port=answer_to_port,
-                    phase="store",
+                    phase="resolve",
                     username=username,
-                    version=version,
-                    advertised_ip=ip,
-                    range={"lower": self.lower_bound, "upper": self.upper_bound},
-                    result={"status": "stored_and_replicated", "advertised_port": port, "hash": username_hash},
+                    reason="user_not_found",
+                    result={"hash": username_hash, "hops": hops},
                 )
 
+    def cached_resolution(self, username):
+        """Return `(True, record)`, `(False, None)` for a cached 404, or None on a miss."""
+        record = self.resolve_cache.get(username)
+        if record is not None:
+            return True, record
+        if self.resolve_miss_cache.get(username) is not None:
+            return False, None
+        return None
+
+    def cache_resolution(self, username, record):
+        """Store an owner's answer; never replace a cached record with an older version."""
+        if record is None:
+            self.resolve_cache.pop(username)
+            self.resolve_miss_cache.put(username, True)
+            return
+        cached = self.resolve_cache.peek(username)
+        if cached is not None and cached[3] > record[3]:
+            return
+        self.resolve_miss_cache.pop(username)
+        self.resolve_cache.put(username, tuple(record))
+
+    def invalidate_resolution(self, username, version=None):
+        """Drop cached answers for `username` older than `version` (all of them when None)."""
+        self.resolve_miss_cache.pop(username)
+        cached = self.resolve_cache.peek(username)
+        if cached is not None and (version is None or cached[3] < int(version)):
+            self.resolve_cache.pop(username)
+
+    def fill_resolve_cache(self, username, record, server, request_id):
+        """Push the answer to a forwarded RESOLVE back to the hop that sent it to us."""
+        if record:
+            ip, port, public_key, version = record
+            fill = f"RESOLVED {request_id} {username} {ip} {port} {version} {public_key}"
+        else:
+            fill = f"RESOLVED {request_id} {username} 404"
+        self.send_datagram(fill.encode(), endpoints.command_address(server))
+
 
-    def resolve_user(self, answer_to_ip, answer_to_port, username):
-        """Resolve `username` to an (ip,port) tuple, forwarding the request if needed."""
-        username_hash = self.rolling_hash(username)
+    def join_split_point(self):
+        """Return the first hash handed to a joining node.
 
+        The split follows the JOIN_SPLIT_QUANTILE of the keys we actually
+        store so the newcomer takes that share of our records; with too few
+        keys (or a degenerate quantile) we fall back to the range midpoint.
+        """
+        midpoint = int((self.lower_bound + self.upper_bound) / 2)
+        with self.db_lock:
+            records = self.db_manager.count_users_in_range(self.lower_bound, self.upper_bound)
+            split = None
+            if records >= JOIN_MIN_RECORDS:
+                split = self.db_manager.hash_quantile(self.lower_bound, self.upper_bound, JOIN_SPLIT_QUANTILE)
+        if split is None or not self.lower_bound < split <= self.upper_bound:
+            return midpoint, "midpoint", records
+        return split, "quantile", records
+
+    def process_join_request(self, joinee, address):
+        """Offer the upper part of our range to the server at endpoint `joinee`.
+
+        The offer is answered to `address`, the socket its JOIN came from.
+        Nothing changes hands yet: the joinee pulls the records with HANDOFF
+        and ownership moves only when it sends HANDOFF_COMMIT.
+        """
+        pending = self.active_handoff()
+        if pending and pending["joinee"] != joinee:
+            self.send_datagram(b"ERROR Handoff in progress", address)
+            log_event(logger, "WARNING", "join_rejected", node=self.name, peer=joinee, reason="handoff_in_progress")
+            return
+        self.failure_detector.add_members([joinee])
+        joinee_lower_bound, split_mode, records = self.join_split_point()
+        joinee_upper_bound = self.upper_bound
+        joinee_successor = "_" if self.successor is None else self.successor
+        joinee_predecessor = self.endpoint()
+
+        self.pending_handoff = {
+            "joinee": joinee,
+            "lower": joinee_lower_bound,
+            "upper": joinee_upper_bound,
+            "expires": time.monotonic() + HANDOFF_TIMEOUT,
+            "split": split_mode,
+            "records_before": records,
+        }
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            if username_hash < self.lower_bound:
-                sock.sendto(
-                    f"RESOLVE {answer_to_ip} {answer_to_port} {username}".encode(),
-                    (self.predecessor, 12345),
-                )
-                log_event(
-                    logger,
-                    "INFO",
-                    "resolve_forwarded",
-                    node=self.name,
-                    peer=self.predecessor,
-                    peer_ip=self.predecessor,
-                    peer_port=12345,
-                    phase="forward_predecessor",
-                    username=username,
-                    result={"answer_to": f"{answer_to_ip}:{answer_to_port}", "hash": username_hash},
-                )
+            sock.sendto(f"OK {joinee_lower_bound} {joinee_upper_bound} {joinee_predecessor} {joinee_successor}".encode(), address)
 
-            elif username_hash > self.upper_bound:
-                sock.sendto(
-                    f"RESOLVE {answer_to_ip} {answer_to_port} {username}".encode(),
-                    (self.successor, 12345),
-                )
-                log_event(
-                    logger,
-                    "INFO",
-                    "resolve_forwarded",
-                    node=self.name,
-                    peer=self.successor,
-                    peer_ip=self.successor,
-                    peer_port=12345,
-                    phase="forward_successor",
-                    username=username,
-                    result={"answer_to": f"{answer_to_ip}:{answer_to_port}", "hash": username_hash},
-                )
+        log_event(
+            logger,
+            "INFO",
+            "handoff_offered",
+            node=self.name,
+            peer=joinee,
+            range={"lower": joinee_lower_bound, "upper": joinee_upper_bound},
+            result={"split": split_mode, "records_before": records},
+        )
 
-            else:
-                with self.db_lock:
-                    address = self.db_manager.resolve_user(username)
-                if address:
-                    ip, port, public_key, version = address
-                    response = f"OK {ip} {port} {public_key} {version}"
-                    sock.sendto(response.encode(), (answer_to_ip, answer_to_port))
-                    log_event(
-                        logger,
-                        "INFO",
-                        "resolve_completed",
-                        node=self.name,
-                        peer=f"{answer_to_ip}:{answer_to_port}",
-                        peer_ip=answer_to_ip,
-                        peer_port=answer_to_port,
-                        phase="resolve",
-                        username=username,
-                        version=version,
-                        advertised_ip=ip,
-                        result={
-                            "status": "OK",
-                            "answer_to": f"{answer_to_ip}:{answer_to_port}",
-                            "resolved": f"{ip}:{port}",
-                            "hash": username_hash,
-                        },
-                    )
-                else:
-                    response = f"ERROR 404 User not found"
-                    sock.sendto(response.encode(), (answer_to_ip, answer_to_port))
-                    log_event(
-                        logger,
-                        "WARNING",
-                        "resolve_failed",
-                        node=self.name,
-                        peer=f"{answer_to_ip}:{answer_to_port}",
-                        peer_ip=answer_to_ip,
-                        peer_port=answer_to_port,
-                        phase="resolve",
-                        username=username,
-                        reason="user_not_found",
-                        result={"hash": username_hash},
-                    )
+    def request_predecessor_change(self, target, new_predecessor):
+        """Notify `target` server that its predecessor should be changed to `new_predecessor`."""
+        if target is not None:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.settimeout(1)
+                sock.sendto(f"PRED_CHANGE {new_predecessor} {self.ring_epoch}".encode(), endpoints.command_address(target))
+            logger.info("Requested predecessor change on %s -> %s", target, new_predecessor)
 
 
-    def process_join_request(self, joinee):
-        """Process an incoming JOIN request from `joinee` and hand over half the range."""
-        joinee_lower_bound = int((self.lower_bound + self.upper_bound) / 2)
-        joinee_upper_bound = self.upper_bound
-        joinee_successor = "_" if self.successor is None else self.successor
-        joinee_predecessor = self.get_ip()
 
-        self.request_predecessor_change(self.successor, joinee[0])
 
+    #region Range handoff
+
+    def active_handoff(self):
+        """Return the pending handoff, dropping it once the joinee has gone quiet for HANDOFF_TIMEOUT."""
+        pending = self.pending_handoff
+        if pending and time.monotonic() >= pending["expires"]:
+            self.pending_handoff = None
+            log_event(
+                logger,
+                "WARNING",
+                "handoff_expired",
+                node=self.name,
+                peer=pending["joinee"],
+                range={"lower": pending["lower"], "upper": pending["upper"]},
+            )
+            return None
+        return pending
+
+    def matching_handoff(self, lower_bound, upper_bound, address):
+        """Return the pending handoff of this range if `address` is on the joinee's host.
+
+        HANDOFF requests leave from a throwaway socket, so only the ip can be checked.
+        """
+        pending = self.active_handoff()
+        joinee_host = endpoints.host_of(pending["joinee"]) if pending else None
+        if pending and (joinee_host, pending["lower"], pending["upper"]) == (address[0], lower_bound, upper_bound):
+            pending["expires"] = time.monotonic() + HANDOFF_TIMEOUT
+            return pending
+        return None
+
+    def handoff_lines(self, records):
+        """Encode records as REPLIC_BATCH-style lines, stopping at REPLICA_BATCH_BYTES."""
+        lines = []
+        size = 0
+        for username, ip, port, public_key, version in records:
+            line = f"{username} {ip} {port} {version} {public_key}"
+            if lines and size + len(line.encode()) + 1 > REPLICA_BATCH_BYTES:
+                break
+            lines.append(line)
+            size += len(line.encode()) + 1
+        return lines
+
+    def handoff_page(self, lower_bound, upper_bound, since, after_hash=None, after_username=None):
+        """Return one `HANDOFF_BATCH <seq> <count> <next_hash> <next_username>` frame.
+
+        `seq` is our change sequence when the page was read; rows written
+        after the joinee's first page are picked up by the next pass, or by
+        the commit. `_ _` marks the last page.
+        """
+        with self.db_lock:
+            change_seq = self.db_manager.current_change_seq()
+            records = self.db_manager.list_users_in_range(
+                lower_bound,
+                upper_bound,
+                limit=HANDOFF_PAGE_ROWS,
+                after_hash=after_hash,
+                after_username=after_username,
+                changed_after=since,
+            )
+        lines = self.handoff_lines(records)
+        if len(lines) < len(records) or len(records) == HANDOFF_PAGE_ROWS:
+            last = records[len(lines) - 1][0]
+            cursor = f"{self.db_manager.hash_function(last)} {last}"
+        else:
+            cursor = "_ _"
+        return "\n".join([f"HANDOFF_BATCH {change_seq} {len(lines)} {cursor}", *lines]).encode()
+
+    def handle_handoff(self, message, address):
+        """HANDOFF <lower> <upper> <since_seq> [<after_hash> <after_username>]: one page of the offered range."""
+        parts = message.split(" ")
+        try:
+            lower_bound, upper_bound, since = (int(value) for value in parts[1:4])
+            after_hash, after_username = (int(parts[4]), parts[5]) if len(parts) == 6 else (None, None)
+        except (IndexError, ValueError):
+            self.command_socket.sendto(b"ERROR Malformed HANDOFF", address)
+            return
+        if not self.matching_handoff(lower_bound, upper_bound, address):
+            self.command_socket.sendto(b"ERROR No handoff pending", address)
+            return
+        self.command_socket.sendto(self.handoff_page(lower_bound, upper_bound, since, after_hash, after_username), address)
+
+    def handle_handoff_commit(self, message, address):
+        """HANDOFF_COMMIT <lower> <upper> <since_seq>: cut the offered range over to the joinee.
+
+        Under the database lock, so no owned write can slip in between:
+        whatever changed in the range after `since_seq` rides along in the
+        reply, the range is deleted in one transaction and our bounds shrink.
+        When that delta does not fit one datagram we answer RETRY and the
+        joinee pulls it as another pass first.
+        """
+        try:
+            _, lower_bound, upper_bound, since = message.split(" ")
+            lower_bound, upper_bound, since = int(lower_bound), int(upper_bound), int(since)
+        except ValueError:
+            self.command_socket.sendto(b"ERROR Malformed HANDOFF_COMMIT", address)
+            return
+        completed = self.completed_handoff
+        if completed and completed["key"] == (address[0], lower_bound, upper_bound):
+            self.command_socket.sendto(completed["reply"], address)
+            return
+        pending = self.matching_handoff(lower_bound, upper_bound, address)
+        if not pending:
+            self.command_socket.sendto(b"ERROR No handoff pending", address)
+            return
+
+        with self.db_lock:
+            delta = self.db_manager.list_users_in_range(lower_bound, upper_bound, limit=HANDOFF_PAGE_ROWS + 1, changed_after=since)
+            lines = self.handoff_lines(delta)
+            if len(delta) > HANDOFF_PAGE_ROWS or len(lines) < len(delta):
+                self.command_socket.sendto(f"RETRY {self.db_manager.current_change_seq()}".encode(), address)
+                return
+            moved = self.db_manager.delete_users_in_range(lower_bound, upper_bound)
+            old_successor = self.successor
+            self.upper_bound = lower_bound - 1
+            self.successor = pending["joinee"]
+            self.pending_handoff = None
+            self.advance_ring_epoch()
+
+        reply = "\n".join([f"OK {len(lines)}", *lines]).encode()
+        self.completed_handoff = {"key": (address[0], lower_bound, upper_bound), "reply": reply}
+        self.command_socket.sendto(reply, address)
+        self.request_predecessor_change(old_successor, self.successor)
+        for token in [token for token in self.vnode_delegations if lower_bound <= token[0] and token[1] <= upper_bound]:
+            # The delegate learns on its next VNODE_CHECK and re-places the records with the joinee.
+            del self.vnode_delegations[token]
+        log_event(
+            logger,
+            "INFO",
+            "range_split",
+            node=self.name,
+            peer=self.successor,
+            range={"lower": self.lower_bound, "upper": self.upper_bound},
+            result={
+                "new_successor": self.successor,
+                "split": pending["split"],
+                "records_before": pending["records_before"],
+                "handed_off": moved,
+                "delta": len(lines),
+            },
+        )
+
+    def handoff_request(self, donor, command, attempts=3, timeout=1.0):
+        """Send one HANDOFF request to `donor` and return its reply, retrying lost datagrams."""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            for attempt in range(attempts):
+                sock.sendto(command.encode(), endpoints.command_address(donor))
+                try:
+                    data, _ = sock.recvfrom(65535)
+                    return data.decode()
+                except socket.timeout:
+                    if attempt == attempts - 1:
+                        raise
+
+    def fetch_handoff_records(self, donor, lower_bound, upper_bound, since):
+        """Pull every page of one pass; return `(change_seq at the first page, records)`."""
+        records = []
+        change_seq = None
+        cursor = ""
+        while True:
+            header, *lines = self.handoff_request(donor, f"HANDOFF {lower_bound} {upper_bound} {since}{cursor}").split("\n")
+            parts = header.split(" ")
+            if parts[0] != "HANDOFF_BATCH" or len(parts) != 5 or int(parts[2]) != len(lines):
+                raise ValueError(f"Unexpected handoff reply: {header[:120]}")
+            change_seq = int(parts[1]) if change_seq is None else change_seq
+            records.extend(self.parse_record_lines(lines))
+            if parts[3] == "_":
+                return change_seq, records
+            cursor = f" {parts[3]} {parts[4]}"
+
+    def apply_handoff_records(self, records):
+        if not records:
+            return
+        with self.db_lock:
+            self.db_manager.upsert_users(records)
+
+    def pull_handoff(self, donor, lower_bound, upper_bound):
+        """Copy `[lower_bound, upper_bound]` from `donor` and commit the ownership change.
+
+        Each pass is applied in one transaction. Passes repeat with the
+        donor's change sequence until the remaining delta fits in the commit
+        reply; returns how many records arrived.
+        """
+        since = 0
+        received = 0
+        try:
+            for _ in range(HANDOFF_ROUNDS):
+                since, records = self.fetch_handoff_records(donor, lower_bound, upper_bound, since)
+                self.apply_handoff_records(records)
+                received += len(records)
+                header, *lines = self.handoff_request(donor, f"HANDOFF_COMMIT {lower_bound} {upper_bound} {since}").split("\n")
+                if header.startswith("OK"):
+                    delta = self.parse_record_lines(lines)
+                    self.apply_handoff_records(delta)
+                    return received + len(delta)
+                if not header.startswith("RETRY"):
+                    raise ValueError(f"Handoff commit failed: {header[:120]}")
+            raise ValueError(f"Handoff from {donor} did not settle after {HANDOFF_ROUNDS} passes")
+        except Exception:
+            with self.db_lock:
+                self.db_manager.delete_users_in_range(lower_bound, upper_bound)
+            raise
+
+    #region Routing
+
+    def range_distance(self, key_hash, lower_bound, upper_bound):
+        """Return how far `key_hash` lies outside `[lower_bound, upper_bound]` (0 when inside)."""
+        if key_hash < lower_bound:
+            return lower_bound - key_hash
+        if key_hash > upper_bound:
+            return key_hash - upper_bound
+        return 0
+
+    def closest_finger(self, key_hash):
+        """Return the finger endpoint whose known range is strictly closer to `key_hash` than ours."""
+        best_finger = None
+        best_distance = self.range_distance(key_hash, self.lower_bound, self.upper_bound)
+        for finger_ip, lower_bound, upper_bound in list(self.fingers.values()):
+            distance = self.range_distance(key_hash, lower_bound, upper_bound)
+            if distance < best_distance:
+                best_finger = finger_ip
+                best_distance = distance
+        return best_finger
+
+    def route_target(self, key_hash):
+        """Return `(next_hop, phase)` for `key_hash`, or `(None, "local")` if this node must handle it.
+
+        Tokens we adopted are ours and tokens we delegated go straight to
+        their delegate. Live fingers are preferred because they skip O(N)
+        ring hops; when no finger is closer we fall back to walking
+        predecessor/successor.
+        """
+        if self.token_of(key_hash, self.adopted_tokens):
+            return None, "local"
+        if self.lower_bound <= key_hash <= self.upper_bound:
+            delegated = self.token_of(key_hash, self.vnode_delegations)
+            if delegated:
+                return self.vnode_delegations[delegated], "forward_vnode"
+            return None, "local"
+        finger = self.closest_finger(key_hash)
+        if finger:
+            return finger, "forward_finger"
+        if key_hash < self.lower_bound and self.predecessor:
+            return self.predecessor, "forward_predecessor"
+        if key_hash > self.upper_bound and self.successor:
+            return self.successor, "forward_successor"
+        return None, "local"
+
+    def find_owner_response(self, key_hash):
+        """Answer a FIND_OWNER query with our range or the next hop towards `key_hash`."""
+        if self.lower_bound <= key_hash <= self.upper_bound:
+            return f"OK {self.endpoint()} {self.lower_bound} {self.upper_bound}"
+        next_hop, _ = self.route_target(key_hash)
+        if next_hop is None:
+            return "ERROR 404 No route"
+        return f"NEXT {next_hop}"
+
+    def find_owner(self, key_hash, timeout=0.5):
+        """Iteratively look up the node owning `key_hash`; return `(endpoint, lower, upper)` or None."""
+        peer, _ = self.route_target(key_hash)
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.sendto(f"OK {joinee_lower_bound} {joinee_upper_bound} {joinee_predecessor} {joinee_successor}".encode(), joinee)
+            sock.settimeout(timeout)
+            for _ in range(MAX_ROUTE_HOPS):
+                if peer is None:
+                    return None
+                try:
+                    sock.sendto(f"FIND_OWNER {key_hash}".encode(), endpoints.command_address(peer))
+                    data, _ = sock.recvfrom(1024)
+                except Exception:
+                    self.forget_finger(peer)
+                    return None
+                parts = data.decode().split(" ")
+                if parts[0] == "OK" and len(parts) == 4:
+                    return endpoints.normalize_endpoint(parts[1]), int(parts[2]), int(parts[3])
+                if parts[0] == "NEXT" and len(parts) == 2:
+                    peer = endpoints.normalize_endpoint(parts[1])
+                    continue
+                return None
+        return None
+
+    def refresh_finger(self, index):
+        """Recompute finger `index`; return False when the target key is ours and no lookup ran."""
+        key_hash = (self.upper_bound + 2 ** index) % HASH_MOD
+        if self.lower_bound <= key_hash <= self.upper_bound:
+            self.fingers.pop(index, None)
+            return False
+        owner = self.find_owner(key_hash)
+        if owner is None or owner[0] == self.endpoint():
+            self.fingers.pop(index, None)
+        else:
+            self.fingers[index] = owner
+        return True
+
+    def forget_finger(self, finger_ip):
+        """Drop every finger entry pointing at endpoint `finger_ip`."""
+        stale = [index for index, finger in list(self.fingers.items()) if finger[0] == finger_ip]
+        for index in stale:
+            self.fingers.pop(index, None)
+        if stale:
+            log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=finger_ip, result="finger_removed")
+
+    def prune_fingers(self):
+        """Ping every distinct finger at once and forget the ones that do not answer."""
+        alive = self.probe_engine.probe_many(finger[0] for finger in list(self.fingers.values()))
+        for finger_ip, answered in alive.items():
+            if not answered:
+                self.forget_finger(finger_ip)
+
+    def fix_fingers(self):
+        """Refresh one remote finger per tick and prune dead fingers once per full pass."""
+        while self.running:
+            if not self.crisis:
+                self.fix_fingers_tick()
+            time.sleep(FINGER_FIX_INTERVAL)
+
+    def fix_fingers_tick(self):
+        if self.next_finger == 0:
+            self.prune_fingers()
+        for _ in range(FINGER_COUNT):
+            index = self.next_finger
+            self.next_finger = (self.next_finger + 1) % FINGER_COUNT
+            if self.refresh_finger(index) or self.next_finger == 0:
+                break
+
+
+    #region Virtual nodes
+
+    def token_of(self, key_hash, tokens):
+        """Return the `(lower, upper)` token in `tokens` containing `key_hash`, or None."""
+        for lower_bound, upper_bound in list(tokens):
+            if lower_bound <= key_hash <= upper_bound:
+                return lower_bound, upper_bound
+        return None
+
+    def owns(self, key_hash):
+        """Return True if records hashing to `key_hash` must be stored on this node."""
+        if self.token_of(key_hash, self.adopted_tokens):
+            return True
+        return (
+            self.lower_bound <= key_hash <= self.upper_bound
+            and self.token_of(key_hash, self.vnode_delegations) is None
+        )
 
-        self.upper_bound = joinee_lower_bound - 1
-        self.successor = joinee[0]
+    def split_tokens(self, lower_bound, upper_bound, count):
+        """Cut `[lower_bound, upper_bound]` into at most `count` contiguous tokens."""
+        count = max(1, min(count, upper_bound - lower_bound + 1))
+        width = (upper_bound - lower_bound + 1) // count
+        tokens = []
+        for index in range(count):
+            token_lower = lower_bound + index * width
+            token_upper = upper_bound if index == count - 1 else token_lower + width - 1
+            tokens.append((token_lower, token_upper))
+        return tokens
+
+    def spread_absorbed_range(self, lower_bound, upper_bound):
+        """Deal a range absorbed from a failed neighbour to the live servers as tokens.
+
+        The range is cut into VNODE_TOKENS tokens handed out round-robin over
+        every live server (this one included), so the failed node's keys end
+        up on many survivors instead of all on us. Tokens nobody accepts stay
+        local. Returns the tokens delegated by this call.
+        """
+        if VNODE_TOKENS <= 1 or lower_bound > upper_bound:
+            return {}
+        own_ip = self.endpoint()
+        candidates = [own_ip] + sorted(set(self.failure_detector.alive_members()) - {own_ip})
+        delegated = {}
+        if len(candidates) > 1:
+            for index, token in enumerate(self.split_tokens(lower_bound, upper_bound, VNODE_TOKENS)):
+                delegate = candidates[index % len(candidates)]
+                if delegate != own_ip and self.request_adopt(delegate, token):
+                    self.vnode_delegations[token] = delegate
+                    delegated[token] = delegate
         log_event(
             logger,
             "INFO",
-            "range_split",
+            "vnodes_spread",
             node=self.name,
-            peer=joinee[0],
-            range={"lower": self.lower_bound, "upper": self.upper_bound},
-            result={"new_successor": self.successor},
+            range={"lower": lower_bound, "upper": upper_bound},
+            result={
+                "slices": VNODE_TOKENS,
+                "delegated": {f"{token[0]}-{token[1]}": delegate for token, delegate in delegated.items()},
+            },
         )
+        return delegated
 
-    def request_predecessor_change(self, target, new_predecessor):
-        """Notify `target` server that its predecessor should be changed to `new_predecessor`."""
-        if target is not None:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                sock.settimeout(1)
-                sock.sendto(f"PRED_CHANGE {new_predecessor}".encode(), (target, 12345))
-            logger.info("Requested predecessor change on %s -> %s", target, new_predecessor)
+    def request_adopt(self, delegate, token, timeout=0.5):
+        """Ask `delegate` to adopt `token`; return True once it confirms."""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            try:
+                sock.sendto(f"VNODE_ADOPT {token[0]} {token[1]} {self.endpoint()}".encode(), endpoints.command_address(delegate))
+                data, _ = sock.recvfrom(1024)
+                return data.decode() == "OK"
+            except Exception as e:
+                log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=delegate, result=f"vnode_adopt_failed:{e}")
+                return False
+
+    def check_adopted_token(self, owner, token, timeout=0.5):
+        """Ask `owner` whether we still hold `token`: True, False, or None when it does not answer."""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            try:
+                sock.sendto(f"VNODE_CHECK {token[0]} {token[1]} {self.endpoint()}".encode(), endpoints.command_address(owner))
+                data, _ = sock.recvfrom(1024)
+            except Exception:
+                return None
+        return data.decode() == "OK"
+
+    def reclaim_dead_delegations(self):
+        """Take back tokens whose delegate is dead or that left our range; return them."""
+        reclaimed = []
+        delegations = list(self.vnode_delegations.items())
+        inside = {
+            token: self.lower_bound <= token[0] and token[1] <= self.upper_bound
+            for token, _ in delegations
+        }
+        alive = self.probe_engine.probe_many(delegate for token, delegate in delegations if inside[token])
+        for token, delegate in delegations:
+            if alive.get(delegate):
+                continue
+            self.vnode_delegations.pop(token, None)
+            reclaimed.append(token)
+            log_event(
+                logger,
+                "WARNING",
+                "vnode_reclaimed",
+                node=self.name,
+                peer=delegate,
+                range={"lower": token[0], "upper": token[1]},
+                result="delegate_unreachable" if inside[token] else "outside_range",
+            )
+        return reclaimed
+
+    def vnode_manager(self):
+        """Keep adopted and delegated tokens consistent with their owners."""
+        while self.running:
+            if not self.crisis:
+                self.vnode_tick()
+            time.sleep(VNODE_CHECK_INTERVAL)
 
+    def vnode_tick(self):
+        """Confirm adopted tokens with their owners and reclaim tokens from dead delegates.
 
+        An adopted token is released when its owner answers RELEASE (it no
+        longer owns the range or took it back) or misses FAIL_TOLERANCE
+        checks in a row; its records are then re-placed by `correct_bd`.
+        """
+        released = []
+        for token, state in list(self.adopted_tokens.items()):
+            verdict = self.check_adopted_token(state["owner"], token)
+            if verdict:
+                state["misses"] = 0
+                continue
+            if verdict is None:
+                state["misses"] += 1
+                if state["misses"] < FAIL_TOLERANCE:
+                    continue
+            self.adopted_tokens.pop(token, None)
+            released.append(token)
+            log_event(
+                logger,
+                "INFO",
+                "vnode_released",
+                node=self.name,
+                peer=state["owner"],
+                range={"lower": token[0], "upper": token[1]},
+                result="owner_unreachable" if verdict is None else "owner_released",
+            )
+        self.reclaim_dead_delegations()
+        if released:
+            self.correct_bd()
 
 
     #region Services
@@ -805,120 +2197,328 @@ class ChatServer:
     def successors_provider(self):
         """Periodically advertise successor information to predecessor if needed."""
         while self.running:
-            if self.successor is None and self.predecessor:
-                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                    sock.sendto(f"SUCC {self.get_ip()}".encode(), (self.predecessor, 12345))
+            self.advertise_successors()
             time.sleep(5)
 
+    def advertise_successors(self):
+        """Seed the SUCC chain from the tail node towards its predecessor."""
+        if self.successor is None and self.predecessor:
+            self.send_datagram(f"SUCC {self.endpoint()}".encode(), endpoints.command_address(self.predecessor))
+
+
+    def register_metrics(self):
+        """Declare the metrics this node exports; queue and cache gauges are read on export."""
+        registry = self.metrics
+        registry.histogram("flock_command_seconds", "Handler run time per command verb.")
+        registry.histogram("flock_command_wait_seconds", "Time queued commands waited for a worker, per verb.")
+        registry.counter("flock_forwards_total", "Requests forwarded towards their owner, by verb and route.")
+        registry.counter("flock_replication_frames_total", "Replica datagrams sent, by mode.")
+        registry.counter("flock_replication_records_total", "Record copies sent to replicas, by mode.")
+        registry.histogram("flock_db_seconds", "Time each database critical section held the lock.")
+        registry.histogram("flock_db_wait_seconds", "Time spent waiting for the database lock.")
+        registry.gauge("flock_queue_depth", "Commands waiting per dispatcher lane.", callback=lambda: [
+            ({"lane": lane}, state["queued"]) for lane, state in self.dispatcher.queue_depths().items()
+        ])
+        registry.gauge("flock_queue_active", "Commands running per dispatcher lane.", callback=lambda: [
+            ({"lane": lane}, state["active"]) for lane, state in self.dispatcher.queue_depths().items()
+        ])
+        registry.counter("flock_queue_rejected_total", "Commands answered BUSY per dispatcher lane.", callback=lambda: [
+            ({"lane": lane}, state["rejected"]) for lane, state in self.dispatcher.queue_depths().items()
+        ])
+        registry.gauge("flock_register_stage_depth", "Registrations queued per REGISTER pipeline stage.", callback=lambda: [
+            ({"stage": stage}, stats["queued"])
+            for stage, stats in self.register_pipeline.snapshot().items() if isinstance(stats, dict)
+        ])
+        registry.gauge("flock_ring_epoch", "Highest ring epoch seen.", callback=lambda: self.ring_epoch)
+
+    def observe_command(self, verb, seconds, waited=None):
+        self.metrics.observe("flock_command_seconds", seconds, verb=verb)
+        if waited is not None:
+            self.metrics.observe("flock_command_wait_seconds", waited, verb=verb)
+
+    def hot_handlers(self, limit=HOT_HANDLER_ROWS):
+        """Verbs ranked by total handler time since start, with queue wait where they are queued."""
+        handlers = self.metrics.summary("flock_command_seconds", "verb")
+        waits = self.metrics.summary("flock_command_wait_seconds", "verb")
+        ranked = sorted(handlers.items(), key=lambda item: item[1]["sum"], reverse=True)[:limit]
+        return [
+            {
+                "verb": verb,
+                "calls": stats["count"],
+                "total_ms": round(stats["sum"] * 1000, 3),
+                "mean_ms": round(stats["mean"] * 1000, 3),
+                "p95_ms": stats["p95"] * 1000 if stats["p95"] != float("inf") else None,
+                "wait_mean_ms": round(waits[verb]["mean"] * 1000, 3) if verb in waits else None,
+            }
+            for verb, stats in ranked
+        ]
+
+    def observe_db_lock(self, waited, held):
+        self.metrics.observe("flock_db_wait_seconds", waited)
+        self.metrics.observe("flock_db_seconds", held)
+
+    def count_forward(self, verb, phase):
+        self.metrics.inc("flock_forwards_total", verb=verb, via=phase.replace("forward_", ""))
 
-    def tape_integrity_check(self):
-        """Check successor/predecessor liveness and broadcast FIX if ring integrity is compromised."""
+    def count_replication(self, mode, frames, records):
+        self.metrics.inc("flock_replication_frames_total", frames, mode=mode)
+        self.metrics.inc("flock_replication_records_total", records, mode=mode)
+
+    def metrics_writer(self):
+        """Rewrite FLOCK_METRICS_FILE in Prometheus text format every METRICS_INTERVAL seconds."""
+        if not METRICS_FILE or METRICS_INTERVAL <= 0:
+            return
         while self.running:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                broadcast_address = ("<broadcast>", 12345)
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                sock.settimeout(0.1)
-                try:
-                    if self.successor:
-                        sock.sendto("PING".encode(), (self.successor, 12346))
-                        _, _ = sock.recvfrom(1024)
+            self.write_metrics_file()
+            time.sleep(METRICS_INTERVAL)
+
+    def write_metrics_file(self):
+        try:
+            self.metrics.write_prometheus(METRICS_FILE)
+        except OSError as e:
+            logger.warning("Could not write metrics to %s: %s", METRICS_FILE, e)
+
+
+    #region Membership
+
+    def send_probe(self, data, address):
+        """SWIM traffic leaves from the health socket so acks come back to it."""
+        self.ping_socket.sendto(data, address)
+
+    def membership_manager(self):
+        """Drive the SWIM failure detector until the server stops."""
+        while self.running:
+            try:
+                self.membership_tick()
+            except Exception as e:
+                logger.error(f"Server error: {e}")
+            time.sleep(SWIM_TICK_INTERVAL)
+        logger.info("[INFO] Detector de fallos SWIM detenido")
+
+    def membership_tick(self):
+        """Track every server we route or replicate through, then advance the detector."""
+        known = [self.successor, self.predecessor, *self.successors, *self.replics, *self.replicants]
+        known.extend(finger[0] for finger in list(self.fingers.values()))
+        self.failure_detector.add_members(known)
+        self.failure_detector.tick()
+        self.probe_engine.expire()
+
+    def on_member_change(self, ip, state):
+        """React to SWIM verdicts; ring repair only starts on a confirmed failure of a neighbour."""
+        if state == swim.SUSPECT:
+            log_event(logger, "WARNING", "node_suspected", node=self.name, peer=ip, result="no_ack")
+        elif state == swim.ALIVE:
+            log_event(logger, "INFO", "node_recovered", node=self.name, peer=ip, result="suspicion_refuted")
+        elif state == swim.DEAD:
+            log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=ip, result="confirmed_dead")
+            self.forget_finger(ip)
+            # Stop listing it, so nothing routes or replicates through a tombstone.
+            self.successors = [successor for successor in self.successors if successor != ip]
+            if ip in self.replics:
+                self.replics = [replic for replic in self.replics if replic != ip]
+                self.replica_watermarks.pop(ip, None)
+                self.replica_inflight.pop(ip, None)
+            if ip in (self.successor, self.predecessor) or ip in self.replicants:
+                self.schedule_repair(ip)
+
+    def peer_failed(self, ip):
+        """Return True if `ip` should be repaired around.
+
+        The detector's verdict wins; only peers it has no opinion on, or
+        merely suspects, fall back to a direct PING.
+        """
+        state = self.failure_detector.state_of(ip)
+        if state == swim.DEAD:
+            return True
+        if state == swim.ALIVE:
+            return False
+        return not self.ping(ip)
+
+    def schedule_repair(self, ip):
+        """Queue a local FIX for `ip` on the topology lane, tagged with the current ring epoch.
 
-                    if self.predecessor:
-                        sock.sendto("PING".encode(), (self.predecessor, 12346))
-                        _, _ = sock.recvfrom(1024)
+        Only the servers linked to `ip` (its neighbours and the holders of
+        its replicas) get here, so a failure costs O(FAIL_TOLERANCE) repairs
+        instead of one per server. The detector keeps dead members as
+        tombstones, so each death is reported once per incarnation of the
+        peer. Together this bounds the repairs, which is why they may
+        overrun the lane bound.
+        """
+        log_event(logger, "WARNING", "repair_scheduled", node=self.name, peer=ip, result={"epoch": self.ring_epoch})
+        self.dispatcher.dispatch(
+            f"FIX {self.ring_epoch} {ip}",
+            endpoints.command_address(self.endpoint()),
+            force=True,
+        )
 
+    def advance_ring_epoch(self, seen=0):
+        """Bump the ring epoch past everything seen so far and return it."""
+        self.ring_epoch = max(self.ring_epoch, seen) + 1
+        return self.ring_epoch
+
+    def stabilizer(self):
+        """Run Chord stabilize rounds with our successor until the server stops."""
+        while self.running:
+            if not self.crisis:
+                try:
+                    self.stabilize_tick()
                 except Exception as e:
-                    log_event(
-                        logger,
-                        "WARNING",
-                        "node_unreachable",
-                        node=self.name,
-                        result=f"integrity_check_failed:{e}",
-                    )
-                    sock.sendto("FIX".encode(), broadcast_address)
-                    log_event(logger, "WARNING", "fix_started", node=self.name, result="broadcasted")
+                    logger.error(f"Server error: {e}")
+            time.sleep(STABILIZE_INTERVAL)
 
-            time.sleep(1)
+    def ring_request(self, peer, command, timeout=0.5):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.sendto(command.encode(), endpoints.command_address(peer))
+            data, _ = sock.recvfrom(1024)
+        return data.decode()
+
+    def notify(self, successor):
+        """Tell `successor` we believe we are its predecessor."""
+        message = f"NOTIFY {self.ring_epoch} {self.lower_bound} {self.upper_bound}"
+        self.send_datagram(message.encode(), endpoints.command_address(successor))
+
+    def stabilize_tick(self):
+        """One stabilize round: check that our successor points back at us.
 
-        logger.info("[INFO] Verificacion de integridad del anillo detenida")
+        When it names a live node between us, that node becomes our
+        successor; otherwise, or when its lower bound does not start right
+        after our upper bound, we NOTIFY it. Losing the successor itself is
+        left to the failure detector.
+        """
+        if self.orphaned_at is not None and time.monotonic() - self.orphaned_at >= RING_REPAIR_GRACE:
+            if self.predecessor and self.peer_failed(self.predecessor):
+                self.claim_orphaned_range("notify_timeout")
+            else:
+                self.orphaned_at = None
+        successor = self.successor
+        if successor is None or self.active_handoff():
+            return
+        try:
+            _, predecessor, lower_bound, _, epoch = self.ring_request(
+                successor, f"STABILIZE {self.ring_epoch} {self.lower_bound} {self.upper_bound} {self.endpoint()}"
+            ).split(" ")
+            lower_bound, epoch = int(lower_bound), int(epoch)
+            if predecessor != "_":
+                predecessor = endpoints.normalize_endpoint(predecessor)
+        except (OSError, ValueError):
+            return
+        self.ring_epoch = max(self.ring_epoch, epoch)
+        own_ip = self.endpoint()
+        if predecessor == own_ip and lower_bound == self.upper_bound + 1:
+            return
+        if predecessor not in ("_", own_ip) and not self.peer_failed(predecessor):
+            try:
+                _, between_lower, _ = self.ring_request(predecessor, "RANGE").split(" ")
+                between_lower = int(between_lower)
+            except (OSError, ValueError):
+                between_lower = None
+            if between_lower is not None and self.upper_bound < between_lower < lower_bound:
+                self.successor = predecessor
+                self.advance_ring_epoch()
+                log_event(
+                    logger,
+                    "WARNING",
+                    "successor_adopted",
+                    node=self.name,
+                    peer=predecessor,
+                    result={"previous": successor, "epoch": self.ring_epoch},
+                )
+        self.notify(self.successor)
 
     def fix_tape(self):
-        """Attempt to repair the ring by checking neighbors and promoting backups when needed."""
-        self.crisis = True
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.settimeout(0.1)
-            if self.successor:
-                try:
-                    sock.sendto(b"PING", (self.successor, 12346))
-                    _, _ = sock.recvfrom(1024)
-                except Exception:
-                    log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=self.successor, result="successor_ping_failed")
-                    self.fix_tape_forward()
-            time.sleep(0.1 * 3 * FAIL_TOLERANCE)
-            if self.predecessor:
-                try:
-                    sock.sendto(b"PING", (self.predecessor, 12346))
-                    _, _ = sock.recvfrom(1024)
-                except Exception:
-                    log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=self.predecessor, result="predecessor_ping_failed")
-                    self.fix_tape_backward()
+        """Repair around a failed successor or predecessor; only this node's own links change."""
+        if self.successor and self.peer_failed(self.successor):
+            log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=self.successor, result="successor_ping_failed")
+            self.fix_tape_forward()
+        if self.predecessor and self.peer_failed(self.predecessor):
+            log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=self.predecessor, result="predecessor_ping_failed")
+            self.fix_tape_backward()
         self.print_info()
-        self.crisis = False
 
                 
     def fix_tape_forward(self):
-        """Select a new successor from backup successors when the current successor fails."""
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.settimeout(0.1)
-            for successor in self.successors:
-                try:
-                    sock.sendto(f"PING".encode(), (successor, 12346))
-                    _, _ = sock.recvfrom(1024)
-                    sock.settimeout(5)
-                    sock.sendto(f"RANGE".encode(), (successor, 12345))
-                    data, _ = sock.recvfrom(1024)
-                    data.decode()
-                    _, lower_bound, _ = data.split()
-                    self.upper_bound = int(lower_bound) - 1
-                    self.request_predecessor_change(successor, self.get_ip())
-                    self.successor = successor
-                    log_event(
-                        logger,
-                        "WARNING",
-                        "successor_promoted",
-                        node=self.name,
-                        peer=successor,
-                        range={"lower": self.lower_bound, "upper": self.upper_bound},
-                        result="backup_successor_alive",
-                    )
-                    return
-                except Exception as e:
-                    log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=successor, result=str(e))
-            self.upper_bound = HASH_MOD - 1
-            self.successor = None
-            self.successors = []
-            logger.warning("No live successor found; node now owns tail of ring")
+        """Select a new successor from backup successors when the current successor fails.
+
+        Every backup is probed at once; the first live one in ring order wins.
+        """
+        absorbed_lower = self.upper_bound + 1
+        alive = self.probe_engine.probe_many(self.successors)
+        for successor in self.successors:
+            if not alive.get(successor):
+                log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=successor, result="backup_successor_silent")
+                continue
+            try:
+                _, lower_bound, _ = self.ring_request(successor, "RANGE", timeout=5).split()
+                self.upper_bound = int(lower_bound) - 1
+            except (OSError, ValueError) as e:
+                log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=successor, result=str(e))
+                continue
+            self.successor = successor
+            self.advance_ring_epoch()
+            self.notify(successor)
+            self.spread_absorbed_range(absorbed_lower, self.upper_bound)
+            log_event(
+                logger,
+                "WARNING",
+                "successor_promoted",
+                node=self.name,
+                peer=successor,
+                range={"lower": self.lower_bound, "upper": self.upper_bound},
+                result="backup_successor_alive",
+            )
+            return
+        self.upper_bound = HASH_MOD - 1
+        self.successor = None
+        self.successors = []
+        self.advance_ring_epoch()
+        logger.warning("No live successor found; node now owns tail of ring")
+        self.spread_absorbed_range(absorbed_lower, self.upper_bound)
 
     def fix_tape_backward(self):
-        """Handle predecessor failure by instructing it to terminate and clearing predecessor state."""
-        if self.predecessor:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                sock.settimeout(0.5)
-                try:
-                    sock.sendto(f"PING".encode(), (self.predecessor, 12346))
-                    _, _ = sock.recvfrom(1024)
-                except Exception:
-                    failed_predecessor = self.predecessor
-                    sock.sendto(f"KILL".encode(), (failed_predecessor, 12345))
-                    self.lower_bound = 0
-                    self.predecessor = None
-                    log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=failed_predecessor, result="predecessor_removed")
+        """Handle a dead predecessor.
+
+        The node before it absorbs its range and NOTIFYs us, so we only
+        extend down to 0 ourselves when the dead node was the head of the
+        ring, or when RING_REPAIR_GRACE passes without a NOTIFY.
+        """
+        if not self.predecessor or self.orphaned_at is not None:
+            return
+        if self.predecessor_range and self.predecessor_range[0] == 0:
+            self.claim_orphaned_range("predecessor_was_head")
+            return
+        self.orphaned_at = time.monotonic()
+        log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=self.predecessor, result="awaiting_notify")
+
+    def claim_orphaned_range(self, reason):
+        """Become the head of the ring, absorbing everything below our range."""
+        failed_predecessor = self.predecessor
+        self.send_datagram(b"KILL", endpoints.command_address(failed_predecessor))
+        absorbed_upper = self.lower_bound - 1
+        self.lower_bound = 0
+        self.predecessor = None
+        self.predecessor_range = None
+        self.orphaned_at = None
+        self.advance_ring_epoch()
+        log_event(
+            logger,
+            "WARNING",
+            "node_unreachable",
+            node=self.name,
+            peer=failed_predecessor,
+            range={"lower": self.lower_bound, "upper": self.upper_bound},
+            result={"action": "predecessor_removed", "reason": reason, "epoch": self.ring_epoch},
+        )
+        self.spread_absorbed_range(0, absorbed_upper)
 
 
     def correct_bd(self):
-        """Move users that do not belong to this node's range to the correct nodes."""
+        """Move users that do not belong to this node's range or tokens to the correct nodes."""
         with self.db_lock:
-            alien_users = self.db_manager.get_alien_users(self.lower_bound, self.upper_bound, self.rolling_hash)
+            alien_users = self.db_manager.get_alien_users(self.lower_bound, self.upper_bound)
+            for lower_bound, upper_bound in list(self.vnode_delegations):
+                alien_users.extend(self.db_manager.list_users_in_range(lower_bound, upper_bound))
+        alien_users = [user for user in alien_users if not self.owns(self.rolling_hash(user[0]))]
         for user in alien_users:
             self.place_user_record(
                 user[0],
@@ -934,67 +2534,145 @@ class ChatServer:
 
     def replics_manager(self):
         """Maintain a set of replicator servers that hold copies of this node's user data."""
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            last_full_sync = 0.0
-            while self.running:
-                if self.crisis:
-                    time.sleep(1)
-                    continue
-                new_replics_needed = FAIL_TOLERANCE + 1 - len(self.replics)
-                replics = self.replics.copy()
-                for replic in replics:
-                    if not self.ping(replic): 
-                        new_replics_needed += 1
-                        replics.remove(replic)
-                        sock.sendto(f"DROP_REPLICS {self.get_ip()}".encode(), (replic, 12345))
-                        log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=replic, result="replica_target_removed")
-                new_replics = []
-                if new_replics_needed > 0:
-                    new_replics = self.find_new_replics(new_replics_needed, replics)
-                    if new_replics:
-                        logger.info("[OK] Nuevos nodos de replica seleccionados: %s", new_replics)
-                    replics.extend(new_replics)
-                self.replics = replics
-
-                full_sync_targets = list(new_replics)
-                if time.time() - last_full_sync >= REPLICA_FULL_SYNC_INTERVAL:
-                    full_sync_targets = list(replics)
-                    last_full_sync = time.time()
-
-                if full_sync_targets:
-                    with self.db_lock:
-                        user_info = self.db_manager.get_bd_copy()
-                    self.replicate_owned_records(user_info, targets=full_sync_targets)
-                time.sleep(1)
+        while self.running:
+            if not self.crisis:
+                self.replics_manager_tick()
+            time.sleep(1)
 
+    def replics_manager_tick(self):
+        """Run one replica-maintenance pass: drop dead replicas, converge on the placement and sync.
 
-    def find_new_replics(self, needed, actual_replics):
-        """Return a list of `needed` server IPs chosen as new replicators (excluding this node)."""
-        servers = self.ping_all_servers()
-        if not servers:
-            return []
+        A live replica that fell out of the placement keeps its copy until
+        every replica in the placement has acknowledged one.
+        """
+        alive = self.probe_engine.probe_many(self.replics)
+        for replic in self.replics:
+            if not alive.get(replic):
+                self.send_datagram(f"DROP_REPLICS {self.endpoint()}".encode(), endpoints.command_address(replic))
+                log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=replic, result="replica_target_removed")
+        replics = self.replica_placement()
+        new_replics = [replic for replic in replics if replic not in self.replics]
+        if new_replics:
+            logger.info("[OK] Nuevos nodos de replica seleccionados: %s", new_replics)
+        warm = all(self.replica_watermarks.get(replic) is not None for replic in replics)
+        for replic in self.replics:
+            if replic in replics or not alive.get(replic):
+                continue
+            if not warm:
+                replics.append(replic)
+                continue
+            self.send_datagram(f"DROP_REPLICS {self.endpoint()}".encode(), endpoints.command_address(replic))
+            log_event(logger, "INFO", "replica_moved", node=self.name, peer=replic, result="outside_placement")
+        self.replics = replics
+
+        for replic in list(self.replica_watermarks):
+            if replic not in replics:
+                self.replica_watermarks.pop(replic, None)
+                self.replica_inflight.pop(replic, None)
+
+        self.sync_replicas(replics)
+
+    def sync_replicas(self, replics):
+        """Ship each replica the owned records changed since its acknowledged watermark.
+
+        New replicas, and replicas that have not acknowledged anything for
+        REPLICA_FULL_SYNC_INTERVAL seconds, get a full copy instead.
+        """
+        with self.db_lock:
+            current_seq = self.db_manager.current_change_seq()
+        now = time.time()
+        for replic in replics:
+            acked_seq = self.replica_watermarks.get(replic)
+            inflight = self.replica_inflight.get(replic)
+            if acked_seq is not None and acked_seq >= current_seq:
+                continue
+            if inflight and inflight["seq"] >= current_seq and now - inflight["sent_at"] < REPLICA_ACK_TIMEOUT:
+                continue
+
+            full_sync = acked_seq is None or (
+                inflight is not None and now - inflight["first_sent_at"] >= REPLICA_FULL_SYNC_INTERVAL
+            )
+            with self.db_lock:
+                current_seq = self.db_manager.current_change_seq()
+                if full_sync:
+                    records = self.db_manager.get_bd_copy()
+                else:
+                    records = self.db_manager.get_changes_since(acked_seq)
+
+            frames = self.replica_batch_frames(records, change_seq=current_seq)
+            for frame, _ in frames:
+                self.send_datagram(frame, endpoints.command_address(replic))
+            self.count_replication("full_sync" if full_sync else "delta_sync", len(frames), len(records))
+            self.replica_inflight[replic] = {
+                "seq": current_seq,
+                "frames": len(frames),
+                "acked": set(),
+                "sent_at": now,
+                "first_sent_at": inflight["first_sent_at"] if inflight else now,
+            }
+            log_event(
+                logger,
+                "DEBUG",
+                "replica_sync_sent",
+                node=self.name,
+                peer=replic,
+                result={
+                    "mode": "full" if full_sync else "delta",
+                    "from_seq": acked_seq,
+                    "to_seq": current_seq,
+                    "records": len(records),
+                    "frames": len(frames),
+                },
+            )
 
-        try:
-            servers.remove(self.get_ip())
-        except Exception:
-            pass
+    def acknowledge_replica_frame(self, replic, change_seq, index, total):
+        """Record a REPLIC_ACK; advance the watermark once every frame of the batch is acked."""
+        inflight = self.replica_inflight.get(replic)
+        if not inflight or inflight["seq"] != change_seq or inflight["frames"] != total:
+            return False
+        inflight["acked"].add(index)
+        if len(inflight["acked"]) < total:
+            return False
+        self.replica_inflight.pop(replic, None)
+        self.replica_watermarks[replic] = max(change_seq, self.replica_watermarks.get(replic, 0))
+        return True
 
-        for replic in actual_replics:
-            try:
-                servers.remove(replic)
-            except Exception:
-                pass
 
-        needed = min(needed, len(servers))
+    def replica_placement(self, count=None):
+        """Return the `count` servers that should hold our replicas, from local state only.
 
-        return random.sample(servers, needed)        
+        Up to REPLICA_RING_SPAN live successors come first, in ring order.
+        The rest of the live membership table follows, ranked by a rendezvous
+        hash of (our endpoint, member endpoint), so each owner spreads its remaining
+        copies over different servers. Successors past the span fill in when
+        the table is too small.
+        """
+        count = FAIL_TOLERANCE + 1 if count is None else count
+        own_ip = self.endpoint()
+
+        def usable(ip):
+            return ip and ip != own_ip and self.failure_detector.state_of(ip) in (None, swim.ALIVE)
+
+        successors = [ip for ip in dict.fromkeys(self.successors) if usable(ip)]
+        placement = successors[: min(count, REPLICA_RING_SPAN)]
+        others = [ip for ip in self.failure_detector.alive_members() if usable(ip) and ip not in placement]
+        others.sort(key=lambda ip: hashlib.sha256(f"{own_ip}|{ip}".encode()).digest())
+        for ip in others + successors:
+            if len(placement) >= count:
+                break
+            if ip not in placement:
+                placement.append(ip)
+        return placement
 
 
     def replicants_manager(self):
         """Assimilate data from replicant nodes that become unavailable (one-shot)."""
         assimilated_records = []
-        for replicant in list(self.replicants):
-            if not self.ping(replicant):
+        with self.replicants_lock:
+            replicants = list(self.replicants)
+        alive = self.probe_engine.probe_many(replicants)
+        for replicant in replicants:
+            if not alive.get(replicant):
                 log_event(logger, "WARNING", "node_unreachable", node=self.name, peer=replicant, result="replica_owner_unavailable")
                 with self.db_lock:
                     user_info = self.db_manager.get_replics(replicant)
@@ -1006,9 +2684,9 @@ class ChatServer:
                         user[3],
                         user[4],
                     )
-                    if resolution not in ("forwarded_predecessor", "forwarded_successor", db_manager.STALE, db_manager.IDENTITY_CONFLICT):
+                    if resolution not in (*FORWARDED_RESOLUTIONS, db_manager.STALE, db_manager.IDENTITY_CONFLICT):
                         assimilated_records.append(user)
-                self.replicants.remove(replicant)
+                self.discard_replicant(replicant)
                 with self.db_lock:
                     self.db_manager.drop_replics(replicant)
                 log_event(
@@ -1039,7 +2717,8 @@ class ChatServer:
         """Return the best IP this server should advertise to other nodes.
 
         `FLOCK_NODE_IP` is the explicit override for multi-machine demos.
-        `FLOCK_PUBLIC_IP` is accepted as a compatibility alias.
+        `FLOCK_PUBLIC_IP` is accepted as a compatibility alias. A specific
+        FLOCK_BIND_ADDRESS comes next, since datagrams leave from it.
         """
         for env_name in ("FLOCK_NODE_IP", "FLOCK_PUBLIC_IP"):
             explicit_ip = os.environ.get(env_name, "").strip()
@@ -1055,10 +2734,13 @@ class ChatServer:
                     reason=f"{env_name} is not a valid IPv4 address",
                 )
 
+        if self._valid_ipv4(BIND_ADDRESS):
+            return BIND_ADDRESS
+
         if target_ip:
             try:
                 with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                    sock.connect((target_ip, 12345))
+                    sock.connect((target_ip, SERVER_PORT))
                     candidate = sock.getsockname()[0]
                     if self._valid_ipv4(candidate) and (
                         not self._is_loopback_ip(candidate) or self._is_loopback_ip(target_ip)
@@ -1087,97 +2769,124 @@ class ChatServer:
         return "127.0.0.1"
     
 
+    def endpoint(self):
+        """This node's identity on the ring: `<advertised ip>:<command port>`."""
+        return endpoints.format_endpoint(self.get_ip(), SERVER_PORT)
+
+    def peer_of(self, address):
+        """Endpoint of the server whose command socket sent from `address`.
+
+        Fire-and-forget traffic (REPLIC*, NOTIFY, forwards) leaves from the
+        sender's bound command socket, so its source address is its endpoint.
+        """
+        return endpoints.format_endpoint(*address)
+
+    def claimed_endpoint(self, fields, address):
+        """Endpoint a request names for its sender in its optional trailing `fields`.
+
+        Requests expecting a reply leave from a throwaway socket, so the
+        sender appends its endpoint; servers that predate endpoints did not,
+        and always listened on the default port of their ip.
+        """
+        if len(fields) > 1:
+            raise ValueError(f"Unexpected fields: {fields}")
+        if fields:
+            return endpoints.normalize_endpoint(fields[0])
+        return endpoints.format_endpoint(address[0], endpoints.DEFAULT_PORT)
+
+    def send_datagram(self, data, address):
+        """Send a fire-and-forget datagram without opening a socket per message."""
+        self.outbound_socket.sendto(data, address)
+
     def ping(self, ip, timeout=0.1):
-        """Return True if `ip` responds to a short UDP PING within `timeout` seconds."""
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.settimeout(timeout)
-            try:
-                sock.sendto(b"PING", (ip, 12346))
-                _, _ = sock.recvfrom(1024)
-                return True
-            except Exception:
-                return False
+        """Return True if `ip` responds to a nonce-tagged PING within `timeout` seconds."""
+        return self.probe_engine.ping(ip, timeout)
             
-    def ping_all_servers(self, timeout=0.1):
-        """Broadcast a PING and collect responding server IPs."""
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.settimeout(timeout)
-            servers = []
-            broadcast_address = ("<broadcast>", 12346)
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            try:
-                sock.sendto("PING".encode(), broadcast_address)
-                while True:
-                    _, address = sock.recvfrom(1024)
-                    servers.append(address[0])
-            except socket.timeout:
-                pass
-
-            return servers
 
 
     def print_info(self):
         """Print a short status block describing the server state."""
         logger.info("Estado del nodo '%s'", self.name)
-        logger.info("  Direccion: %s:12345", self.get_ip())
+        logger.info("  Direccion: %s", self.endpoint())
         logger.info("  Rango hash: [%s, %s]", self.lower_bound, self.upper_bound)
         logger.info("  Predecesor: %s", self.predecessor or "ninguno")
         logger.info("  Sucesor: %s", self.successor or "ninguno")
         logger.info("  Sucesores respaldo: %s", self.successors or "[]")
         logger.info("  Replicas propias en: %s", self.replics or "[]")
         logger.info("  Replicas recibidas de: %s", self.replicants or "[]")
+        logger.info("  Fingers: %s", sorted({finger[0] for finger in self.fingers.values()}) or "[]")
+        logger.info("  Tokens delegados: %s | adoptados: %s", len(self.vnode_delegations), len(self.adopted_tokens))
         logger.info("-" * 72)
 
-    def send_json_response(self, address, payload, ok=True):
-        status = "OK" if ok else "ERROR"
-        response = json.dumps(payload, sort_keys=True, separators=(",", ":"))
-        self.command_socket.sendto(f"{status} {response}".encode(), address)
+    def send_json_response(self, address, payload, ok=True, compress=False):
+        self.command_socket.sendto(wire_codec.encode_json_reply(payload, ok=ok, compress=compress), address)
+
+    def crypto_cache_stats(self):
+        """Signature-result cache stats, plus the parsed-key LRU when it lives in this process."""
+        stats = {"signatures": self.signature_cache.stats()}
+        pipeline = self.register_pipeline
+        if pipeline.executor_kind != "process" or not pipeline.running:
+            stats["public_keys"] = signature_verifier.PUBLIC_KEY_CACHE.stats()
+        return stats
 
     def status_payload(self):
         return {
             "name": self.name,
             "ip": self.get_ip(),
+            "endpoint": self.endpoint(),
             "range": {"lower": self.lower_bound, "upper": self.upper_bound},
             "predecessor": self.predecessor,
             "successor": self.successor,
             "successors": list(self.successors),
+            "ring_epoch": self.ring_epoch,
             "replicas": list(self.replics),
             "replics": list(self.replics),
             "replicants": list(self.replicants),
+            "replica_watermarks": dict(self.replica_watermarks),
+            "queues": self.dispatcher.queue_depths(),
+            "fingers": {str(index): finger[0] for index, finger in sorted(self.fingers.items())},
+            "crypto_cache": self.crypto_cache_stats(),
+            "register_pipeline": self.register_pipeline.snapshot(),
+            "record_cache": self.db_manager.record_cache_stats(),
+            "resolve_cache": {
+                "records": self.resolve_cache.stats(),
+                "negative": self.resolve_miss_cache.stats(),
+                "pending": self.pending_resolves.stats(),
+            },
+            "membership": self.failure_detector.snapshot(),
+            "replica_placement": self.replica_placement(),
+            "probes": self.probe_engine.snapshot(),
+            "logging": logging_stats(logger),
+            "hot_handlers": self.hot_handlers(),
+            "profiling": self.profiler.status(),
+            "vnodes": {
+                "delegated": {f"{token[0]}-{token[1]}": delegate for token, delegate in sorted(self.vnode_delegations.items())},
+                "adopted": {f"{token[0]}-{token[1]}": state["owner"] for token, state in sorted(self.adopted_tokens.items())},
+            },
         }
 
     def record_hash(self, record):
         canonical = json.dumps(record, sort_keys=True, separators=(",", ":"))
         return hashlib.sha256(canonical.encode()).hexdigest()
 
-    def snapshot_payload(self):
+    def snapshot_entries(self):
+        """Return snapshot rows sorted by cursor key, rebuilt only when the database changed."""
         with self.db_lock:
+            sequences = (self.db_manager.current_change_seq(), self.db_manager.current_replica_seq())
+            if self.snapshot_cache and self.snapshot_cache[0] == sequences:
+                return self.snapshot_cache[1]
             owned_records = self.db_manager.list_owned_records()
             replica_records = self.db_manager.list_replica_records()
 
-        owner_ip = self.get_ip()
-        owned = []
-        for username, ip, port, public_key, version in owned_records:
-            canonical = {
-                "type": "owned",
-                "username": username,
-                "ip": ip,
-                "port": port,
-                "public_key": public_key,
-                "version": version,
-                "owner": owner_ip,
-            }
-            owned.append({
-                "username": username,
-                "version": version,
-                "owner": owner_ip,
-                "hash": self.record_hash(canonical),
-            })
+        owner = self.endpoint()
+        rows = [("owned", owner, *record) for record in owned_records]
+        rows.extend(("replicas", owner, username, ip, port, public_key, version)
+                    for username, ip, port, public_key, version, owner in replica_records)
 
-        replicas = []
-        for username, ip, port, public_key, version, owner in replica_records:
+        entries = []
+        for section, owner, username, ip, port, public_key, version in rows:
             canonical = {
-                "type": "replica",
+                "type": "owned" if section == "owned" else "replica",
                 "username": username,
                 "ip": ip,
                 "port": port,
@@ -1185,25 +2894,195 @@ class ChatServer:
                 "version": version,
                 "owner": owner,
             }
-            replicas.append({
+            entry = {
                 "username": username,
                 "version": version,
                 "owner": owner,
                 "hash": self.record_hash(canonical),
-            })
+            }
+            size = len(json.dumps(entry, sort_keys=True, separators=(",", ":"))) + 1
+            entries.append(((section, owner, username), entry, size))
+        entries.sort(key=lambda item: item[0])
+        self.snapshot_cache = (sequences, entries)
+        return entries
+
+    def snapshot_payload(self):
+        payload = {"owned": [], "replicas": []}
+        for (section, _, _), entry, _ in self.snapshot_entries():
+            payload[section].append(entry)
+        return payload
+
+    @staticmethod
+    def encode_snapshot_cursor(key):
+        return base64.urlsafe_b64encode(json.dumps(list(key), separators=(",", ":")).encode()).decode()
+
+    @staticmethod
+    def decode_snapshot_cursor(cursor):
+        try:
+            section, owner, username = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid snapshot cursor: {cursor}") from e
+        return section, owner, username
+
+    def snapshot_reply(self, cursor=None, compress=False, page_bytes=None):
+        """Encode the snapshot page that starts right after `cursor` as one datagram.
+
+        Pages are keyset-paginated on (section, owner, username), so a cursor
+        stays valid while records change between requests. Each page holds as
+        many rows as fit in `page_bytes`; with compression the raw budget is
+        widened and halved again until the compressed page fits.
+        """
+        page_bytes = page_bytes or SNAPSHOT_PAGE_BYTES
+        entries = self.snapshot_entries()
+        start = 0
+        if cursor:
+            start = bisect.bisect_right([key for key, _, _ in entries], self.decode_snapshot_cursor(cursor))
+
+        budget = (page_bytes * 4 if compress else page_bytes) - SNAPSHOT_ENVELOPE_BYTES
+        while True:
+            payload = {"owned": [], "replicas": [], "total": len(entries)}
+            used = 0
+            end = start
+            for key, entry, size in entries[start:]:
+                if end > start and used + size > budget:
+                    break
+                payload[key[0]].append(entry)
+                used += size
+                end += 1
+            payload["next"] = self.encode_snapshot_cursor(entries[end - 1][0]) if end < len(entries) else None
+            reply = wire_codec.encode_json_reply(payload, compress=compress)
+            if len(reply) <= page_bytes or end - start <= 1:
+                return reply
+            budget //= 2
+
+    def merkle_tree(self, scope):
+        """Return the Merkle tree for `owned` or `replica:<owner>`.
+
+        A cached tree is refreshed by re-reading only the buckets written
+        since it was built; each replica owner's tree is tracked on its own.
+        """
+        if scope == "owned":
+            owner = None
+        elif scope.startswith("replica:") and len(scope) > len("replica:"):
+            owner = scope.split(":", 1)[1]
+        else:
+            raise ValueError(f"Unknown Merkle scope: {scope}")
 
-        return {"owned": owned, "replicas": replicas}
+        # Taking the changes and storing the refreshed tree happen under one
+        # lock hold, so concurrent callers cannot drop each other's buckets.
+        with self.db_lock:
+            changes = self.db_manager.take_merkle_changes(owner)
+            tree = self.merkle_cache.get(scope)
+            if tree is None or changes is None:
+                records = self.db_manager.list_owned_records() if owner is None else self.db_manager.get_replics(owner)
+                tree = merkle.MerkleTree(records, self.rolling_hash, HASH_MOD, MERKLE_BUCKETS)
+            elif changes:
+                buckets = {tree.bucket_of(user_hash) for user_hash in changes}
+                tree = tree.with_buckets({bucket: self.merkle_bucket_records(owner, tree, bucket) for bucket in buckets})
+            self.merkle_cache[scope] = tree
+            return tree
+
+    def merkle_bucket_records(self, owner, tree, bucket):
+        lower, upper = tree.bucket_bounds(bucket)
+        if owner is None:
+            return self.db_manager.list_users_in_range(lower, upper)
+        return self.db_manager.list_replics_in_range(owner, lower, upper)
 
     def checksum_payload(self):
-        snapshot = self.snapshot_payload()
-        canonical = json.dumps(snapshot, sort_keys=True, separators=(",", ":"))
+        """Summarize local state by the Merkle roots of owned records and of each replica owner."""
+        with self.db_lock:
+            owners = sorted({record[5] for record in self.db_manager.list_replica_records()})
+        scopes = ["owned", *(f"replica:{owner}" for owner in owners)]
+        trees = {scope: self.merkle_tree(scope) for scope in scopes}
+        roots = {scope: tree.root for scope, tree in trees.items()}
+        canonical = json.dumps(roots, sort_keys=True, separators=(",", ":"))
         payload = {
             "checksum": hashlib.sha256(canonical.encode()).hexdigest(),
-            "records": len(snapshot["owned"]) + len(snapshot["replicas"]),
+            "records": sum(len(contents) for tree in trees.values() for contents in tree.bucket_contents),
+            "merkle": roots,
         }
         log_event(logger, "INFO", "checksum_generated", node=self.name, result=payload)
         return payload
 
+    def request_json(self, peer, command, timeout=1.0):
+        """Send an admin `command` to `peer` and return its decoded `OK <json>` reply."""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.sendto(command.encode(), endpoints.command_address(peer))
+            data, _ = sock.recvfrom(65535)
+        ok, payload = wire_codec.decode_json_reply(data)
+        if not ok or isinstance(payload, str):
+            raise ValueError(f"{command.split(' ', 1)[0]} failed on {peer}: {str(payload)[:120]}")
+        return payload
+
+    def reconcile_replicas(self, owner):
+        """Repair our replica of `owner` by walking only the Merkle subtrees that differ.
+
+        Digests are fetched level by level with one MERKLE request per level;
+        only divergent leaves are downloaded with MERKLE_BUCKET.
+        """
+        local = self.merkle_tree(f"replica:{owner}")
+        result = {"owner": owner, "requests": 0, "buckets": 0, "applied": 0, "deleted": 0, "rejected": 0}
+        frontier = [1]
+        divergent = []
+        while frontier:
+            remote_nodes = {}
+            for start in range(0, len(frontier), MERKLE_NODES_PER_REQUEST):
+                chunk = frontier[start:start + MERKLE_NODES_PER_REQUEST]
+                reply = self.request_json(owner, "MERKLE owned " + " ".join(str(node) for node in chunk))
+                result["requests"] += 1
+                if reply["buckets"] != local.buckets:
+                    raise ValueError(f"Merkle bucket count mismatch with {owner}")
+                remote_nodes.update(reply["nodes"])
+            next_frontier = []
+            for node in frontier:
+                remote = remote_nodes[str(node)]
+                if remote["digest"] == local.digest(node):
+                    continue
+                if "bucket" in remote:
+                    divergent.append(remote["bucket"])
+                else:
+                    next_frontier.extend(remote["children"])
+            frontier = next_frontier
+
+        for bucket in divergent:
+            remote_records = [tuple(record) for record in self.request_json(owner, f"MERKLE_BUCKET owned {bucket}")["records"]]
+            result["requests"] += 1
+            remote_usernames = {record[0] for record in remote_records}
+            with self.db_lock:
+                # Re-read the bucket: replicas pushed since the tree was built must not be judged stale.
+                local_records = self.db_manager.list_replics_in_range(owner, *local.bucket_bounds(bucket))
+                extra = [record[0] for record in local_records if record[0] not in remote_usernames]
+                results = self.db_manager.upsert_replic_users(remote_records, owner=owner)
+                result["deleted"] += self.db_manager.delete_replic_users(owner, extra)
+            result["applied"] += sum(1 for _, resolution, _ in results if resolution == db_manager.APPLIED)
+            result["rejected"] += sum(1 for _, _, stored in results if not stored)
+        result["buckets"] = len(divergent)
+
+        log_event(
+            logger,
+            "INFO" if divergent else "DEBUG",
+            "replica_reconciled",
+            node=self.name,
+            peer=owner,
+            result=result,
+        )
+        return result
+
+    def anti_entropy(self):
+        """Periodically reconcile every replica we hold against its owner's Merkle tree."""
+        while self.running:
+            time.sleep(ANTI_ENTROPY_INTERVAL)
+            if not self.crisis:
+                self.anti_entropy_tick()
+
+    def anti_entropy_tick(self):
+        for owner in list(self.replicants):
+            try:
+                self.reconcile_replicas(owner)
+            except Exception as e:
+                logger.warning("Anti-entropy with %s failed: %s", owner, e)
+
     def sync_from_owner(self, owner):
         with self.db_lock:
             user_info = self.db_manager.get_replics(owner)
@@ -1219,7 +3098,7 @@ class ChatServer:
                 user[3],
                 user[4],
             )
-            if resolution in ("forwarded_predecessor", "forwarded_successor"):
+            if resolution in FORWARDED_RESOLUTIONS:
                 forwarded += 1
             elif resolution in (db_manager.STALE, db_manager.IDENTITY_CONFLICT):
                 rejected += 1
@@ -1239,47 +3118,106 @@ class ChatServer:
         return result
 
     def replicate_owned_records(self, records, targets=None, log_level="DEBUG"):
+        """Push owned records to `targets`; return how many record copies were sent.
+
+        A single record keeps the plain REPLIC frame; larger sets are packed
+        into REPLIC_BATCH datagrams of at most REPLICA_BATCH_BYTES each.
+        """
         targets = list(self.replics if targets is None else targets)
         if not records or not targets:
             return 0
+        if len(records) == 1:
+            username, ip, port, public_key, version = records[0]
+            frames = [(f"REPLIC {username} {ip} {port} {version} {public_key}".encode(), records)]
+        else:
+            frames = self.replica_batch_frames(records)
+
         sent = 0
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            for user in records:
-                username, ip, port, public_key, version = user
-                for replic in targets:
-                    sock.sendto(
-                        f"REPLIC {username} {ip} {port} {version} {public_key}".encode(),
-                        (replic, 12345),
-                    )
-                    sent += 1
-                    log_event(
-                        logger,
-                        log_level,
-                        "replica_written",
-                        node=self.name,
-                        peer=replic,
-                        username=username,
-                        version=version,
-                        result="sent",
-                    )
+        for replic in targets:
+            for frame, batch in frames:
+                self.send_datagram(frame, endpoints.command_address(replic))
+                sent += len(batch)
+                log_event(
+                    logger,
+                    log_level,
+                    "replica_written",
+                    node=self.name,
+                    peer=replic,
+                    username=batch[0][0] if len(batch) == 1 else None,
+                    version=batch[0][4] if len(batch) == 1 else None,
+                    result="sent" if len(batch) == 1 else {"status": "sent", "records": len(batch), "bytes": len(frame)},
+                )
+            self.count_replication("push", len(frames), len(records))
         return sent
 
+    def replica_batch_frames(self, records, max_bytes=None, change_seq=None):
+        """Pack records into `[(REPLIC_BATCH datagram, records_in_it), ...]`.
+
+        With `change_seq`, each header also carries `<seq> <index> <total>`
+        so the replica can acknowledge every frame with REPLIC_ACK; an empty
+        record list then still yields one frame to move the watermark.
+        """
+        max_bytes = max_bytes or REPLICA_BATCH_BYTES
+        groups = []
+        lines = []
+        batch = []
+        size = 0
+
+        def flush():
+            groups.append((lines, batch))
+
+        for record in records:
+            username, ip, port, public_key, version = record
+            line = f"{username} {ip} {port} {version} {public_key}"
+            line_size = len(line.encode()) + 1
+            if batch and size + line_size > max_bytes:
+                flush()
+                lines, batch, size = [], [], 0
+            lines.append(line)
+            batch.append(record)
+            size += line_size
+        if batch or (change_seq is not None and not groups):
+            flush()
+
+        frames = []
+        for index, (lines, batch) in enumerate(groups):
+            header = f"REPLIC_BATCH {len(batch)}"
+            if change_seq is not None:
+                header += f" {change_seq} {index} {len(groups)}"
+            frames.append(("\n".join([header, *lines]).encode(), list(batch)))
+        return frames
+
+    def parse_replica_batch(self, message):
+        """Return `(records, ack)` for a REPLIC_BATCH frame.
+
+        `ack` is `(change_seq, index, total)` for watermark batches and None otherwise.
+        """
+        header, *lines = message.split("\n")
+        _, count, *sequence = header.split(" ")
+        ack = tuple(int(value) for value in sequence) if sequence else None
+        if ack is not None and len(ack) != 3:
+            raise ValueError("REPLIC_BATCH header must carry <seq> <index> <total>")
+        if int(count) != len(lines):
+            raise ValueError("REPLIC_BATCH record count mismatch")
+        return self.parse_record_lines(lines), ack
+
+    def parse_record_lines(self, lines):
+        """Parse `<username> <ip> <port> <version> <public_key>` lines into owned-record tuples."""
+        records = []
+        for line in lines:
+            username, ip, port, version, public_key = line.split(" ", 4)
+            records.append((username, ip, int(port), public_key, int(version)))
+        return records
+
     def rolling_hash(self, s: str, base=911382629, mod=HASH_MOD) -> int:   
         """Compute a rolling hash for string `s` used to distribute keys in the ring."""
-        hash_value = 0
-        for c in s:
-            hash_value = (hash_value * base + ord(c)) % mod
-        return hash_value
+        return db_manager.ring_hash(s, base=base, mod=mod)
     
 
 
     # region Multicast Stuff
-    def multicast_listener(self) -> None:
-        """Listen for multicast discovery messages and reply with this server's IP."""
-        MCAST_GRP = "224.0.0.1"
-        MCAST_PORT = 10003
-        DISCOVER_MSG = "DISCOVER_SERVER"
-        BUFFER_SIZE = 1024
+    def open_multicast_socket(self):
+        """Create the UDP socket bound to the discovery port and joined to the multicast group."""
         # Crear socket UDP
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         # Permitir que varias instancias puedan reutilizar el puerto
@@ -1292,23 +3230,27 @@ class ChatServer:
         mreq = struct.pack("=4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
         sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
-        
         logger.info("[Multicast] Escuchando descubrimiento en %s:%s", MCAST_GRP, MCAST_PORT)
-        
+        return sock
+
+    def multicast_reply(self, message, addr):
+        """Return `(payload, target)` answering a multicast discovery datagram with our endpoint."""
+        logger.info("[Multicast] Mensaje recibido desde %s: %s", addr, message)
+        local_endpoint = self.endpoint()
+        if message.startswith(MCAST_DISCOVER_MSG + ":"):
+            _, rec_ip, rec_port = message.split(":")
+            logger.debug(f"Multicast reply target {rec_ip} {rec_port}")
+            return local_endpoint.encode(), (rec_ip, int(rec_port))
+        return local_endpoint.encode(), addr
+
+    def multicast_listener(self) -> None:
+        """Listen for multicast discovery messages and reply with this server's endpoint."""
+        sock = self.open_multicast_socket()
 
         while True:
             try:
-                data, addr = sock.recvfrom(BUFFER_SIZE)
-                message = data.decode().strip()
-                logger.info("[Multicast] Mensaje recibido desde %s: %s", addr, message)
-                if message.startswith(DISCOVER_MSG + ":"):
-                    local_ip = self.get_ip()
-                    _, rec_ip, rec_port = message.split(":")
-                    logger.debug(f"Multicast reply target {rec_ip} {rec_port}")
-                    sock.sendto(local_ip.encode(), (rec_ip, int(rec_port)))
-                else:
-                    local_ip = self.get_ip()
-                    sock.sendto(local_ip.encode(), addr)
+                data, addr = sock.recvfrom(1024)
+                sock.sendto(*self.multicast_reply(data.decode().strip(), addr))
             except Exception as e:
                 logger.error(f"Error en el listener: {e}")
                 time.sleep(1)
@@ -0,0 +1,70 @@
+import base64
+import hashlib
+import os
+
+import bounded_cache
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.exceptions import InvalidSignature
+except ModuleNotFoundError:
+    hashes = None
+    serialization = None
+    padding = None
+
+    class InvalidSignature(Exception):
+        pass
+
+
+# Module level so each verification worker process keeps its own parsed keys.
+PUBLIC_KEY_CACHE = bounded_cache.LRUCache(int(os.environ.get("FLOCK_PUBLIC_KEY_CACHE_SIZE", "1024")))
+
+
+def available():
+    return all((serialization, padding, hashes))
+
+
+def fingerprint(public_key):
+    return hashlib.sha256(public_key.encode()).hexdigest()
+
+
+def verification_key(public_key, payload, signature):
+    """Cache key for one `(key, payload, signature)` verification."""
+    return hashlib.sha256(f"{fingerprint(public_key)}|{payload}|{signature}".encode()).hexdigest()
+
+
+def load_public_key(public_key):
+    key_fingerprint = fingerprint(public_key)
+    key = PUBLIC_KEY_CACHE.get(key_fingerprint)
+    if key is None:
+        key = serialization.load_pem_public_key(base64.b64decode(public_key))
+        PUBLIC_KEY_CACHE.put(key_fingerprint, key)
+    return key
+
+
+def verify(public_key, payload, signature):
+    """Return True if `signature` is a valid RSA-PSS/SHA-256 signature of `payload`.
+
+    Picklable and free of server state so it can run in a process pool.
+    """
+    if not available():
+        return False
+    try:
+        load_public_key(public_key).verify(
+            base64.b64decode(signature),
+            payload.encode(),
+            padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.MAX_LENGTH,
+            ),
+            hashes.SHA256(),
+        )
+        return True
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+
+
+def warm_up():
+    """No-op task that starts the verification workers before the first REGISTER."""
+    return available()
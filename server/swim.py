@@ -0,0 +1,276 @@
+import math
+import random
+import threading
+import time
+
+
+ALIVE = "alive"
+SUSPECT = "suspect"
+DEAD = "dead"
+
+
+class Member:
+    __slots__ = ("state", "incarnation", "changed_at")
+
+    def __init__(self, state, incarnation, changed_at):
+        self.state = state
+        self.incarnation = incarnation
+        self.changed_at = changed_at
+
+
+class SwimDetector:
+    """SWIM failure detector and membership gossip over the health port.
+
+    Every `probe_interval` one member, taken from a shuffled round-robin,
+    gets a `SWIM_PING`. Without an ack after `probe_timeout`,
+    `indirect_probes` other members are asked to ping it with
+    `SWIM_PING_REQ`. If the interval ends without any ack, the member becomes
+    suspect; unless it refutes by gossiping a higher incarnation within
+    `suspect_timeout`, it is declared dead. State changes ride on the probe
+    traffic as `state:member:incarnation` entries, so a node sends one probe
+    per interval regardless of cluster size.
+
+    The detector owns no socket or thread: `send(data, address)` transmits,
+    `handle` consumes SWIM datagrams and `tick` must be called a few times per
+    `probe_interval`. `on_change(member, state)` runs outside the lock
+    whenever a member becomes suspect, dead or alive again. Dead members stay
+    in the table as tombstones, so `add_members` cannot bring them back as
+    alive and have them confirmed dead a second time; only a higher
+    incarnation from the member itself (a refutation or a restart) revives
+    one. Members are bare
+    ips on `port` unless `address_of(member)` and `member_of(address)` map
+    them to and from socket addresses (the server uses `ip:port` endpoints).
+    """
+    def __init__(
+        self,
+        local_id,
+        send,
+        probe_interval=1.0,
+        probe_timeout=0.3,
+        indirect_probes=3,
+        suspect_timeout=3.0,
+        max_piggyback=6,
+        port=12346,
+        address_of=None,
+        member_of=None,
+        on_change=None,
+        clock=time.monotonic,
+        rng=None,
+    ):
+        self.local_id = local_id
+        self.send = send
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.indirect_probes = indirect_probes
+        self.suspect_timeout = suspect_timeout
+        self.max_piggyback = max_piggyback
+        self.port = port
+        self.address_of = address_of or (lambda member: (member, port))
+        self.member_of = member_of or (lambda address: address[0])
+        self.on_change = on_change
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+        # Wall-clock seconds, so a restarted node outranks every incarnation
+        # the cluster remembers from its previous life.
+        self.incarnation = int(time.time())
+        self.members = {}
+        self.updates = {}
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.probe = None
+        self.relays = {}
+        self.order = []
+        self.next_probe_at = 0.0
+        self.stats = {"probes": 0, "acks": 0, "indirect": 0, "suspected": 0, "confirmed_dead": 0, "refuted": 0}
+
+    def add_members(self, ips):
+        """Start tracking `ips` we learned about outside gossip (ring neighbours, fingers, replicas)."""
+        now = self.clock()
+        local = self.local_id()
+        with self.lock:
+            for ip in ips:
+                if ip and ip != local and ip not in self.members:
+                    self.members[ip] = Member(ALIVE, 0, now)
+
+    def state_of(self, ip):
+        member = self.members.get(ip)
+        return member.state if member else None
+
+    def alive_members(self):
+        """Members currently believed alive, sorted; the local membership table."""
+        with self.lock:
+            return sorted(ip for ip, member in self.members.items() if member.state == ALIVE)
+
+    def tick(self):
+        now = self.clock()
+        outgoing = []
+        changes = []
+        with self.lock:
+            probe = self.probe
+            if probe and not probe["acked"]:
+                if not probe["indirect"] and now - probe["started"] >= self.probe_timeout:
+                    probe["indirect"] = True
+                    helpers = [ip for ip, member in self.members.items() if member.state == ALIVE and ip != probe["target"]]
+                    for helper in self.rng.sample(helpers, min(self.indirect_probes, len(helpers))):
+                        outgoing.append((f"SWIM_PING_REQ {probe['seq']} {probe['target']} {self._gossip()}", helper))
+                        self.stats["indirect"] += 1
+                if now - probe["started"] >= self.probe_interval:
+                    member = self.members.get(probe["target"])
+                    if member and member.state == ALIVE:
+                        self._apply(SUSPECT, probe["target"], member.incarnation, now, changes)
+                    self.probe = None
+            elif probe:
+                self.probe = None
+
+            for ip, member in list(self.members.items()):
+                if member.state == SUSPECT and now - member.changed_at >= self.suspect_timeout:
+                    self._apply(DEAD, ip, member.incarnation, now, changes)
+            for seq, relay in list(self.relays.items()):
+                if now >= relay[2]:
+                    del self.relays[seq]
+
+            if self.probe is None and now >= self.next_probe_at:
+                target = self._next_target()
+                if target:
+                    self.seq += 1
+                    self.probe = {"target": target, "seq": self.seq, "started": now, "indirect": False, "acked": False}
+                    outgoing.append((f"SWIM_PING {self.seq} {self._gossip()}", target))
+                    self.stats["probes"] += 1
+                self.next_probe_at = now + self.probe_interval
+        self._flush(outgoing, changes)
+
+    def handle(self, message, address):
+        """Consume one SWIM datagram received from `address`."""
+        parts = message.split(" ")
+        verb = parts[0]
+        now = self.clock()
+        outgoing = []
+        changes = []
+        try:
+            seq = int(parts[1])
+        except (IndexError, ValueError):
+            return
+        sender = self.member_of(address)
+        with self.lock:
+            if sender not in self.members and sender != self.local_id():
+                self.members[sender] = Member(ALIVE, 0, now)
+            if len(parts) > 2:
+                self._merge(parts[-1], now, changes)
+
+            if verb == "SWIM_PING":
+                outgoing.append((f"SWIM_ACK {seq} {self._gossip()}", address))
+            elif verb == "SWIM_PING_REQ" and len(parts) >= 3:
+                self.seq += 1
+                self.relays[self.seq] = (address, seq, now + self.probe_interval)
+                outgoing.append((f"SWIM_PING {self.seq} {self._gossip()}", parts[2]))
+            elif verb == "SWIM_ACK":
+                if self.probe and self.probe["seq"] == seq:
+                    self.probe["acked"] = True
+                    self.stats["acks"] += 1
+                relay = self.relays.pop(seq, None)
+                if relay:
+                    outgoing.append((f"SWIM_ACK {relay[1]} {self._gossip()}", relay[0]))
+        self._flush(outgoing, changes)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "incarnation": self.incarnation,
+                "members": {
+                    ip: {"state": member.state, "incarnation": member.incarnation}
+                    for ip, member in sorted(self.members.items())
+                },
+                "stats": dict(self.stats),
+            }
+
+    def _next_target(self):
+        while self.order:
+            ip = self.order.pop()
+            member = self.members.get(ip)
+            if member and member.state != DEAD:
+                return ip
+        self.order = [ip for ip, member in self.members.items() if member.state != DEAD]
+        self.rng.shuffle(self.order)
+        return self.order.pop() if self.order else None
+
+    def _apply(self, state, ip, incarnation, now, changes):
+        """Apply one membership update with SWIM precedence; return True if it changed anything."""
+        if ip == self.local_id():
+            if state != ALIVE and incarnation >= self.incarnation:
+                self.incarnation = incarnation + 1
+                self.stats["refuted"] += 1
+                self._queue(ALIVE, ip, self.incarnation)
+            return False
+
+        member = self.members.get(ip)
+        if member is None:
+            if state == DEAD:
+                return False
+            self.members[ip] = Member(state, incarnation, now)
+            self._queue(state, ip, incarnation)
+            if state == SUSPECT:
+                self.stats["suspected"] += 1
+                changes.append((ip, state))
+            return True
+
+        if state == ALIVE:
+            accepted = incarnation > member.incarnation
+        elif state == SUSPECT:
+            accepted = incarnation > member.incarnation or (member.state == ALIVE and incarnation == member.incarnation)
+        else:
+            accepted = member.state != DEAD and incarnation >= member.incarnation
+        if not accepted:
+            return False
+
+        previous = member.state
+        member.state = state
+        member.incarnation = incarnation
+        if previous != state:
+            member.changed_at = now
+        self._queue(state, ip, incarnation)
+        if previous != state:
+            if state == SUSPECT:
+                self.stats["suspected"] += 1
+            elif state == DEAD:
+                self.stats["confirmed_dead"] += 1
+            changes.append((ip, state))
+        return True
+
+    def _queue(self, state, ip, incarnation):
+        transmissions = 3 * math.ceil(math.log2(len(self.members) + 2))
+        self.updates[ip] = [f"{state}:{ip}:{incarnation}", transmissions]
+
+    def _gossip(self):
+        """Own liveness plus the least-transmitted pending updates, as one `;`-separated token."""
+        entries = [f"{ALIVE}:{self.local_id()}:{self.incarnation}"]
+        for ip, update in sorted(self.updates.items(), key=lambda item: -item[1][1])[: self.max_piggyback]:
+            entries.append(update[0])
+            update[1] -= 1
+            if update[1] <= 0:
+                del self.updates[ip]
+        return ";".join(entries)
+
+    def _merge(self, gossip, now, changes):
+        for entry in gossip.split(";"):
+            try:
+                # Members may contain ':' themselves (ip:port endpoints).
+                state, ip = entry.split(":", 1)
+                ip, incarnation = ip.rsplit(":", 1)
+                incarnation = int(incarnation)
+            except ValueError:
+                continue
+            if state in (ALIVE, SUSPECT, DEAD):
+                self._apply(state, ip, incarnation, now, changes)
+
+    def _flush(self, outgoing, changes):
+        for data, address in outgoing:
+            if isinstance(address, str):
+                address = self.address_of(address)
+            try:
+                self.send(data.encode(), address)
+            except OSError:
+                pass
+        if self.on_change:
+            for ip, state in changes:
+                self.on_change(ip, state)
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from shared_wire_codec import (
+    Frame,
+    WireError,
+    SUPPORTED_VERSIONS,
+    decode,
+    decode_json_reply,
+    encode,
+    encode_json_reply,
+    is_frame,
+)
+
+
+__all__ = [
+    "Frame",
+    "WireError",
+    "SUPPORTED_VERSIONS",
+    "decode",
+    "decode_json_reply",
+    "encode",
+    "encode_json_reply",
+    "is_frame",
+]
@@ -0,0 +1,62 @@
+import os
+
+
+DEFAULT_PORT = 12345
+DEFAULT_MCAST_PORT = 10003
+# The health socket (PING/PONG, SWIM) always listens right above the command port.
+HEALTH_PORT_OFFSET = 1
+
+
+def configured_port() -> int:
+    return int(os.environ.get("FLOCK_PORT", str(DEFAULT_PORT)))
+
+
+def configured_bind_address() -> str:
+    return os.environ.get("FLOCK_BIND_ADDRESS", "").strip()
+
+
+def configured_mcast_port() -> int:
+    return int(os.environ.get("FLOCK_MCAST_PORT", str(DEFAULT_MCAST_PORT)))
+
+
+def format_endpoint(ip: str, port: int) -> str:
+    return f"{ip}:{int(port)}"
+
+
+def parse_endpoint(value: str, default_port: int = DEFAULT_PORT) -> tuple[str, int]:
+    """Split `ip:port` into `(ip, port)`; a bare ip means `default_port`.
+
+    Raises ValueError for an empty host or a port outside 1-65535.
+    """
+    host, separator, port = value.strip().rpartition(":")
+    if not separator:
+        host, port = value.strip(), default_port
+    port = int(port)
+    if not host or not 0 < port <= 65535:
+        raise ValueError(f"Invalid endpoint: {value!r}")
+    return host, port
+
+
+def normalize_endpoint(value: str, default_port: int = DEFAULT_PORT) -> str:
+    """Canonical `ip:port` form of `value`, so bare ips from older peers compare equal."""
+    return format_endpoint(*parse_endpoint(value, default_port))
+
+
+def host_of(endpoint: str) -> str:
+    return parse_endpoint(endpoint)[0]
+
+
+def command_address(endpoint: str) -> tuple[str, int]:
+    """Socket address of the command port behind `endpoint`."""
+    return parse_endpoint(endpoint)
+
+
+def health_address(endpoint: str) -> tuple[str, int]:
+    """Socket address of the health port behind `endpoint`."""
+    host, port = parse_endpoint(endpoint)
+    return host, port + HEALTH_PORT_OFFSET
+
+
+def endpoint_of_health(address: tuple[str, int]) -> str:
+    """Endpoint of the node whose health socket sent from `address`."""
+    return format_endpoint(address[0], address[1] - HEALTH_PORT_OFFSET)
@@ -1,13 +1,19 @@
+import atexit
 import json
 import logging
 import os
+import queue
 import re
+import threading
+import time
 from datetime import datetime, timezone
 from logging import Logger
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from typing import Any
 
+import shared_wire_codec
+
 
 DEFAULT_FIELDS = {
     "node": None,
@@ -39,10 +45,19 @@ SENSITIVE_NAMES = (
     "cookie",
     "csrf",
 )
-SENSITIVE_COMMANDS = {"REGISTER", "REPLIC", "TAKEOVER", "MESSAGE", "PUBKEY_RES"}
+SENSITIVE_COMMANDS = {"REGISTER", "REPLIC", "REPLIC_BATCH", "TAKEOVER", "RESOLVED", "MESSAGE", "PUBKEY_RES"}
 MAX_STRING_LENGTH = 180
 DEFAULT_MAX_BYTES = 1 * 1024 * 1024
 DEFAULT_BACKUP_COUNT = 1
+DEFAULT_QUEUE_SIZE = 10000
+# Events per second kept for the noisiest events; the rest are counted and
+# reported as `suppressed` on the next record that gets through.
+DEFAULT_EVENT_RATE_LIMITS = {
+    "command_received": 100.0,
+    "replica_written": 20.0,
+    "replica_acknowledged": 20.0,
+    "replica_sync_sent": 20.0,
+}
 HUMAN_EVENT_MESSAGES = {
     "node_initialized": "[OK] Configuracion del nodo cargada",
     "register_accepted": "[OK] Registro aceptado",
@@ -53,6 +68,7 @@ HUMAN_EVENT_MESSAGES = {
     "node_unreachable": "[!] Nodo no alcanzable",
     "fix_started": "[!] Reparacion del anillo iniciada",
     "successor_promoted": "[OK] Sucesor de respaldo promovido",
+    "predecessor_notified": "[OK] Predecesor actualizado por NOTIFY",
     "range_split": "[OK] Rango dividido para nuevo nodo",
 }
 
@@ -70,6 +86,117 @@ def configured_level() -> int:
     return getattr(logging, level_name, logging.INFO)
 
 
+def async_enabled() -> bool:
+    return os.environ.get("FLOCK_LOG_ASYNC", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def parse_event_map(spec: str) -> dict[str, float]:
+    """Parse `event=value,event=value` into a dict, skipping malformed entries."""
+    parsed = {}
+    for item in spec.split(","):
+        event, _, value = item.partition("=")
+        try:
+            parsed[event.strip()] = float(value)
+        except ValueError:
+            continue
+    parsed.pop("", None)
+    return parsed
+
+
+class EventThrottle:
+    """Per-event sampling and rate limits, applied before a log record is built.
+
+    `sample_rates` keeps roughly that fraction of an event (every
+    `round(1 / rate)`-th occurrence; `0` drops it entirely) and
+    `rate_limits` caps it at that many records per second with a token
+    bucket allowing one second of burst.
+    """
+    def __init__(self, sample_rates=None, rate_limits=None, clock=time.monotonic):
+        self.sample_every = {
+            event: (max(1, round(1 / rate)) if rate > 0 else None)
+            for event, rate in (sample_rates or {}).items()
+        }
+        self.rate_limits = dict(rate_limits or {})
+        self.clock = clock
+        self.counters: dict[str, int] = {}
+        self.buckets: dict[str, list[float]] = {}
+        self.pending: dict[str, int] = {}
+        self.suppressed: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "EventThrottle":
+        rate_limits = dict(DEFAULT_EVENT_RATE_LIMITS)
+        rate_limits.update(parse_event_map(os.environ.get("FLOCK_LOG_RATE_LIMITS", "")))
+        return cls(
+            sample_rates=parse_event_map(os.environ.get("FLOCK_LOG_SAMPLE", "")),
+            rate_limits={event: limit for event, limit in rate_limits.items() if limit > 0},
+        )
+
+    def allow(self, event: str) -> int | None:
+        """Return None to drop `event`, else how many were dropped since the last one kept."""
+        if event not in self.sample_every and event not in self.rate_limits:
+            return 0
+        with self.lock:
+            keep = True
+            if event in self.sample_every:
+                every = self.sample_every[event]
+                count = self.counters.get(event, 0)
+                self.counters[event] = count + 1
+                keep = every is not None and count % every == 0
+            if keep and event in self.rate_limits:
+                limit = self.rate_limits[event]
+                now = self.clock()
+                tokens, last = self.buckets.get(event, (limit, now))
+                tokens = min(limit, tokens + (now - last) * limit)
+                keep = tokens >= 1
+                self.buckets[event] = [tokens - 1 if keep else tokens, now]
+            if not keep:
+                self.pending[event] = self.pending.get(event, 0) + 1
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return None
+            return self.pending.pop(event, 0)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hand records to the listener thread untouched; drop them when the queue is full.
+
+    Formatting and `sanitize` run on the listener thread, so the caller only
+    freezes what cannot cross threads: the message arguments and a live
+    traceback.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+EVENT_THROTTLE = EventThrottle.from_environment()
+_LISTENERS: dict[str, tuple[QueueListener, DroppingQueueHandler]] = {}
+
+
+def _stop_listeners() -> None:
+    for listener, _ in list(_LISTENERS.values()):
+        listener.stop()
+    _LISTENERS.clear()
+
+
+atexit.register(_stop_listeners)
+
+
 def _is_sensitive_name(name: str) -> bool:
     lowered = name.lower()
     return any(marker in lowered for marker in SENSITIVE_NAMES)
@@ -81,19 +208,48 @@ def _truncate(value: str) -> str:
     return f"{value[:80]}...[truncated {len(value) - 120} chars]...{value[-40:]}"
 
 
-def summarize_command(command: str | None) -> dict[str, Any]:
+def summarize_binary_command(frame: bytes) -> dict[str, Any]:
+    try:
+        decoded = shared_wire_codec.decode(frame)
+    except shared_wire_codec.WireError as e:
+        return {"command": None, "wire": "binary", "error": str(e), "bytes": len(frame)}
+    summary: dict[str, Any] = {
+        "command": decoded.verb,
+        "wire": f"binary/v{decoded.version}",
+        "request_id": decoded.request_id,
+        "bytes": len(frame),
+    }
+    if decoded.verb in SENSITIVE_COMMANDS:
+        summary["payload"] = "[redacted]"
+    if "username" in decoded.fields:
+        summary["username"] = decoded.fields["username"]
+    if "version" in decoded.fields:
+        summary["version"] = str(decoded.fields["version"])
+    return summary
+
+
+def summarize_command(command: str | bytes | None) -> dict[str, Any]:
     if not command:
         return {"command": None}
+    if isinstance(command, (bytes, bytearray)):
+        if shared_wire_codec.is_frame(command):
+            return summarize_binary_command(bytes(command))
+        command = command.decode(errors="replace")
 
     verb = command.split(" ", 1)[0]
     summary: dict[str, Any] = {"command": verb}
     parts = command.split(" ")
 
+    if verb == "REPLIC_BATCH":
+        summary["payload"] = "[redacted]"
+        summary["records"] = command.count("\n")
+        return summary
+
     if verb in SENSITIVE_COMMANDS:
         summary["payload"] = "[redacted]"
         if len(parts) > 1:
             summary["username"] = parts[1]
-        if verb in {"REGISTER", "REPLIC", "TAKEOVER"} and len(parts) > 4:
+        if verb in {"REGISTER", "REPLIC", "TAKEOVER", "RESOLVED"} and len(parts) > 4:
             summary["version"] = parts[4]
         return summary
 
@@ -139,6 +295,8 @@ class JsonLineFormatter(logging.Formatter):
             payload["message"] = sanitize(record.getMessage())
         if record.exc_info:
             payload["exception"] = sanitize(self.formatException(record.exc_info))
+        elif record.exc_text:
+            payload["exception"] = sanitize(record.exc_text)
 
         return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
 
@@ -175,6 +333,7 @@ class HumanConsoleFormatter(logging.Formatter):
             "advertised_ip",
             "reason",
             "result",
+            "suppressed",
         ):
             value = flock_fields.get(key)
             if value is not None:
@@ -185,11 +344,25 @@ class HumanConsoleFormatter(logging.Formatter):
             line += " | " + " ".join(context)
         if record.exc_info:
             line += "\n" + self.formatException(record.exc_info)
+        elif record.exc_text:
+            line += "\n" + record.exc_text
         return line
 
 
 def configure_logger(name: str, log_filename: str) -> Logger:
+    """Attach the console and JSON-file handlers to `name`.
+
+    Unless `FLOCK_LOG_ASYNC=0`, they sit behind a bounded queue drained by
+    one listener thread, so callers never format, sanitize or write.
+    """
+    global EVENT_THROTTLE
+    EVENT_THROTTLE = EventThrottle.from_environment()
     logger = logging.getLogger(name)
+    previous = _LISTENERS.pop(name, None)
+    if previous:
+        previous[0].stop()
+        for handler in previous[0].handlers:
+            handler.close()
     for handler in list(logger.handlers):
         logger.removeHandler(handler)
         handler.close()
@@ -215,13 +388,63 @@ def configure_logger(name: str, log_filename: str) -> Logger:
     file_handler.setLevel(configured_level())
     file_handler.setFormatter(json_formatter)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    if not async_enabled():
+        logger.addHandler(console_handler)
+        logger.addHandler(file_handler)
+        return logger
+
+    log_queue: queue.Queue = queue.Queue(int(os.environ.get("FLOCK_LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)))
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    _LISTENERS[name] = (listener, queue_handler)
+    logger.addHandler(queue_handler)
     return logger
 
 
+def output_handlers(logger: Logger) -> list[logging.Handler]:
+    """The handlers that actually write `logger`'s records, behind the queue or not."""
+    entry = _LISTENERS.get(logger.name)
+    return list(entry[0].handlers) if entry else list(logger.handlers)
+
+
+def flush_logger(logger: Logger) -> None:
+    """Block until every record queued for `logger` has been written."""
+    entry = _LISTENERS.get(logger.name)
+    if entry:
+        entry[0].queue.join()
+    for handler in output_handlers(logger):
+        handler.flush()
+
+
+def logging_stats(logger: Logger) -> dict[str, Any]:
+    """Queue depth, records dropped on a full queue and events suppressed by sampling or rate limits."""
+    entry = _LISTENERS.get(logger.name)
+    with EVENT_THROTTLE.lock:
+        suppressed = dict(EVENT_THROTTLE.suppressed)
+    return {
+        "async": entry is not None,
+        "queued": entry[0].queue.qsize() if entry else 0,
+        "dropped": entry[1].dropped if entry else 0,
+        "suppressed": suppressed,
+    }
+
+
+def log_enabled(logger: Logger, level: int | str) -> bool:
+    """True if `logger` would emit at `level`; gate expensive field building on it."""
+    numeric_level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    return logger.isEnabledFor(numeric_level if isinstance(numeric_level, int) else logging.INFO)
+
+
 def log_event(logger: Logger, level: int | str, event: str, **fields: Any) -> None:
     numeric_level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
     if not isinstance(numeric_level, int):
         numeric_level = logging.INFO
+    if not logger.isEnabledFor(numeric_level):
+        return
+    suppressed = EVENT_THROTTLE.allow(event)
+    if suppressed is None:
+        return
+    if suppressed:
+        fields["suppressed"] = suppressed
     logger.log(numeric_level, event, extra={"flock": {"event": event, **fields}})
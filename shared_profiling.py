@@ -0,0 +1,275 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+from shared_logging_utils import configured_log_dir
+
+
+PROFILE_MODES = ("sample", "cprofile")
+DEFAULT_PROFILE_SECONDS = 30.0
+DEFAULT_REPORT_ROWS = 25
+
+
+def max_profile_seconds() -> float:
+    return float(os.environ.get("FLOCK_PROFILE_MAX_SECONDS", "300"))
+
+
+def sample_interval() -> float:
+    return max(0.001, float(os.environ.get("FLOCK_PROFILE_SAMPLE_INTERVAL", "0.005")))
+
+
+def profile_dir() -> Path:
+    return configured_log_dir() / "profiles"
+
+
+class ProfileError(Exception):
+    pass
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sample the stack of every other thread every `interval` seconds.
+
+    Works on code that is already running, unlike cProfile which only sees
+    the threads it was enabled in; the cost is one `sys._current_frames()`
+    walk per tick on a background thread.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="flock-profiler", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join(timeout=max(1.0, self.interval * 10))
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Collapsed stacks (`thread;outer;...;inner count`) for flamegraph tools."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int) -> list[dict[str, Any]]:
+        own_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own_counts[stack[-1]] += count
+            for label in set(stack[1:]):
+                total_counts[label] += count
+        observed = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": label,
+                "self_pct": round(own_counts[label] * 100 / observed, 2),
+                "total_pct": round(total_counts[label] * 100 / observed, 2),
+            }
+            for label, _ in own_counts.most_common(limit)
+        ]
+
+
+class ProfileSession:
+    def __init__(self, mode: str, seconds: float, started: float):
+        self.mode = mode
+        self.seconds = seconds
+        self.started = started
+        self.sampler = None
+        self.profiles = []
+        self.active_calls = 0
+        self.timer = None
+
+
+class Profiler:
+    """One on-demand profiling session at a time, dumped under `<log dir>/profiles`.
+
+    `sample` mode samples every thread of the process. `cprofile` mode is
+    deterministic but only sees code run through `call`, so processes route
+    their request handlers through it; outside a cprofile session `call`
+    is a plain function call. Sessions stop on their own after `seconds`.
+    """
+    def __init__(self, name: str, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.session = None
+        self.last = None
+        self.local = threading.local()
+
+    def start(self, seconds: float = DEFAULT_PROFILE_SECONDS, mode: str = "sample") -> dict[str, Any]:
+        if mode not in PROFILE_MODES:
+            raise ProfileError(f"unknown mode {mode!r}; use one of {', '.join(PROFILE_MODES)}")
+        if not 0 < seconds <= max_profile_seconds():
+            raise ProfileError(f"seconds must be in (0, {max_profile_seconds():g}]")
+        with self.condition:
+            if self.session is not None:
+                raise ProfileError(f"a {self.session.mode} session is already running")
+            session = self.session = ProfileSession(mode, seconds, self.clock())
+            if mode == "sample":
+                session.sampler = StackSampler(sample_interval())
+                session.sampler.start()
+            session.timer = threading.Timer(seconds, self._expire, args=(session,))
+            session.timer.daemon = True
+            session.timer.start()
+        return self.status()
+
+    def stop(self) -> dict[str, Any]:
+        with self.condition:
+            session = self.session
+            if session is None:
+                raise ProfileError("no profiling session is running")
+            self.session = None
+            session.timer.cancel()
+            # Let handlers inside `call` finish before reading their profiles;
+            # a STOP handled under the profiler itself is one of them.
+            own = self.local.depth if getattr(self.local, "session", None) is session else 0
+            self.condition.wait_for(lambda: session.active_calls <= own, timeout=1.0)
+        result = self._dump(session)
+        with self.condition:
+            self.last = result
+        return result
+
+    def status(self) -> dict[str, Any]:
+        with self.condition:
+            session = self.session
+            payload = {"active": session is not None, "last": self.last}
+            if session is not None:
+                elapsed = self.clock() - session.started
+                payload.update({
+                    "mode": session.mode,
+                    "seconds": session.seconds,
+                    "elapsed": round(elapsed, 3),
+                    "remaining": round(max(0.0, session.seconds - elapsed), 3),
+                })
+            return payload
+
+    def call(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        session = self.session
+        if session is None or session.mode != "cprofile":
+            return fn(*args, **kwargs)
+        with self.condition:
+            current = self.session is session
+            if current:
+                if getattr(self.local, "session", None) is not session:
+                    self.local.session = session
+                    self.local.profile = cProfile.Profile()
+                    self.local.depth = 0
+                    session.profiles.append(self.local.profile)
+                session.active_calls += 1
+        if not current:
+            return fn(*args, **kwargs)
+        profile = self.local.profile
+        # Nested calls on one thread are already inside the outer profile.
+        enabled = self.local.depth == 0
+        if enabled:
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler already owns this thread.
+                enabled = False
+        self.local.depth += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.local.depth -= 1
+            if enabled:
+                profile.disable()
+            with self.condition:
+                session.active_calls -= 1
+                self.condition.notify_all()
+
+    def _expire(self, session: ProfileSession) -> None:
+        with self.condition:
+            if self.session is not session:
+                return
+        try:
+            self.stop()
+        except ProfileError:
+            pass
+
+    def _dump(self, session: ProfileSession) -> dict[str, Any]:
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = directory / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', self.name)}-{session.mode}-{datetime.now():%Y%m%d-%H%M%S}"
+        result = {
+            "mode": session.mode,
+            "seconds": round(self.clock() - session.started, 3),
+            "files": [],
+        }
+        if session.mode == "sample":
+            sampler = session.sampler
+            sampler.stop()
+            top = sampler.top(DEFAULT_REPORT_ROWS)
+            result.update({"samples": sampler.samples, "top": top})
+            report = [f"{self.name}: {sampler.samples} samples every {sampler.interval * 1000:g} ms", ""]
+            report += [f"{row['self_pct']:6.2f}% self {row['total_pct']:6.2f}% total  {row['function']}" for row in top]
+            self._write(stem.with_suffix(".txt"), "\n".join(report) + "\n", result)
+            self._write(stem.with_suffix(".folded"), sampler.folded(), result)
+            return result
+
+        stats = None
+        for profile in session.profiles:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is None:
+            result.update({"calls": 0, "top": []})
+            return result
+        stats.sort_stats("cumulative")
+        result.update({
+            "calls": stats.total_calls,
+            "threads": len(session.profiles),
+            "top": [
+                {
+                    "function": f"{function} ({os.path.basename(filename)}:{line})",
+                    "calls": calls,
+                    "self_s": round(own, 6),
+                    "cumulative_s": round(cumulative, 6),
+                }
+                for (filename, line, function), (_, calls, own, cumulative, _) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True
+                )[:DEFAULT_REPORT_ROWS]
+            ],
+        })
+        text = io.StringIO()
+        stats.stream = text
+        stats.print_stats(DEFAULT_REPORT_ROWS * 2)
+        self._write(stem.with_suffix(".txt"), text.getvalue(), result)
+        stats.dump_stats(str(stem.with_suffix(".pstats")))
+        result["files"].append(str(stem.with_suffix(".pstats")))
+        return result
+
+    def _write(self, path: Path, content: str, result: dict[str, Any]) -> None:
+        path.write_text(content, encoding="utf-8")
+        result["files"].append(str(path))
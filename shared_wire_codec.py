@@ -0,0 +1,166 @@
+"""Versioned binary framing for Flock commands, negotiated next to the text protocol.
+
+A frame is a fixed header followed by length-prefixed fields:
+
+    magic:u8  version:u8  verb:u8  flags:u8  request_id:u32  username_hash:u64  field_count:u8
+    (length:u16  value)*
+
+`magic` is 0xFB, which never starts a UTF-8 text command, so both
+protocols can share the command port. Integers inside fields are
+big-endian, strings are UTF-8 and key material travels as raw bytes
+instead of base64.
+
+JSON admin replies are `OK <json>` / `ERROR <json>`, or `OKZ ` followed by
+the zlib-compressed JSON when the caller asked for compression.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+from dataclasses import dataclass, field
+from typing import Any
+
+
+MAGIC = 0xFB
+VERSION = 1
+SUPPORTED_VERSIONS = (1,)
+HEADER = struct.Struct("!BBBBIQB")
+FIELD_LENGTH = struct.Struct("!H")
+MAX_FIELD_LENGTH = 0xFFFF
+
+VERBS = {"REGISTER": 1, "RESOLVE": 2}
+VERB_NAMES = {code: verb for verb, code in VERBS.items()}
+FIELDS = {
+    "REGISTER": ("answer_to_ip", "answer_to_port", "username", "ip", "port", "version", "public_key", "signature"),
+    "RESOLVE": ("answer_to_ip", "answer_to_port", "username", "hops"),
+}
+FIELD_TYPES = {
+    "answer_to_ip": "str",
+    "answer_to_port": "u16",
+    "username": "str",
+    "ip": "str",
+    "port": "u16",
+    "version": "u64",
+    "public_key": "bytes",
+    "signature": "bytes",
+    "hops": "u16",
+}
+INTEGER_FORMATS = {"u16": struct.Struct("!H"), "u64": struct.Struct("!Q")}
+ZLIB_REPLY = b"OKZ "
+
+
+class WireError(ValueError):
+    pass
+
+
+@dataclass
+class Frame:
+    verb: str
+    fields: dict[str, Any] = field(default_factory=dict)
+    request_id: int = 0
+    username_hash: int = 0
+    flags: int = 0
+    version: int = VERSION
+
+
+def is_frame(data: bytes) -> bool:
+    return bool(data) and data[0] == MAGIC
+
+
+def _encode_field(name: str, value: Any) -> bytes:
+    kind = FIELD_TYPES[name]
+    if kind == "str":
+        return str(value).encode()
+    if kind == "bytes":
+        return bytes(value)
+    return INTEGER_FORMATS[kind].pack(int(value))
+
+
+def _decode_field(name: str, raw: bytes) -> Any:
+    kind = FIELD_TYPES[name]
+    if kind == "str":
+        return raw.decode()
+    if kind == "bytes":
+        return raw
+    integer = INTEGER_FORMATS[kind]
+    if len(raw) != integer.size:
+        raise WireError(f"Field {name} must be {integer.size} bytes")
+    return integer.unpack(raw)[0]
+
+
+def encode(verb: str, fields: dict[str, Any], request_id: int = 0, username_hash: int = 0, flags: int = 0) -> bytes:
+    """Encode `fields` (every field of `verb`, in any order) as one binary frame."""
+    try:
+        names = FIELDS[verb]
+    except KeyError:
+        raise WireError(f"Verb {verb} has no binary encoding") from None
+    parts = [HEADER.pack(MAGIC, VERSION, VERBS[verb], flags, request_id, username_hash, len(names))]
+    for name in names:
+        raw = _encode_field(name, fields[name])
+        if len(raw) > MAX_FIELD_LENGTH:
+            raise WireError(f"Field {name} is too long")
+        parts.append(FIELD_LENGTH.pack(len(raw)))
+        parts.append(raw)
+    return b"".join(parts)
+
+
+def decode_header(data: bytes) -> tuple[int, str, int, int, int, int]:
+    """Return `(version, verb, flags, request_id, username_hash, field_count)`."""
+    if len(data) < HEADER.size:
+        raise WireError("Truncated frame header")
+    magic, version, verb_code, flags, request_id, username_hash, field_count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise WireError("Not a binary frame")
+    if version not in SUPPORTED_VERSIONS:
+        raise WireError(f"Unsupported wire version {version}")
+    try:
+        verb = VERB_NAMES[verb_code]
+    except KeyError:
+        raise WireError(f"Unknown verb code {verb_code}") from None
+    return version, verb, flags, request_id, username_hash, field_count
+
+
+def decode(data: bytes) -> Frame:
+    version, verb, flags, request_id, username_hash, field_count = decode_header(data)
+    names = FIELDS[verb]
+    if field_count != len(names):
+        raise WireError(f"{verb} frames carry {len(names)} fields, got {field_count}")
+
+    fields = {}
+    offset = HEADER.size
+    for name in names:
+        if offset + FIELD_LENGTH.size > len(data):
+            raise WireError("Truncated field length")
+        (length,) = FIELD_LENGTH.unpack_from(data, offset)
+        offset += FIELD_LENGTH.size
+        if offset + length > len(data):
+            raise WireError(f"Truncated field {name}")
+        fields[name] = _decode_field(name, data[offset:offset + length])
+        offset += length
+    if offset != len(data):
+        raise WireError("Trailing bytes after last field")
+    return Frame(verb, fields, request_id, username_hash, flags, version)
+
+
+def encode_json_reply(payload: Any, ok: bool = True, compress: bool = False) -> bytes:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    if compress and ok:
+        return ZLIB_REPLY + zlib.compress(body)
+    return (b"OK " if ok else b"ERROR ") + body
+
+
+def decode_json_reply(data: bytes) -> tuple[bool, Any]:
+    """Return `(ok, payload)`; non-JSON replies come back as their text."""
+    if data.startswith(ZLIB_REPLY):
+        try:
+            return True, json.loads(zlib.decompress(data[len(ZLIB_REPLY):]))
+        except (zlib.error, ValueError) as e:
+            raise WireError(f"Corrupt compressed reply: {e}") from None
+    text = data.decode(errors="replace")
+    status, _, body = text.partition(" ")
+    try:
+        return status == "OK", json.loads(body)
+    except ValueError:
+        return status == "OK", text
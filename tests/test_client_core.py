@@ -138,6 +138,39 @@ def test_get_ip_uses_route_to_selected_server(tmp_path, monkeypatch):
         teardown_client(app_client)
 
 
+def test_discovery_and_connect_use_server_endpoints(tmp_path, monkeypatch):
+    class DiscoverySocket(DummySocket):
+        sent = []
+        replies = [
+            (b"node-a 127.0.0.1:12345", ("127.0.0.1", 12345)),
+            (b"node-b 127.0.0.1:12347", ("127.0.0.1", 12347)),
+            (b"node-legacy", ("10.0.0.9", 12345)),
+        ]
+
+        def sendto(self, data, address):
+            self.sent.append((data, address))
+
+        def recvfrom(self, size):
+            if not self.replies:
+                raise client_module.socket.timeout()
+            return self.replies.pop(0)
+
+    monkeypatch.setenv("FLOCK_SEEDS", "127.0.0.1:12347, bogus:port")
+    monkeypatch.setattr(client_module.socket, "socket", DiscoverySocket)
+    app_client = client_module.chat_client()
+    try:
+        servers = app_client.discover_servers()
+
+        assert (b"DISCOVER", ("127.0.0.1", 12347)) in DiscoverySocket.sent
+        assert servers == [("node-a", "127.0.0.1:12345"), ("node-b", "127.0.0.1:12347"), ("node-legacy", "10.0.0.9:12345")]
+        app_client.connect_to_server(servers[1])
+        assert app_client.server_address == ("127.0.0.1", 12347)
+        app_client.connect_to_server(("old", "10.0.0.9"))
+        assert app_client.server_address == ("10.0.0.9", 12345)
+    finally:
+        teardown_client(app_client)
+
+
 def test_send_message_records_resolve_failure_reason(tmp_path, monkeypatch):
     app_client = build_client(tmp_path, monkeypatch)
     try:
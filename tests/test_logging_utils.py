@@ -1,8 +1,18 @@
 import json
 import logging
+import threading
 from logging.handlers import RotatingFileHandler
 
-from shared_logging_utils import configure_logger, log_event, sanitize, summarize_command
+from shared_logging_utils import (
+    EventThrottle,
+    configure_logger,
+    flush_logger,
+    log_event,
+    logging_stats,
+    output_handlers,
+    sanitize,
+    summarize_command,
+)
 
 
 REQUIRED_FIELDS = {
@@ -21,8 +31,7 @@ REQUIRED_FIELDS = {
 
 
 def read_log_line(path):
-    for handler in logging.getLogger("flock.test").handlers:
-        handler.flush()
+    flush_logger(logging.getLogger("flock.test"))
     return json.loads(path.read_text(encoding="utf-8").splitlines()[-1])
 
 
@@ -58,8 +67,7 @@ def test_log_level_and_directory_are_environment_configurable(tmp_path, monkeypa
 
     logger.info("hidden")
     logger.warning("visible")
-    for handler in logger.handlers:
-        handler.flush()
+    flush_logger(logger)
 
     lines = (tmp_path / "env.log").read_text(encoding="utf-8").splitlines()
     assert len(lines) == 1
@@ -70,7 +78,7 @@ def test_configure_logger_uses_rotating_file_handler(tmp_path, monkeypatch):
     monkeypatch.setenv("FLOCK_LOG_DIR", str(tmp_path))
     logger = configure_logger("flock.test.rotation", "rotation.log")
 
-    assert any(isinstance(handler, RotatingFileHandler) for handler in logger.handlers)
+    assert any(isinstance(handler, RotatingFileHandler) for handler in output_handlers(logger))
 
 
 def test_sensitive_values_are_redacted_and_long_payloads_are_summarized():
@@ -93,3 +101,88 @@ def test_sensitive_values_are_redacted_and_long_payloads_are_summarized():
         "username": "alice",
         "version": "9",
     }
+
+
+def test_replica_batches_are_summarized_without_payload():
+    summary = summarize_command("REPLIC_BATCH 2\nalice 10.0.0.1 5000 1 pub-a\nbob 10.0.0.2 5001 1 pub-b")
+
+    assert summary == {"command": "REPLIC_BATCH", "payload": "[redacted]", "records": 2}
+
+
+def test_resolve_cache_fills_redact_the_public_key():
+    summary = summarize_command("RESOLVED alice 10.0.0.1 5000 3 pub-a")
+
+    assert summary == {"command": "RESOLVED", "payload": "[redacted]", "username": "alice", "version": "3"}
+
+
+def test_binary_frames_are_summarized_from_their_header():
+    import shared_wire_codec
+
+    frame = shared_wire_codec.encode(
+        "REGISTER",
+        {
+            "answer_to_ip": "",
+            "answer_to_port": 0,
+            "username": "alice",
+            "ip": "10.0.0.5",
+            "port": 7001,
+            "version": 3,
+            "public_key": b"pem",
+            "signature": b"sig",
+        },
+        request_id=7,
+    )
+
+    summary = summarize_command(frame)
+
+    assert summary == {
+        "command": "REGISTER",
+        "wire": "binary/v1",
+        "request_id": 7,
+        "bytes": len(frame),
+        "payload": "[redacted]",
+        "username": "alice",
+        "version": "3",
+    }
+    assert summarize_command(frame[:5])["error"] == "Truncated frame header"
+
+
+def test_records_are_written_off_thread_and_disabled_levels_build_nothing(tmp_path, monkeypatch):
+    monkeypatch.setenv("FLOCK_LOG_DIR", str(tmp_path))
+    monkeypatch.setenv("FLOCK_LOG_LEVEL", "INFO")
+    logger = configure_logger("flock.test.async", "async.log")
+    writers = set()
+    output_handlers(logger)[-1].addFilter(lambda record: writers.add(threading.current_thread().name) or True)
+
+    class Exploding:
+        def __repr__(self):
+            raise AssertionError("fields of a disabled level must not be formatted")
+
+    log_event(logger, "DEBUG", "command_received", result=Exploding())
+    log_event(logger, "INFO", "register_accepted", username="alice")
+    flush_logger(logger)
+
+    lines = (tmp_path / "async.log").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["event"] for line in lines] == ["register_accepted"]
+    assert writers and threading.current_thread().name not in writers
+    assert logging_stats(logger)["async"] is True
+
+
+def test_event_throttle_samples_and_rate_limits_per_event():
+    now = [0.0]
+    throttle = EventThrottle(
+        sample_rates={"command_received": 0.25, "muted": 0},
+        rate_limits={"replica_written": 2},
+        clock=lambda: now[0],
+    )
+
+    kept = [throttle.allow("command_received") for _ in range(8)]
+    assert kept == [0, None, None, None, 3, None, None, None]
+    assert throttle.allow("muted") is None
+    assert throttle.allow("register_accepted") == 0
+
+    assert [throttle.allow("replica_written") for _ in range(4)] == [0, 0, None, None]
+    now[0] = 1.0
+    # The next record that gets through carries the count of suppressed ones.
+    assert throttle.allow("replica_written") == 2
+    assert throttle.suppressed == {"command_received": 6, "muted": 1, "replica_written": 2}
@@ -1,5 +1,10 @@
 import json
 import logging
+import os
+import pstats
+import socket
+import threading
+import time
 
 from conftest import load_module
 
@@ -157,6 +162,41 @@ def test_server_snapshot_is_deterministic_and_hides_public_keys(monkeypatch, tmp
         teardown_server(server)
 
 
+def test_server_snapshot_pages_follow_cursors_across_sections(monkeypatch, tmp_path):
+    wire_codec = load_module("wire_codec", "server/wire_codec.py")
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        for index in range(12):
+            server.db_manager.register_user(f"user{index:02d}", "10.0.0.1", 5000 + index, public_key="pub", version=1)
+            server.db_manager.register_replic_user(f"peer{index:02d}", "10.0.0.2", 6000 + index, public_key="pub", version=1, owner="node-b")
+
+        pages = []
+        cursor = None
+        while True:
+            ok, page = wire_codec.decode_json_reply(server.snapshot_reply(cursor, page_bytes=1200))
+            assert ok and page["total"] == 24
+            pages.append(page)
+            cursor = page["next"]
+            if not cursor:
+                break
+
+        full = server.snapshot_payload()
+        assert len(pages) > 2
+        assert [item for page in pages for item in page["owned"]] == full["owned"]
+        assert [item for page in pages for item in page["replicas"]] == full["replicas"]
+
+        compressed = server.snapshot_reply(compress=True, page_bytes=1200)
+        ok, page = wire_codec.decode_json_reply(compressed)
+        assert compressed.startswith(b"OKZ ") and len(compressed) <= 1200
+        assert len(page["owned"]) > len(pages[0]["owned"])
+
+        server.handle_snapshot("SNAPSHOT not-a-cursor", ("127.0.0.1", 40000))
+        assert DummySocket.sent[-1] == (b'ERROR {"error":"invalid cursor"}', ("127.0.0.1", 40000))
+    finally:
+        teardown_server(server)
+
+
 def test_server_checksum_is_stable_and_changes_with_state(monkeypatch, tmp_path):
     server = build_server(monkeypatch)
     init_db(server, tmp_path)
@@ -240,7 +280,7 @@ def test_server_assimilated_records_are_re_replicated(monkeypatch, tmp_path):
         server.replicants = ["node-a"]
         server.replics = ["127.0.0.20"]
         server.db_manager.register_replic_user("alice", "10.0.0.1", 5001, public_key="pub-a", version=1, owner="node-a")
-        monkeypatch.setattr(server, "ping", lambda _ip: False)
+        monkeypatch.setattr(server.probe_engine, "probe_many", lambda ips, timeout=0.1: {ip: False for ip in ips})
 
         server.replicants_manager()
 
@@ -252,3 +292,1158 @@ def test_server_assimilated_records_are_re_replicated(monkeypatch, tmp_path):
     finally:
         server_module.logger.removeHandler(events)
         teardown_server(server)
+
+
+def test_server_replicants_survive_concurrent_drop_and_replic(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        server.db_manager.register_replic_user("alice", "10.0.0.1", 5001, public_key="pub-a", version=1, owner="127.0.0.5:12345")
+        server.handle_replic("REPLIC bob 10.0.0.2 5002 1 pub-b", ("127.0.0.5", 12345))
+        monkeypatch.setattr(server.probe_engine, "probe_many", lambda ips, timeout=0.1: {ip: False for ip in ips})
+        place_user_record = server.place_user_record
+
+        def place_while_owner_drops(*record):
+            # DROP_REPLICS from the owner lands on a worker mid-assimilation.
+            server.handle_drop_replics("DROP_REPLICS 127.0.0.5:12345", ("127.0.0.5", 12345))
+            return place_user_record(*record)
+
+        monkeypatch.setattr(server, "place_user_record", place_while_owner_drops)
+        server.replicants_manager()
+        assert server.replicants == []
+
+        workers = [
+            threading.Thread(target=server.handle_replic, args=(f"REPLIC user_{index} 10.0.0.3 5003 1 pub", ("127.0.0.6", 12345)))
+            for index in range(8)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert server.replicants == ["127.0.0.6:12345"]
+    finally:
+        teardown_server(server)
+
+
+def test_server_routes_through_closest_finger(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        server.lower_bound = 0
+        server.upper_bound = 99
+        server.successor = "127.0.0.2"
+        server.fingers = {
+            0: ("127.0.0.2", 100, 199),
+            8: ("127.0.0.3", 200, 399),
+            9: ("127.0.0.4", 400, 999),
+        }
+
+        assert server.route_target(50) == (None, "local")
+        assert server.route_target(150) == ("127.0.0.2", "forward_finger")
+        assert server.route_target(700) == ("127.0.0.4", "forward_finger")
+        assert server.route_target(5000) == ("127.0.0.4", "forward_finger")
+
+        server.forget_finger("127.0.0.4")
+
+        assert server.route_target(700) == ("127.0.0.3", "forward_finger")
+        server.fingers = {}
+        assert server.route_target(700) == ("127.0.0.2", "forward_successor")
+    finally:
+        teardown_server(server)
+
+
+def test_server_forwarded_resolve_carries_hop_count(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        server.lower_bound = 0
+        server.upper_bound = 0
+        server.fingers = {3: ("127.0.0.9", 1, server_module.HASH_MOD - 1)}
+
+        request = server.parse_resolve_message("RESOLVE 10.0.0.5 7000 alice 2", ("127.0.0.1", 12345))
+        server.resolve_user(*request[:3], hops=request[3], request_id=request[4])
+
+        assert request == ("10.0.0.5", 7000, "alice", 2, None, None)
+        [(forward, address)] = DummySocket.sent
+        assert address == ("127.0.0.9", 12345)
+        assert forward.decode().rsplit(" ", 1)[0] == "RESOLVE 10.0.0.5 7000 alice 3"
+    finally:
+        teardown_server(server)
+
+
+def test_server_join_splits_range_at_record_quantile(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    try:
+        hashes = {"ana": 10, "beto": 20, "carla": 30, "dario": 40}
+        server.db_manager.hash_function = hashes.__getitem__
+        init_db(server, tmp_path)
+        for username in hashes:
+            server.db_manager.register_user(username, "127.0.0.1", 5000, public_key=f"pub-{username}", version=1)
+        server.lower_bound = 0
+        server.upper_bound = 999
+
+        server.handle_load("LOAD", ("127.0.0.1", 12345))
+        server.handle_join("JOIN 127.0.0.20:12345", ("127.0.0.20", 40000))
+
+        assert DummySocket.sent == [
+            (b"OK 0 999 4", ("127.0.0.1", 12345)),
+            (b"OK 30 999 127.0.0.10:12345 _", ("127.0.0.20", 40000)),
+        ]
+        # Ownership only moves on HANDOFF_COMMIT.
+        assert (server.lower_bound, server.upper_bound) == (0, 999)
+        assert server.pending_handoff["lower"] == 30
+    finally:
+        teardown_server(server)
+
+
+def test_server_join_hands_off_range_in_bulk_and_commits_atomically(monkeypatch, tmp_path):
+    monkeypatch.setattr(server_module, "HANDOFF_PAGE_ROWS", 2)
+    donor = build_server(monkeypatch)
+    joinee = server_module.ChatServer("node-joinee")
+    hashes = {f"user{index}": index * 10 for index in range(1, 8)}
+    hashes["user7b"] = 70
+    try:
+        for node, name in ((donor, "donor"), (joinee, "joinee")):
+            node.db_manager.hash_function = hashes.__getitem__
+            node.db_manager.db_directory = str(tmp_path / name)
+            node.db_manager.set_db(node.name)
+        for username in hashes:
+            donor.db_manager.register_user(username, "127.0.0.1", 5000, public_key=f"pub-{username}", version=1)
+        donor.lower_bound, donor.upper_bound = 0, 999
+        donor.successor = "127.0.0.30:12345"
+        joinee_address = ("127.0.0.20", 40000)
+        handlers = {"HANDOFF": donor.handle_handoff, "HANDOFF_COMMIT": donor.handle_handoff_commit}
+        requests = []
+
+        def handoff_request(peer, command):
+            requests.append(command.split(" ")[0])
+            if command.startswith("HANDOFF_COMMIT") and requests.count("HANDOFF_COMMIT") == 1:
+                # A write lands on the donor between the last page and the commit.
+                donor.db_manager.register_user("user6", "127.0.0.6", 6006, public_key="pub-user6", version=2)
+            before = len(DummySocket.sent)
+            handlers[command.split(" ")[0]](command, joinee_address)
+            return next(data for data, address in DummySocket.sent[before:] if address == joinee_address).decode()
+
+        monkeypatch.setattr(joinee, "handoff_request", handoff_request)
+        donor.process_join_request("127.0.0.20:12350", joinee_address)
+        lower_bound, upper_bound = donor.pending_handoff["lower"], donor.pending_handoff["upper"]
+
+        received = joinee.pull_handoff("127.0.0.10:12345", lower_bound, upper_bound)
+
+        moved = [username for username, value in hashes.items() if value >= lower_bound]
+        assert received == len(moved) + 1
+        assert requests.count("HANDOFF") > 2
+        assert sorted(record[0] for record in joinee.db_manager.list_owned_records()) == sorted(moved)
+        assert joinee.db_manager.resolve_user("user6") == ("127.0.0.6", 6006, "pub-user6", 2)
+        assert donor.db_manager.count_users_in_range(lower_bound, upper_bound) == 0
+        # The joinee's identity is the endpoint it named in JOIN, not the socket its HANDOFFs came from.
+        assert (donor.upper_bound, donor.successor, donor.pending_handoff) == (lower_bound - 1, "127.0.0.20:12350", None)
+        assert (b"PRED_CHANGE 127.0.0.20:12350 1", ("127.0.0.30", 12345)) in DummySocket.sent
+    finally:
+        teardown_server(joinee)
+        teardown_server(donor)
+
+
+def test_server_spreads_absorbed_range_as_vnode_tokens(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        monkeypatch.setattr(server_module, "VNODE_TOKENS", 4)
+        server.failure_detector.add_members(["127.0.0.10:12345", "127.0.0.2:12345", "127.0.0.3:12345"])
+        monkeypatch.setattr(server, "request_adopt", lambda delegate, token: delegate != "127.0.0.3:12345")
+        server.lower_bound = 0
+        server.upper_bound = 199
+
+        delegated = server.spread_absorbed_range(100, 199)
+
+        assert delegated == {(125, 149): "127.0.0.2:12345"}
+        assert server.route_target(130) == ("127.0.0.2:12345", "forward_vnode")
+        assert server.route_target(160) == (None, "local")
+        assert server.owns(110) and not server.owns(130)
+        assert server.status_payload()["vnodes"]["delegated"] == {"125-149": "127.0.0.2:12345"}
+
+        server.handle_vnode_check("VNODE_CHECK 125 149 127.0.0.2:12345", ("127.0.0.2", 40000))
+        server.handle_vnode_check("VNODE_CHECK 125 149 127.0.0.2:12399", ("127.0.0.2", 40000))
+        # Servers that predate endpoints leave it out and are assumed on the default port.
+        server.handle_vnode_check("VNODE_CHECK 125 149", ("127.0.0.2", 40000))
+        assert DummySocket.sent[-3:] == [
+            (b"OK", ("127.0.0.2", 40000)),
+            (b"RELEASE", ("127.0.0.2", 40000)),
+            (b"OK", ("127.0.0.2", 40000)),
+        ]
+
+        monkeypatch.setattr(server, "ping", lambda ip, timeout=0.1: False)
+        assert server.reclaim_dead_delegations() == [(125, 149)]
+        assert server.route_target(130) == (None, "local")
+    finally:
+        teardown_server(server)
+
+
+def test_server_adopted_tokens_are_local_until_released(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    try:
+        server.db_manager.hash_function = {"ana": 10, "beto": 500}.__getitem__
+        monkeypatch.setattr(server, "rolling_hash", server.db_manager.hash_function)
+        init_db(server, tmp_path)
+        server.lower_bound = 0
+        server.upper_bound = 99
+        server.successor = "127.0.0.2"
+
+        server.handle_vnode_adopt("VNODE_ADOPT 400 599", ("127.0.0.5", 40000))
+        server.handle_takeover("TAKEOVER beto 10.0.0.2 7000 1 pub-beto", ("127.0.0.5", 12345))
+
+        assert server.db_manager.resolve_user("beto") is not None
+        server.correct_bd()
+        assert server.db_manager.resolve_user("beto") is not None
+
+        monkeypatch.setattr(server, "check_adopted_token", lambda owner, token: False)
+        DummySocket.sent = []
+        server.vnode_tick()
+
+        assert server.adopted_tokens == {}
+        assert server.db_manager.resolve_user("beto") is None
+        assert DummySocket.sent == [(b"TAKEOVER beto 10.0.0.2 7000 1 pub-beto", ("127.0.0.2", 12345))]
+    finally:
+        teardown_server(server)
+
+
+def test_bounded_cache_evicts_least_recent_and_expires_entries():
+    now = [0.0]
+    cache = server_module.bounded_cache.LRUCache(2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    now[0] = 11.0
+    assert cache.get("c") is None
+    assert cache.stats() == {"size": 1, "capacity": 2, "hits": 2, "misses": 2, "evictions": 1}
+
+
+class SwimNetwork:
+    """Synchronous in-memory network of SWIM detectors with a shared fake clock."""
+    def __init__(self, swim_module, ips):
+        self.now = 0.0
+        self.down = set()
+        self.dropped = set()
+        self.changes = []
+        self.detectors = {}
+        for index, ip in enumerate(ips):
+            self.detectors[ip] = swim_module.SwimDetector(
+                lambda ip=ip: ip,
+                lambda data, address, ip=ip: self.deliver(ip, data, address),
+                suspect_timeout=3.0,
+                on_change=lambda peer, state, ip=ip: self.changes.append((ip, peer, state)),
+                clock=lambda: self.now,
+                rng=__import__("random").Random(index),
+            )
+        for detector in self.detectors.values():
+            detector.add_members(ips)
+
+    def deliver(self, source, data, address):
+        if source in self.down or address[0] in self.down or (source, address[0]) in self.dropped:
+            return
+        self.detectors[address[0]].handle(data.decode(), (source, 12346))
+
+    def run(self, seconds):
+        for _ in range(int(seconds * 10)):
+            self.now += 0.1
+            for ip, detector in self.detectors.items():
+                if ip not in self.down:
+                    detector.tick()
+
+
+def test_swim_survives_lost_pings_and_confirms_real_failures():
+    swim = load_module("swim", "server/swim.py")
+    ips = [f"10.0.0.{index}" for index in range(1, 6)]
+    network = SwimNetwork(swim, ips)
+
+    # Direct pings between .1 and .2 are lost; indirect probes through the others still get acks.
+    network.dropped = {("10.0.0.1", "10.0.0.2"), ("10.0.0.2", "10.0.0.1")}
+    network.run(20)
+    assert network.changes == []
+    assert network.detectors["10.0.0.1"].stats["indirect"] > 0
+    # One probe per node per interval, independent of what happens to it.
+    assert all(19 <= detector.stats["probes"] <= 21 for detector in network.detectors.values())
+
+    network.dropped = set()
+    network.down = {"10.0.0.5"}
+    network.run(8)
+
+    for ip in ips[:4]:
+        assert network.detectors[ip].state_of("10.0.0.5") == swim.DEAD
+    assert {(peer, state) for _, peer, state in network.changes} == {("10.0.0.5", swim.SUSPECT), ("10.0.0.5", swim.DEAD)}
+
+    # Ring links still naming the dead node must not resurrect it for a second verdict.
+    verdicts = len(network.changes)
+    for _ in range(10):
+        for detector in network.detectors.values():
+            detector.add_members(["10.0.0.5"])
+        network.run(6)
+    assert len(network.changes) == verdicts
+    assert network.detectors["10.0.0.1"].state_of("10.0.0.5") == swim.DEAD
+
+    # A restart gossips a newer incarnation and is accepted again.
+    network.down = set()
+    network.detectors["10.0.0.5"].incarnation += 1000
+    network.run(4)
+    assert network.detectors["10.0.0.1"].state_of("10.0.0.5") == swim.ALIVE
+
+
+def test_swim_suspected_member_refutes_with_higher_incarnation():
+    swim = load_module("swim", "server/swim.py")
+    network = SwimNetwork(swim, ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+    network.run(2)
+    target = network.detectors["10.0.0.2"]
+    incarnation = target.incarnation
+
+    network.detectors["10.0.0.1"].handle(f"SWIM_ACK 0 suspect:10.0.0.2:{incarnation}", ("10.0.0.3", 12346))
+    assert network.detectors["10.0.0.1"].state_of("10.0.0.2") == swim.SUSPECT
+    network.run(2)
+
+    assert target.incarnation == incarnation + 1
+    assert network.detectors["10.0.0.1"].state_of("10.0.0.2") == swim.ALIVE
+    assert ("10.0.0.1", "10.0.0.2", swim.ALIVE) in network.changes
+    assert not any(state == swim.DEAD for _, _, state in network.changes)
+
+
+def test_probe_engine_multiplexes_nonce_tagged_pings_and_tracks_rtt():
+    probe_module = load_module("probe_engine", "server/probe_engine.py")
+    now = [0.0]
+    sent = []
+    engine = probe_module.ProbeEngine(lambda data, address: sent.append((data, address)), clock=lambda: now[0])
+    results = []
+
+    for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+        engine.probe(ip, timeout=0.5, callback=lambda ip, alive, rtt: results.append((ip, alive, rtt)))
+    assert [address for _, address in sent] == [("10.0.0.1", 12346), ("10.0.0.2", 12346), ("10.0.0.3", 12346)]
+    nonces = {address[0]: data.split(b" ")[1] for data, address in sent}
+
+    now[0] = 0.02
+    # A PONG carrying another peer's nonce, or no nonce at all, answers nothing.
+    assert engine.handle(b"PONG " + nonces["10.0.0.1"], ("10.0.0.2", 12346)) is False
+    assert engine.handle(b"PONG", ("10.0.0.1", 12346)) is False
+    assert engine.handle(b"PONG " + nonces["10.0.0.1"], ("10.0.0.1", 12346)) is True
+    now[0] = 0.04
+    engine.handle(b"PONG " + nonces["10.0.0.2"], ("10.0.0.2", 12346))
+    now[0] = 0.6
+    engine.expire()
+
+    assert results == [("10.0.0.1", True, 0.02), ("10.0.0.2", True, 0.04), ("10.0.0.3", False, None)]
+    assert engine.rtt("10.0.0.1")["srtt"] == 0.02
+    assert engine.rtt("10.0.0.3")["lost"] == 1
+    assert engine.timeout_for("10.0.0.2") == 0.04 + 4 * 0.02
+    assert engine.timeout_for("10.0.0.9", default=0.1) == 0.1
+    assert engine.snapshot()["stats"] == {"sent": 3, "answered": 2, "timeouts": 1, "unmatched": 1}
+
+
+def test_probe_engine_probes_many_peers_within_one_timeout():
+    probe_module = load_module("probe_engine", "server/probe_engine.py")
+    alive = {"10.0.0.1", "10.0.0.2"}
+    engine = None
+
+    def send(data, address):
+        if address[0] in alive:
+            # Answer from another thread, as the health-socket reader would.
+            reply = b"PONG" + data[4:]
+            threading.Timer(0.01, engine.handle, (reply, (address[0], 12346))).start()
+
+    engine = probe_module.ProbeEngine(send)
+    started = __import__("time").monotonic()
+    results = engine.probe_many(["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"], timeout=0.2)
+    elapsed = __import__("time").monotonic() - started
+
+    assert results == {"10.0.0.1": True, "10.0.0.2": True, "10.0.0.3": False, "10.0.0.4": False}
+    assert elapsed < 0.35
+    assert engine.pending == {}
+
+
+def test_server_health_port_echoes_probe_nonces(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        server.handle_probe(b"PING 42", ("127.0.0.2", 12346))
+        server.handle_probe(b"PING", ("127.0.0.3", 40000))
+        assert DummySocket.sent == [(b"PONG 42", ("127.0.0.2", 12346)), (b"PONG", ("127.0.0.3", 40000))]
+
+        nonce = server.probe_engine.probe("127.0.0.2:12345", callback=lambda *args: None)
+        assert DummySocket.sent[-1] == (f"PING {nonce}".encode(), ("127.0.0.2", 12346))
+        server.handle_probe(f"PONG {nonce}".encode(), ("127.0.0.2", 12346))
+        assert server.status_payload()["probes"]["peers"]["127.0.0.2:12345"]["samples"] == 1
+    finally:
+        teardown_server(server)
+
+
+def test_server_places_replicas_deterministically_without_network_traffic(monkeypatch):
+    monkeypatch.setattr(server_module, "FAIL_TOLERANCE", 3)
+    monkeypatch.setattr(server_module, "REPLICA_RING_SPAN", 3)
+    server = build_server(monkeypatch)
+    try:
+        swim = server_module.swim
+        server.successors = ["127.0.0.2:12345", "127.0.0.3:12345", "127.0.0.4:12345", "127.0.0.5:12345"]
+        others = ["127.0.0.6:12345", "127.0.0.7:12345", "127.0.0.8:12345"]
+        server.failure_detector.add_members([*server.successors, *others, "127.0.0.10:12345"])
+        server.failure_detector.members["127.0.0.3:12345"].state = swim.SUSPECT
+        off_ring = min(
+            others,
+            key=lambda ip: server_module.hashlib.sha256(f"127.0.0.10:12345|{ip}".encode()).digest(),
+        )
+
+        placement = server.replica_placement()
+
+        # Live successors up to the ring span, then one copy off the successor chain.
+        assert placement == ["127.0.0.2:12345", "127.0.0.4:12345", "127.0.0.5:12345", off_ring]
+        assert server.replica_placement() == placement
+
+        server.replics = ["127.0.0.2:12345", "127.0.0.9:12345"]
+        monkeypatch.setattr(server.probe_engine, "probe_many", lambda ips, timeout=0.1: {ip: True for ip in ips})
+        monkeypatch.setattr(server, "sync_replicas", lambda replics: None)
+        server.replics_manager_tick()
+        # The old replica keeps its copy until the new placement has acknowledged one.
+        assert server.replics == [*placement, "127.0.0.9:12345"]
+        assert DummySocket.sent == []
+
+        server.replica_watermarks = {replic: 0 for replic in placement}
+        server.replics_manager_tick()
+        assert server.replics == placement
+        assert DummySocket.sent == [(b"DROP_REPLICS 127.0.0.10:12345", ("127.0.0.9", 12345))]
+    finally:
+        teardown_server(server)
+
+
+def test_server_tells_apart_nodes_sharing_one_host(monkeypatch, tmp_path):
+    monkeypatch.setattr(server_module, "SERVER_PORT", 12351)
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        monkeypatch.setattr(server, "get_ip", lambda: "127.0.0.1")
+        assert server.endpoint() == "127.0.0.1:12351"
+        server.handle_discover("DISCOVER", ("127.0.0.1", 40000))
+        assert DummySocket.sent[-1] == (b"node-test 127.0.0.1:12351", ("127.0.0.1", 40000))
+        assert server.parse_discover_reply("node-b 127.0.0.1:12347", ("127.0.0.1", 12347)) == ("node-b", "127.0.0.1:12347")
+        assert server.parse_discover_reply("legacy", ("10.0.0.4", 12345)) == ("legacy", "10.0.0.4:12345")
+
+        # Two owners on 127.0.0.1 replicate to us from their own command ports.
+        server.handle_replic("REPLIC alice 10.0.0.1 5001 1 pub-a", ("127.0.0.1", 12345))
+        server.handle_replic("REPLIC bob 10.0.0.2 5002 1 pub-b", ("127.0.0.1", 12347))
+        assert server.replicants == ["127.0.0.1:12345", "127.0.0.1:12347"]
+        assert [row[0] for row in server.db_manager.get_replics("127.0.0.1:12347")] == ["bob"]
+        server.handle_drop_replics("DROP_REPLICS 127.0.0.1:12347", ("127.0.0.1", 12347))
+        assert server.replicants == ["127.0.0.1:12345"]
+        assert [row[0] for row in server.db_manager.get_replics("127.0.0.1:12345")] == ["alice"]
+
+        # Probes and SWIM reach each node on its own health port, one above its command port.
+        server.failure_detector.handle("SWIM_PING 1 alive:127.0.0.1:12347:5", ("127.0.0.1", 12348))
+        assert server.failure_detector.snapshot()["members"]["127.0.0.1:12347"] == {"state": "alive", "incarnation": 5}
+        assert DummySocket.sent[-1][1] == ("127.0.0.1", 12348)
+        assert DummySocket.sent[-1][0].startswith(b"SWIM_ACK 1 alive:127.0.0.1:12351:")
+        server.probe_engine.probe("127.0.0.1:12345", callback=lambda *args: None)
+        assert DummySocket.sent[-1][1] == ("127.0.0.1", 12346)
+
+        server.successor = "127.0.0.1:12347"
+        server.notify(server.successor)
+        assert DummySocket.sent[-1] == (b"NOTIFY 0 0 1000000000000000002", ("127.0.0.1", 12347))
+    finally:
+        teardown_server(server)
+
+
+def test_server_repairs_ring_only_on_confirmed_neighbour_failure(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        server.successor = "127.0.0.2"
+        server.fingers = {0: ("127.0.0.3", 100, 199)}
+
+        server.on_member_change("127.0.0.2", server_module.swim.SUSPECT)
+        server.on_member_change("127.0.0.3", server_module.swim.DEAD)
+        assert DummySocket.sent == []
+        assert server.fingers == {}
+
+        server.successors = ["127.0.0.2", "127.0.0.4"]
+        server.replics = ["127.0.0.2", "127.0.0.4"]
+        server.replica_watermarks = {"127.0.0.2": 3, "127.0.0.4": 5}
+        server.on_member_change("127.0.0.2", server_module.swim.DEAD)
+        assert server.successors == ["127.0.0.4"]
+        assert server.replics == ["127.0.0.4"]
+        assert server.replica_watermarks == {"127.0.0.4": 5}
+        # Repair stays local: one FIX on our own topology lane, nothing on the wire.
+        assert DummySocket.sent == []
+        assert server.dispatcher.queue_depths()["topology"]["queued"] == 1
+    finally:
+        teardown_server(server)
+
+
+def test_server_stabilize_and_notify_repair_only_adjacent_links_by_epoch(monkeypatch):
+    server = build_server(monkeypatch)
+    events = capture_server_events()
+    try:
+        monkeypatch.setattr(server, "peer_failed", lambda ip: ip in ("127.0.0.2:12345", "127.0.0.9:12345"))
+        monkeypatch.setattr(server, "replicants_manager", lambda: None)
+        monkeypatch.setattr(server, "correct_bd", lambda: None)
+        server.lower_bound, server.upper_bound = 200, 999
+        server.handle_pred_change("PRED_CHANGE 127.0.0.2:12345 2", ("127.0.0.1", 40000))
+        server.handle_stabilize("STABILIZE 1 100 199 127.0.0.2:12345", ("127.0.0.2", 40000))
+        assert server.predecessor_range == (100, 199)
+
+        # The dead predecessor was not the head: wait for the node before it instead of claiming [0, 199].
+        server.handle_fix("FIX 2 127.0.0.2:12345", (server.get_ip(), 12345))
+        assert (server.lower_bound, server.predecessor) == (200, "127.0.0.2:12345")
+        assert server.orphaned_at is not None
+
+        server.handle_notify("NOTIFY 3 0 199", ("127.0.0.1", 12345))
+        assert (server.lower_bound, server.predecessor, server.orphaned_at) == (200, "127.0.0.1:12345", None)
+        assert server.ring_epoch == server.predecessor_epoch == 4
+
+        # A concurrent repair from an older epoch and a duplicate FIX are both dropped.
+        server.handle_notify("NOTIFY 2 0 150", ("127.0.0.3", 12345))
+        server.handle_fix("FIX 2 127.0.0.2:12345", (server.get_ip(), 12345))
+        assert server.predecessor == "127.0.0.1:12345"
+        assert "notify_dropped" in events.events and "repair_dropped" in events.events
+
+        DummySocket.sent = []
+        server.handle_stabilize("STABILIZE 1 0 199 127.0.0.1:12345", ("127.0.0.1", 40000))
+        assert DummySocket.sent == [(b"OK 127.0.0.1:12345 200 999 4", ("127.0.0.1", 40000))]
+
+        # Predecessor side: the successor names a dead node, so we NOTIFY it with our range and epoch.
+        server.successor = "127.0.0.4:12345"
+        requests = []
+        monkeypatch.setattr(
+            server, "ring_request", lambda peer, command: requests.append(command) or "OK 127.0.0.9:12345 1000 1999 6"
+        )
+        DummySocket.sent = []
+        server.stabilize_tick()
+        assert requests == ["STABILIZE 4 200 999 127.0.0.10:12345"]
+        assert DummySocket.sent == [(b"NOTIFY 6 200 999", ("127.0.0.4", 12345))]
+    finally:
+        server_module.logger.removeHandler(events)
+        teardown_server(server)
+
+
+def test_server_claims_orphaned_range_when_dead_predecessor_was_head(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        monkeypatch.setattr(server, "peer_failed", lambda ip: True)
+        spread = []
+        monkeypatch.setattr(server, "spread_absorbed_range", lambda lower, upper: spread.append((lower, upper)))
+        server.lower_bound, server.upper_bound = 100, 999
+        server.predecessor = "127.0.0.2"
+        server.predecessor_range = (0, 99)
+
+        server.fix_tape()
+
+        assert (server.lower_bound, server.predecessor, server.ring_epoch) == (0, None, 1)
+        assert spread == [(0, 99)]
+        assert DummySocket.sent == [(b"KILL", ("127.0.0.2", 12345))]
+    finally:
+        teardown_server(server)
+
+
+def test_register_pipeline_never_forks_verification_workers():
+    executor, kind = server_module.register_pipeline.create_cpu_executor("process", 1)
+    try:
+        assert kind == "process"
+        assert executor._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        executor.shutdown()
+
+
+def test_server_reports_public_key_cache_only_from_the_verifying_process(monkeypatch):
+    server = build_server(monkeypatch)
+    pipeline = server.register_pipeline
+    try:
+        # Not started yet: verification runs inline, in this process.
+        assert set(server.crypto_cache_stats()) == {"signatures", "public_keys"}
+        pipeline.running, pipeline.executor_kind = True, "process"
+        assert set(server.crypto_cache_stats()) == {"signatures"}
+        pipeline.executor_kind = "thread"
+        assert set(server.crypto_cache_stats()) == {"signatures", "public_keys"}
+    finally:
+        pipeline.running = False
+        teardown_server(server)
+
+
+def test_register_pipeline_runs_stages_off_the_caller_thread():
+    pipeline_module = server_module.register_pipeline
+    stored = threading.Event()
+    seen = {}
+
+    def store(request, verified):
+        seen["store"] = (threading.current_thread().name, verified)
+        return [request["username"]] if verified else None
+
+    def replicate(request, records):
+        seen["replicate"] = records
+        stored.set()
+
+    pipeline = pipeline_module.RegisterPipeline(
+        verify=lambda public_key, payload, signature: signature == "good",
+        store=store,
+        replicate=replicate,
+        cpu_workers=1,
+        executor_kind="thread",
+    )
+    pipeline.start()
+    try:
+        pipeline.submit({"username": "alice", "public_key": "pub", "payload": "p", "signature": "good"})
+        assert stored.wait(2)
+        snapshot = pipeline.snapshot()
+    finally:
+        pipeline.stop()
+
+    assert seen == {"store": ("flock-register-store", True), "replicate": ["alice"]}
+    assert snapshot["executor"] == "thread"
+    assert [snapshot[stage]["handled"] for stage in ("verify", "store", "replicate")] == [1, 1, 1]
+    assert pipeline.depth() == 0
+
+
+def test_server_register_skips_crypto_for_cached_verifications(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    try:
+        init_db(server, tmp_path)
+        monkeypatch.setattr(server_module.signature_verifier, "available", lambda: True)
+        calls = []
+        monkeypatch.setattr(server.register_pipeline, "verify", lambda *args: calls.append(args) or True)
+
+        for _ in range(2):
+            server.register_user("10.0.0.5", 7000, "alice", "10.0.0.5", 7001, 1, "pub-a", "sig-a")
+
+        assert len(calls) == 1
+        assert server.db_manager.resolve_user("alice")[:2] == ("10.0.0.5", 7001)
+        assert DummySocket.sent[0] == (b"OK User 'alice' in (10.0.0.5:7001) successfully registered", ("10.0.0.5", 7000))
+        assert server.status_payload()["register_pipeline"]["store"]["handled"] == 2
+    finally:
+        teardown_server(server)
+
+
+def test_server_resolve_cache_answers_fills_and_invalidates(monkeypatch, tmp_path):
+    owner = build_server(monkeypatch)
+    entry = build_server(monkeypatch)
+    try:
+        init_db(owner, tmp_path)
+        owner.db_manager.register_user("alice", "10.0.0.2", 7001, public_key="pub-a", version=3)
+        owner.resolve_user("10.0.0.5", 7000, "alice", hops=2, request_id="r1", previous_hop="127.0.0.30:12347")
+        owner.resolve_user("10.0.0.5", 7000, "ghost", hops=1, request_id="r2", previous_hop="127.0.0.20:12345")
+
+        fills = {(data, address) for data, address in DummySocket.sent if data.startswith(b"RESOLVED")}
+        assert fills == {
+            (b"RESOLVED r1 alice 10.0.0.2 7001 3 pub-a", ("127.0.0.30", 12347)),
+            (b"RESOLVED r2 ghost 404", ("127.0.0.20", 12345)),
+        }
+
+        entry.lower_bound = entry.upper_bound = 0
+        entry.successor = "127.0.0.9:12345"
+        for username in ("alice", "ghost"):
+            entry.resolve_user("10.0.0.5", 7000, username)
+        ids = {
+            data.decode().split(" ")[3]: data.decode().split(" ")[5]
+            for data, _ in DummySocket.sent
+            if data.startswith(b"RESOLVE ")
+        }
+        DummySocket.sent = []
+        entry.handle_resolved(f"RESOLVED {ids['alice']} alice 10.0.0.2 7001 3 pub-a", ("127.0.0.9", 12345))
+        entry.handle_resolved(f"RESOLVED {ids['ghost']} ghost 404", ("127.0.0.9", 12345))
+        entry.resolve_user("10.0.0.5", 7000, "alice")
+        entry.resolve_user("10.0.0.5", 7000, "ghost")
+        assert DummySocket.sent == [
+            (b"OK 10.0.0.2 7001 pub-a 3", ("10.0.0.5", 7000)),
+            (b"ERROR 404 User not found", ("10.0.0.5", 7000)),
+        ]
+
+        entry.invalidate_resolution("alice", 4)
+        DummySocket.sent = []
+        entry.resolve_user("10.0.0.5", 7000, "alice")
+        [(forward, address)] = DummySocket.sent
+        assert address == ("127.0.0.9", 12345)
+        assert forward.decode().rsplit(" ", 1)[0] == "RESOLVE 10.0.0.5 7000 alice 1"
+        assert entry.status_payload()["resolve_cache"]["records"]["hits"] == 1
+    finally:
+        teardown_server(owner)
+        teardown_server(entry)
+
+
+def test_server_only_trusts_resolve_fills_it_asked_for(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        server.lower_bound = server.upper_bound = 0
+        server.successor = "127.0.0.9:12345"
+        server.resolve_user("10.0.0.5", 7000, "alice", hops=1, request_id="up", previous_hop="127.0.0.30:12347")
+        [(forward, _)] = DummySocket.sent
+        request_id = forward.decode().split(" ")[5]
+        DummySocket.sent = []
+
+        # Nobody asked, wrong sender, wrong username: all dropped.
+        server.handle_resolved("RESOLVED guess alice 6.6.6.6 6666 9 evil", ("127.0.0.9", 12345))
+        server.handle_resolved(f"RESOLVED {request_id} alice 6.6.6.6 6666 9 evil", ("127.0.0.66", 12345))
+        server.handle_resolved(f"RESOLVED {request_id} mallory 6.6.6.6 6666 9 evil", ("127.0.0.9", 12345))
+        assert server.cached_resolution("alice") is None
+        assert server.cached_resolution("mallory") is None
+
+        server.handle_resolved(f"RESOLVED {request_id} alice 10.0.0.2 7001 3 pub-a", ("127.0.0.9", 12345))
+        assert server.cached_resolution("alice") == (True, ("10.0.0.2", 7001, "pub-a", 3))
+        # The fill travels one hop further back, under the id that hop chose.
+        assert DummySocket.sent == [(b"RESOLVED up alice 10.0.0.2 7001 3 pub-a", ("127.0.0.30", 12347))]
+
+        # A request id is good for one fill only.
+        server.handle_resolved(f"RESOLVED {request_id} alice 6.6.6.6 6666 9 evil", ("127.0.0.9", 12345))
+        assert server.cached_resolution("alice") == (True, ("10.0.0.2", 7001, "pub-a", 3))
+    finally:
+        teardown_server(server)
+
+
+def test_server_accepts_binary_register_frames(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        received = []
+        monkeypatch.setattr(server, "register_user", lambda **payload: received.append(payload))
+        frame = server_module.wire_codec.encode(
+            "REGISTER",
+            {
+                "answer_to_ip": "",
+                "answer_to_port": 0,
+                "username": "alice",
+                "ip": "10.0.0.5",
+                "port": 7001,
+                "version": 2,
+                "public_key": b"pem-bytes",
+                "signature": b"sig-bytes",
+            },
+            request_id=9,
+            username_hash=server.rolling_hash("alice"),
+        )
+
+        assert server.receive_command(frame, ("10.0.0.5", 40000)) == "queued"
+        assert server.receive_command(frame[:-1], ("10.0.0.5", 40000)) == "unknown"
+        _, message, address = server.dispatcher.lanes["REGISTER"]["queue"].popleft()
+        server.handle_register(message, address)
+
+        assert received == [{
+            "answer_to_ip": "10.0.0.5",
+            "answer_to_port": 40000,
+            "username": "alice",
+            "ip": "10.0.0.5",
+            "port": 7001,
+            "version": 2,
+            "public_key": "cGVtLWJ5dGVz",
+            "signature": "c2lnLWJ5dGVz",
+            "username_hash": server.rolling_hash("alice"),
+            "request_id": 9,
+        }]
+    finally:
+        teardown_server(server)
+
+
+def test_server_rejects_binary_register_with_wrong_username_hash(monkeypatch):
+    server = build_server(monkeypatch)
+    try:
+        server.register_user("10.0.0.5", 7000, "alice", "10.0.0.5", 7001, 2, "pub-a", "sig-a", username_hash=5, request_id=1)
+        server.handle_wire("WIRE 1 2", ("10.0.0.5", 7000))
+
+        assert DummySocket.sent == [
+            (b"ERROR Invalid registration payload", ("10.0.0.5", 7000)),
+            (b"OK WIRE 1", ("10.0.0.5", 7000)),
+        ]
+    finally:
+        teardown_server(server)
+
+
+def test_server_answers_binary_resolve_frames(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        server.lower_bound = 0
+        server.upper_bound = 0
+        with server.db_lock:
+            server.db_manager.register_user("alice", "10.0.0.1", 5001, public_key="pub-a", version=1)
+        resolved = []
+        resolve_user = server.resolve_user
+
+        def record_resolve(*args, **kwargs):
+            resolved.append(kwargs)
+            resolve_user(*args, **kwargs)
+
+        monkeypatch.setattr(server, "resolve_user", record_resolve)
+
+        def frame(username_hash):
+            return server_module.wire_codec.encode(
+                "RESOLVE",
+                {"answer_to_ip": "", "answer_to_port": 0, "username": "alice", "hops": 0},
+                request_id=7,
+                username_hash=username_hash,
+            )
+
+        assert server.receive_command(frame(server.rolling_hash("alice")), ("10.0.0.5", 40000)) == "queued"
+        _, message, address = server.dispatcher.lanes["RESOLVE"]["queue"].popleft()
+        server.handle_resolve(message, address)
+        server.handle_resolve(server_module.wire_codec.decode(frame(5)), ("10.0.0.5", 40000))
+
+        assert [kwargs["request_id"] for kwargs in resolved] == [7, 7]
+        assert [kwargs["username_hash"] for kwargs in resolved] == [server.rolling_hash("alice"), 5]
+        assert DummySocket.sent == [
+            (b"OK 10.0.0.1 5001 pub-a 1", ("10.0.0.5", 40000)),
+            (b"ERROR Invalid resolve payload", ("10.0.0.5", 40000)),
+        ]
+    finally:
+        teardown_server(server)
+
+
+def test_async_engine_serves_commands_and_pings_until_server_stops(monkeypatch, tmp_path):
+    udp_socket = socket.socket
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    # asyncio builds its self-pipe from socket.socket, so the real class has to be back.
+    monkeypatch.setattr(server_module.socket, "socket", udp_socket)
+    for tick in (
+        "membership_tick",
+        "stabilize_tick",
+        "advertise_successors",
+        "replics_manager_tick",
+        "fix_fingers_tick",
+        "anti_entropy_tick",
+        "vnode_tick",
+    ):
+        monkeypatch.setattr(server, tick, lambda: None)
+
+    def no_multicast():
+        raise OSError("multicast disabled in tests")
+
+    monkeypatch.setattr(server, "open_multicast_socket", no_multicast)
+    server.command_socket = udp_socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.command_socket.bind(("127.0.0.1", 0))
+    server.ping_socket = udp_socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.ping_socket.bind(("127.0.0.1", 0))
+    command_address = server.command_socket.getsockname()
+    health_address = server.ping_socket.getsockname()
+
+    engine = threading.Thread(target=server_module.async_engine.run, args=(server, server_module.logger), daemon=True)
+    engine.start()
+    client = udp_socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(2)
+    try:
+        deadline = time.monotonic() + 2
+        while not isinstance(server.command_socket, server_module.async_engine.TransportSocket):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        # RANGE is answered on the loop thread, RESOLVE from a dispatcher worker.
+        client.sendto(b"RANGE", command_address)
+        assert client.recvfrom(65535)[0].startswith(b"OK ")
+        client.sendto(b"RESOLVE ghost", command_address)
+        assert client.recvfrom(65535)[0] == b"ERROR 404 User not found"
+        client.sendto(b"PING 7", health_address)
+        assert client.recvfrom(65535)[0] == b"PONG 7"
+
+        server.running = False
+        engine.join(timeout=3)
+        assert not engine.is_alive()
+        assert server.dispatcher.running is False
+        # The health transport is closed, so nothing answers any more.
+        client.sendto(b"PING 8", health_address)
+        client.settimeout(0.2)
+        try:
+            reply = client.recvfrom(65535)
+        except OSError:
+            reply = None
+        assert reply is None
+    finally:
+        server.running = False
+        engine.join(timeout=3)
+        client.close()
+
+
+def test_server_dispatcher_answers_busy_when_lane_queue_is_full(monkeypatch):
+    server = build_server(monkeypatch)
+    sent = []
+    monkeypatch.setattr(server.command_socket, "sendto", lambda data, address: sent.append((data, address)))
+    try:
+        server.dispatcher.lanes["RESOLVE"]["limit"] = 1
+
+        assert server.dispatch_command("RANGE", ("127.0.0.1", 4000)) == "inline"
+        assert server.dispatcher.handlers["LOAD"][1] == "admin"
+        assert server.dispatch_command("RESOLVE alice", ("127.0.0.1", 4000)) == "queued"
+        assert server.dispatch_command("RESOLVE bob", ("127.0.0.1", 4001)) == "busy"
+        assert server.dispatch_command("NOPE", ("127.0.0.1", 4002)) == "unknown"
+
+        assert sent[0][0].startswith(b"OK ")
+        assert sent[1] == (b"BUSY RESOLVE", ("127.0.0.1", 4001))
+        assert server.dispatcher.queue_depths()["RESOLVE"] == {"queued": 1, "active": 0, "handled": 0, "rejected": 1}
+
+        server.dispatcher.lanes["topology"]["limit"] = 1
+        assert server.dispatch_command("SUCC 2", ("127.0.0.1", 4003)) == "queued"
+        assert server.dispatch_command("SUCC 2", ("127.0.0.1", 4004)) == "busy"
+        server.schedule_repair("127.0.0.20:12345")
+        assert server.dispatcher.queue_depths()["topology"]["queued"] == 2
+        assert server.dispatcher.lanes["topology"]["queue"][-1][1].endswith(" 127.0.0.20:12345")
+    finally:
+        teardown_server(server)
+
+
+def test_command_dispatcher_workers_drain_queued_commands():
+    dispatcher_module = load_module("test_command_dispatcher", "server/command_dispatcher.py")
+    handled = []
+    done = threading.Event()
+    dispatcher = dispatcher_module.CommandDispatcher(workers=2, queue_size=4)
+
+    def handler(message, address):
+        handled.append(message)
+        if len(handled) == 3:
+            done.set()
+
+    dispatcher.register("FIX", handler, lane="topology", concurrency=1)
+    dispatcher.register("JOIN", handler, lane="topology", concurrency=1)
+    dispatcher.register("RESOLVE", handler)
+    dispatcher.start()
+    try:
+        for message in ("FIX", "JOIN", "RESOLVE alice"):
+            assert dispatcher.dispatch(message, ("127.0.0.1", 1)) == "queued"
+
+        assert done.wait(2)
+        assert sorted(handled) == ["FIX", "JOIN", "RESOLVE alice"]
+    finally:
+        dispatcher.stop()
+
+
+def test_metrics_registry_exports_counters_gauges_and_histograms(tmp_path):
+    metrics_module = load_module("test_metrics", "server/metrics.py")
+    registry = metrics_module.MetricsRegistry()
+    registry.counter("flock_forwards_total", "Forwards.")
+    registry.gauge("flock_queue_depth", "Depth.", callback=lambda: [({"lane": "admin"}, 2)])
+    registry.histogram("flock_command_seconds", "Latency.", buckets=(0.01, 0.1))
+
+    registry.inc("flock_forwards_total", verb="RESOLVE", via="finger")
+    registry.inc("flock_forwards_total", 2, verb="RESOLVE", via="finger")
+    for seconds in (0.005, 0.05, 3):
+        registry.observe("flock_command_seconds", seconds, verb="RESOLVE")
+
+    metrics = registry.snapshot()["metrics"]
+    assert metrics["flock_forwards_total"]["series"] == [{"labels": {"verb": "RESOLVE", "via": "finger"}, "value": 3}]
+    assert metrics["flock_queue_depth"]["series"] == [{"labels": {"lane": "admin"}, "value": 2}]
+    latency = metrics["flock_command_seconds"]["series"][0]
+    assert latency["count"] == 3
+    assert latency["buckets"] == {"0.01": 1, "0.1": 2, "+Inf": 3}
+
+    text = registry.prometheus()
+    assert "# TYPE flock_command_seconds histogram" in text
+    assert 'flock_command_seconds_bucket{verb="RESOLVE",le="0.1"} 2' in text
+    assert 'flock_command_seconds_count{verb="RESOLVE"} 3' in text
+    assert 'flock_forwards_total{verb="RESOLVE",via="finger"} 3' in text
+
+    path = tmp_path / "metrics" / "node.prom"
+    registry.write_prometheus(str(path))
+    assert path.read_text(encoding="utf-8") == registry.prometheus()
+
+    released = []
+    lock = metrics_module.TimedLock(lambda waited, held: released.append(held))
+    with lock:
+        with lock:
+            pass
+        assert released == []
+    assert len(released) == 1
+
+
+def test_server_metrics_track_commands_forwards_replication_and_db_time(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        server.lower_bound = 0
+        server.upper_bound = 0
+        server.fingers = {3: ("127.0.0.9", 1, server_module.HASH_MOD - 1)}
+        with server.db_lock:
+            server.db_manager.register_user("alice", "10.0.0.1", 5001, public_key="pub-a", version=1)
+
+        server.dispatch_command("RANGE", ("127.0.0.1", 4000))
+        server.resolve_user("10.0.0.5", 7000, "bob")
+        server.sync_replicas(["127.0.0.20:12345"])
+        DummySocket.sent = []
+        server.dispatch_command("METRICS", ("127.0.0.1", 4001))
+
+        ok, payload = server_module.wire_codec.decode_json_reply(DummySocket.sent[-1][0])
+        metrics = payload["metrics"]
+        assert ok
+        assert [row["labels"] for row in metrics["flock_command_seconds"]["series"]] == [{"verb": "RANGE"}]
+        assert metrics["flock_forwards_total"]["series"] == [{"labels": {"verb": "RESOLVE", "via": "finger"}, "value": 1}]
+        assert metrics["flock_replication_records_total"]["series"] == [{"labels": {"mode": "full_sync"}, "value": 1}]
+        assert metrics["flock_db_seconds"]["series"][0]["count"] >= 2
+        assert {"labels": {"lane": "admin"}, "value": 0} in metrics["flock_queue_depth"]["series"]
+    finally:
+        teardown_server(server)
+
+
+def test_server_profile_command_dumps_sessions_and_ranks_hot_handlers(monkeypatch, tmp_path):
+    monkeypatch.setenv("FLOCK_LOG_DIR", str(tmp_path))
+    server = build_server(monkeypatch)
+    address = ("127.0.0.1", 4000)
+
+    def profile(command):
+        # PROFILE runs on the admin lane, so its reply comes from a worker.
+        sent = len(DummySocket.sent)
+        assert server.dispatch_command(f"PROFILE {command}", address) == "queued"
+        deadline = time.monotonic() + 2
+        while len(DummySocket.sent) == sent:
+            assert time.monotonic() < deadline
+            time.sleep(0.005)
+        return server_module.wire_codec.decode_json_reply(DummySocket.sent[-1][0])
+
+    server.dispatcher.start()
+    try:
+        assert profile("STOP") == (False, {"error": "no profiling session is running"})
+
+        ok, started = profile("START 30 cprofile")
+        assert ok and started["active"] and started["mode"] == "cprofile"
+        for _ in range(3):
+            server.dispatch_command("RANGE", address)
+        ok, report = profile("STOP")
+        assert ok
+        assert report["mode"] == "cprofile" and report["calls"] > 0
+        assert sorted(path.rsplit(".", 1)[1] for path in report["files"]) == ["pstats", "txt"]
+        assert all(os.path.dirname(path) == str(tmp_path / "profiles") for path in report["files"])
+        stats = pstats.Stats(next(path for path in report["files"] if path.endswith(".pstats")))
+        assert [calls for (_, _, name), (calls, *_) in stats.stats.items() if name == "handle_range"] == [3]
+        hot = {row["verb"]: row for row in report["hot_handlers"]}
+        assert hot["RANGE"]["calls"] == 3
+        assert hot["RANGE"]["wait_mean_ms"] is None
+
+        assert profile("START 30 sample")[0]
+        time.sleep(0.05)
+        ok, report = profile("STOP")
+        assert ok and report["samples"] > 0
+        assert sorted(path.rsplit(".", 1)[1] for path in report["files"]) == ["folded", "txt"]
+
+        assert profile("START 30 perf")[0] is False
+    finally:
+        server.dispatcher.stop()
+        if server.profiler.session is not None:
+            server.profiler.stop()
+        teardown_server(server)
+
+
+def test_server_packs_replicas_into_bounded_batches_and_applies_them(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        records = [(f"user_{index:03d}", "10.0.0.1", 5000 + index, "pub", 1) for index in range(40)]
+        monkeypatch.setattr(server_module, "REPLICA_BATCH_BYTES", 400)
+
+        sent = server.replicate_owned_records(records, targets=["127.0.0.20:12345"])
+        frames = [data for data, _ in DummySocket.sent]
+
+        assert sent == 40
+        assert 1 < len(frames) < 40
+        assert all(frame.startswith(b"REPLIC_BATCH ") and len(frame) <= 420 for frame in frames)
+
+        for frame in frames:
+            server.handle_replic_batch(frame.decode(), ("127.0.0.30", 12345))
+
+        assert server.replicants == ["127.0.0.30:12345"]
+        assert server.db_manager.get_replics("127.0.0.30:12345") == [
+            (username, ip, port, public_key, version) for username, ip, port, public_key, version in records
+        ]
+    finally:
+        teardown_server(server)
+
+
+def test_server_replica_sync_ships_only_changes_after_acknowledged_watermark(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        server.db_manager.register_user("alice", "10.0.0.1", 5001, public_key="pub-a", version=1)
+        server.db_manager.register_user("bob", "10.0.0.2", 5002, public_key="pub-b", version=1)
+
+        server.sync_replicas(["127.0.0.20:12345"])
+        full_frame = DummySocket.sent[-1][0].decode()
+        assert full_frame.startswith("REPLIC_BATCH 2 2 0 1\n")
+
+        server.sync_replicas(["127.0.0.20:12345"])
+        assert len(DummySocket.sent) == 1
+
+        # Acks leave from the replica's command socket, whose address is its endpoint.
+        server.handle_replic_ack("REPLIC_ACK 2 0 1", ("127.0.0.20", 40000))
+        assert server.replica_watermarks == {}
+        server.handle_replic_ack("REPLIC_ACK 2 0 1", ("127.0.0.20", 12345))
+        assert server.replica_watermarks == {"127.0.0.20:12345": 2}
+        server.sync_replicas(["127.0.0.20:12345"])
+        assert len(DummySocket.sent) == 1
+
+        server.db_manager.register_user("bob", "10.0.0.9", 5009, public_key="pub-b", version=2)
+        server.sync_replicas(["127.0.0.20:12345"])
+
+        assert DummySocket.sent[-1][0] == b"REPLIC_BATCH 1 3 0 1\nbob 10.0.0.9 5009 2 pub-b"
+    finally:
+        teardown_server(server)
+
+
+def test_server_refreshes_only_written_merkle_buckets(monkeypatch, tmp_path):
+    server = build_server(monkeypatch)
+    init_db(server, tmp_path)
+    try:
+        db = server.db_manager
+        for username in ("alice", "bob", "carol"):
+            db.register_user(username, "10.0.0.1", 5001, public_key=f"pub-{username}", version=1)
+        db.upsert_replic_users([("dave", "10.0.0.2", 5002, "pub-dave", 1)], owner="node-a")
+        db.upsert_replic_users([("erin", "10.0.0.3", 5003, "pub-erin", 1)], owner="node-b")
+        owned = server.merkle_tree("owned")
+        replica_a = server.merkle_tree("replica:node-a")
+        replica_b = server.merkle_tree("replica:node-b")
+
+        list_owned_records = db.list_owned_records
+        list_users_in_range = db.list_users_in_range
+
+        def full_root(scope):
+            records = list_owned_records() if scope == "owned" else db.get_replics(scope.split(":", 1)[1])
+            return server_module.merkle.MerkleTree(records, server.rolling_hash, server_module.HASH_MOD, server_module.MERKLE_BUCKETS).root
+
+        reads = []
+        monkeypatch.setattr(db, "list_owned_records", lambda: reads.append("all") or list_owned_records())
+        monkeypatch.setattr(db, "list_users_in_range", lambda *args: reads.append(args) or list_users_in_range(*args))
+        db.register_user("bob", "10.0.0.9", 5009, public_key="pub-bob", version=2)
+        db.delete_user("carol")
+        db.upsert_replic_users([("fay", "10.0.0.4", 5004, "pub-fay", 1)], owner="node-a")
+
+        assert server.merkle_tree("replica:node-b") is replica_b
+        assert server.merkle_tree("owned") is not owned
+        assert len(reads) == len({owned.bucket_of(server.rolling_hash(name)) for name in ("bob", "carol")})
+        assert "all" not in reads
+        assert server.merkle_tree("owned").root == full_root("owned")
+        assert server.merkle_tree("replica:node-a").root == full_root("replica:node-a") != replica_a.root
+        # A replica that moves to another owner changes both owners' trees.
+        db.upsert_replic_users([("erin", "10.0.0.3", 5003, "pub-erin", 2)], owner="node-a")
+        assert server.merkle_tree("replica:node-b").root == full_root("replica:node-b") == server_module.merkle.EMPTY_DIGEST
+        assert server.merkle_tree("replica:node-a").root == full_root("replica:node-a")
+    finally:
+        teardown_server(server)
+
+
+def test_server_reconciles_only_divergent_merkle_buckets(monkeypatch, tmp_path):
+    owner = build_server(monkeypatch)
+    init_db(owner, tmp_path / "owner")
+    replica = build_server(monkeypatch)
+    init_db(replica, tmp_path / "replica")
+    try:
+        for username, port, version in (("alice", 5001, 1), ("bob", 5002, 2), ("carol", 5003, 1)):
+            owner.db_manager.register_user(username, "10.0.0.1", port, public_key=f"pub-{username}", version=version)
+        replica.db_manager.upsert_replic_users([
+            ("alice", "10.0.0.1", 5001, "pub-alice", 1),
+            ("bob", "10.0.0.1", 5002, "pub-bob", 1),
+            ("dave", "10.0.0.1", 5004, "pub-dave", 1),
+        ], owner="node-owner")
+
+        def ask_owner(peer, command, timeout=1.0):
+            replies = []
+            monkeypatch.setattr(owner, "send_json_response", lambda address, payload, ok=True: replies.append(payload))
+            owner.dispatcher.handlers[command.split(" ", 1)[0]][0](command, ("127.0.0.10", 40000))
+            return json.loads(json.dumps(replies[0]))
+
+        monkeypatch.setattr(replica, "request_json", ask_owner)
+        result = replica.reconcile_replicas("node-owner")
+
+        assert result["buckets"] <= 3
+        assert result["requests"] < owner.merkle_tree("owned").buckets
+        assert (result["applied"], result["deleted"]) == (2, 1)
+        assert replica.db_manager.get_replics("node-owner") == owner.db_manager.list_owned_records()
+        assert replica.merkle_tree("replica:node-owner").root == owner.merkle_tree("owned").root
+        assert replica.reconcile_replicas("node-owner")["requests"] == 1
+
+        tree = owner.merkle_tree("owned")
+        for bucket in (0, 1, tree.buckets // 3, tree.buckets - 1):
+            lower, upper = tree.bucket_bounds(bucket)
+            assert tree.bucket_of(lower) == tree.bucket_of(upper) == bucket
+            assert bucket == 0 or tree.bucket_of(lower - 1) == bucket - 1
+    finally:
+        teardown_server(owner)
+        teardown_server(replica)
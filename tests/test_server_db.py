@@ -1,3 +1,6 @@
+import sqlite3
+import threading
+
 from conftest import load_module
 
 
@@ -77,6 +80,20 @@ def test_server_db_manages_replicas_by_owner(tmp_path):
     assert database.get_replics("node-a") == []
 
 
+def test_server_db_qualifies_legacy_replica_owners_with_the_default_port(tmp_path):
+    database = server_db_manager.server_db()
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+    database.register_replic_user("alice", "10.0.0.1", 6000, public_key="pub-a", version=1, owner="10.0.0.1")
+    database.register_replic_user("bob", "10.0.0.2", 6001, public_key="pub-b", version=1, owner="10.0.0.2:12347")
+
+    database.set_db("node1")
+
+    assert database.get_replics("10.0.0.1") == []
+    assert [row[0] for row in database.get_replics("10.0.0.1:12345")] == ["alice"]
+    assert [row[0] for row in database.get_replics("10.0.0.2:12347")] == ["bob"]
+
+
 def test_server_db_applies_version_rules_to_replicas(tmp_path):
     database = server_db_manager.server_db()
     database.db_directory = str(tmp_path / "server_db")
@@ -88,3 +105,210 @@ def test_server_db_applies_version_rules_to_replicas(tmp_path):
     assert database.register_replic_user("alice", "10.0.0.4", 6003, public_key="pub-a", version=6, owner="node-a") is True
 
     assert database.get_replics("node-a") == [("alice", "10.0.0.4", 6003, "pub-a", 6)]
+
+
+def test_server_db_reuses_one_connection_per_thread_with_configured_pragmas(tmp_path):
+    database = server_db_manager.server_db(synchronous="off", cache_size=-1024, mmap_size=0)
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+
+    first = database._connect()
+    assert database._connect() is first
+    assert first.execute("PRAGMA synchronous").fetchone()[0] == 0
+    assert first.execute("PRAGMA cache_size").fetchone()[0] == -1024
+
+    other = []
+    worker = threading.Thread(target=lambda: other.append(database._connect()))
+    worker.start()
+    worker.join()
+    assert other[0] is not first
+
+    database.close()
+    assert database._connect() is not first
+    assert database.register_user("alice", "127.0.0.1", 5000, public_key="pub-a", version=1) is True
+
+
+def test_server_db_rejects_unknown_synchronous_mode():
+    try:
+        server_db_manager.server_db(synchronous="sometimes")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_server_db_applies_replica_batches_with_version_rules(tmp_path):
+    database = server_db_manager.server_db()
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+    database.register_replic_user("alice", "10.0.0.1", 6000, public_key="pub-a", version=5, owner="node-a")
+
+    results = database.upsert_replic_users([
+        ("alice", "10.0.0.2", 6001, "pub-a", 4),
+        ("bob", "10.0.0.3", 6002, "pub-b", 1),
+    ], owner="node-a")
+
+    assert results == [
+        ("alice", server_db_manager.STALE, False),
+        ("bob", server_db_manager.APPLIED, True),
+    ]
+    assert database.get_replics("node-a") == [
+        ("alice", "10.0.0.1", 6000, "pub-a", 5),
+        ("bob", "10.0.0.3", 6002, "pub-b", 1),
+    ]
+
+
+def test_server_db_tracks_change_sequence_of_owned_records(tmp_path):
+    database = server_db_manager.server_db()
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+
+    assert database.current_change_seq() == 0
+    database.register_user("alice", "127.0.0.1", 5000, public_key="pub-a", version=1)
+    database.register_user("bob", "127.0.0.2", 5001, public_key="pub-b", version=1)
+    database.register_user("alice", "127.0.0.1", 5000, public_key="pub-a", version=1)
+    watermark = database.current_change_seq()
+    database.register_user("alice", "127.0.0.3", 5002, public_key="pub-a", version=2)
+    database.delete_user("bob")
+
+    assert watermark == 2
+    assert database.current_change_seq() == 4
+    assert database.get_changes_since(watermark) == [("alice", "127.0.0.3", 5002, "pub-a", 2)]
+
+
+def test_server_db_answers_range_queries_from_stored_hashes(tmp_path):
+    database = server_db_manager.server_db(hash_function=lambda username: {"alice": 10, "bob": 20, "carol": 30}[username])
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+    for port, username in enumerate(("carol", "alice", "bob")):
+        database.register_user(username, "127.0.0.1", 5000 + port, public_key=f"pub-{username}", version=1)
+
+    assert [row[0] for row in database.list_users_in_range(0, 25)] == ["alice", "bob"]
+    assert [row[0] for row in database.list_users_in_range(0, 100, limit=1, after_hash=10)] == ["bob"]
+    assert database.count_users_in_range(15, 30) == 2
+    assert [row[0] for row in database.get_alien_users(15, 25)] == ["alice", "carol"]
+    assert database.hash_quantile(0, 100, 0.5) == 20
+    assert database.hash_quantile(0, 100, 0.0) == 10
+    assert database.hash_quantile(40, 100, 0.5) is None
+
+    database.upsert_replic_users([
+        ("alice", "127.0.0.2", 6000, "pub-alice", 1),
+        ("bob", "127.0.0.2", 6001, "pub-bob", 1),
+    ], owner="127.0.0.2:12345")
+    database.upsert_replic_users([("carol", "127.0.0.3", 6002, "pub-carol", 1)], owner="127.0.0.3:12345")
+    assert [row[0] for row in database.list_replics_in_range("127.0.0.2:12345", 15, 30)] == ["bob"]
+    assert [row[0] for row in database.list_replics_in_range("127.0.0.3:12345", 0, 100)] == ["carol"]
+
+
+def test_server_db_bulk_moves_owned_ranges_in_one_transaction(tmp_path):
+    hashes = {"alice": 10, "bob": 20, "bea": 20, "carol": 30}
+    database = server_db_manager.server_db(hash_function=hashes.__getitem__)
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+    database.register_user("alice", "127.0.0.1", 5000, public_key="pub-a", version=5)
+
+    results = database.upsert_users([
+        ("alice", "127.0.0.2", 5001, "pub-a", 4),
+        ("bob", "127.0.0.3", 5002, "pub-b", 1),
+        ("bea", "127.0.0.4", 5003, "pub-bea", 1),
+        ("bob", "127.0.0.5", 5004, "pub-b", 2),
+        ("carol", "127.0.0.6", 5005, "pub-c", 1),
+    ])
+    watermark = database.current_change_seq()
+    database.register_user("carol", "127.0.0.7", 5006, public_key="pub-c", version=2)
+
+    assert [resolution for _, resolution, _ in results] == [server_db_manager.STALE] + [server_db_manager.APPLIED] * 4
+    assert database.resolve_user("bob") == ("127.0.0.5", 5004, "pub-b", 2)
+    assert [row[0] for row in database.list_users_in_range(0, 100, after_hash=20, after_username="bea")] == ["bob", "carol"]
+    assert [row[0] for row in database.list_users_in_range(0, 100, changed_after=watermark)] == ["carol"]
+    assert database.delete_users_in_range(15, 25) == 2
+    assert database.resolve_user("bea") is None
+    assert [row[0] for row in database.list_owned_records()] == ["alice", "carol"]
+
+
+def test_server_db_backfills_hash_column_for_legacy_databases(tmp_path):
+    directory = tmp_path / "server_db"
+    directory.mkdir()
+    with sqlite3.connect(directory / "node1.db") as conn:
+        conn.execute(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL UNIQUE, "
+            "ip TEXT NOT NULL, port INTEGER NOT NULL)"
+        )
+        conn.execute("INSERT INTO users (username, ip, port) VALUES ('alice', '127.0.0.1', 5000)")
+
+    database = server_db_manager.server_db()
+    database.db_directory = str(directory)
+    database.set_db("node1")
+
+    alice_hash = server_db_manager.ring_hash("alice")
+    assert database.count_users_in_range(alice_hash, alice_hash) == 1
+
+
+def test_server_db_serves_owned_lookups_from_memory(tmp_path, monkeypatch):
+    database = server_db_manager.server_db()
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+    database.register_user("alice", "127.0.0.1", 5000, public_key="pub-a", version=1)
+    database.register_user("bob", "127.0.0.2", 5001, public_key="pub-b", version=1)
+    database.close()
+
+    database.set_db("node1")
+    monkeypatch.setattr(database, "_select_user", lambda username: (_ for _ in ()).throw(AssertionError(username)))
+
+    assert database.resolve_user("alice") == ("127.0.0.1", 5000, "pub-a", 1)
+    assert database.resolve_user("ghost") is None
+    assert database.upsert_user("alice", "127.0.0.3", 5002, public_key="pub-x", version=1) == (server_db_manager.IDENTITY_CONFLICT, False)
+    assert database.upsert_user("alice", "127.0.0.3", 5002, public_key="pub-a", version=2) == (server_db_manager.APPLIED, True)
+    assert database.get_user_record("alice") == ("alice", "127.0.0.3", 5002, "pub-a", 2)
+    database.delete_user("bob")
+    assert database.resolve_user("bob") is None
+    assert database.record_cache_stats() == {
+        "entries": 1,
+        "capacity": 50000,
+        "complete": True,
+        "hits": 6,
+        "misses": 0,
+        "evictions": 0,
+    }
+
+
+def test_server_db_record_cache_falls_back_to_disk_over_capacity(tmp_path):
+    database = server_db_manager.server_db(record_cache_size=1)
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+    database.register_user("alice", "127.0.0.1", 5000, public_key="pub-a", version=1)
+    database.register_user("bob", "127.0.0.2", 5001, public_key="pub-b", version=1)
+
+    assert database.resolve_user("alice") == ("127.0.0.1", 5000, "pub-a", 1)
+    assert database.resolve_user("ghost") is None
+    stats = database.record_cache_stats()
+    assert (stats["entries"], stats["complete"], stats["misses"]) == (1, False, 2)
+
+
+def test_server_db_rolls_back_a_batch_that_fails_partway_through(tmp_path):
+    database = server_db_manager.server_db(record_cache_size=1)
+    database.db_directory = str(tmp_path / "server_db")
+    database.set_db("node1")
+    database.register_user("alice", "127.0.0.1", 5000, public_key="pub-a", version=1)
+    database.register_user("bob", "127.0.0.1", 5001, public_key="pub-b", version=1)
+
+    # alice was evicted from the one-entry cache, so the batch reads her row from SQLite.
+    try:
+        database.upsert_users([
+            ("alice", "127.0.0.2", 6000, "pub-a", 2),
+            ("bob", "127.0.0.2", 6001, "pub-b", 2),
+            ("carol", "127.0.0.2", 6002, "pub-c", object()),
+        ])
+    except sqlite3.Error:
+        pass
+    else:
+        raise AssertionError("an unbindable version should abort the batch")
+
+    assert database.resolve_user("alice") == ("127.0.0.1", 5000, "pub-a", 1)
+    assert database.resolve_user("bob") == ("127.0.0.1", 5001, "pub-b", 1)
+    assert database.resolve_user("carol") is None
+    with sqlite3.connect(database.db_route) as conn:
+        assert conn.execute("SELECT username, version FROM users ORDER BY username").fetchall() == [
+            ("alice", 1),
+            ("bob", 1),
+        ]
@@ -0,0 +1,54 @@
+import pytest
+
+import shared_wire_codec as wire
+
+
+REGISTER_FIELDS = {
+    "answer_to_ip": "",
+    "answer_to_port": 0,
+    "username": "alice",
+    "ip": "10.0.0.5",
+    "port": 7001,
+    "version": 1_700_000_000_000_000_000,
+    "public_key": b"-----BEGIN PUBLIC KEY-----\n\x00\xff raw",
+    "signature": bytes(range(256)),
+}
+
+
+def test_register_frames_round_trip_with_raw_key_bytes():
+    frame = wire.encode("REGISTER", REGISTER_FIELDS, request_id=42, username_hash=123456789)
+
+    decoded = wire.decode(frame)
+
+    assert wire.is_frame(frame) and not wire.is_frame(b"REGISTER alice")
+    assert decoded == wire.Frame("REGISTER", REGISTER_FIELDS, request_id=42, username_hash=123456789)
+
+
+@pytest.mark.parametrize(
+    "mutate, error",
+    [
+        (lambda frame: frame[:10], "Truncated frame header"),
+        (lambda frame: frame[:1] + b"\x09" + frame[2:], "Unsupported wire version 9"),
+        (lambda frame: frame[:2] + b"\x7f" + frame[3:], "Unknown verb code 127"),
+        (lambda frame: frame[:-1], "Truncated field signature"),
+        (lambda frame: frame + b"\x00", "Trailing bytes after last field"),
+    ],
+)
+def test_malformed_frames_are_rejected(mutate, error):
+    frame = wire.encode("REGISTER", REGISTER_FIELDS)
+
+    with pytest.raises(wire.WireError, match=error):
+        wire.decode(mutate(frame))
+
+
+def test_json_replies_round_trip_plain_and_compressed():
+    payload = {"owned": [{"username": f"user{index}", "hash": "ab" * 32} for index in range(50)], "next": None}
+
+    plain = wire.encode_json_reply(payload)
+    compressed = wire.encode_json_reply(payload, compress=True)
+
+    assert plain.startswith(b"OK ") and compressed.startswith(wire.ZLIB_REPLY)
+    assert len(compressed) < len(plain)
+    assert wire.decode_json_reply(plain) == wire.decode_json_reply(compressed) == (True, payload)
+    assert wire.decode_json_reply(wire.encode_json_reply({"error": "x"}, ok=False, compress=True)) == (False, {"error": "x"})
+    assert wire.decode_json_reply(b"BUSY SNAPSHOT") == (False, "BUSY SNAPSHOT")